@@ -0,0 +1,16 @@
+from app.db.session import AsyncSessionLocal, SessionLocal
+
+
+# Dependency
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Async dependency (asyncpg): DB calls don't block the event loop or occupy threadpool slots
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,32 @@
+import hashlib
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from app.core.storage import storage
+
+
+class _HashingReader:
+    """
+    File wrapper that hashes what is read, so an upload is digested while it streams to storage.
+    """
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+
+def _store(source, key: str, content_type: str = None) -> str:
+    reader = _HashingReader(source)
+    storage.save_stream(key, reader, content_type)
+    return reader.digest.hexdigest()
+
+
+async def save_upload_file(upload: UploadFile, key: str) -> str:
+    """
+    Streams an uploaded file to media storage on the threadpool so the event loop is not blocked.
+    Returns the SHA-256 of the content (same as TryOnCache.hash_file).
+    """
+    return await run_in_threadpool(_store, upload.file, key, upload.content_type)
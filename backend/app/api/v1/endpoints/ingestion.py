@@ -1,34 +1,37 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-import shutil
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+import json
 import os
 import uuid
 from typing import Optional
-from app.worker.tasks import remove_background_task, extract_metadata_task
+from app.worker.tasks import remove_background_task, extract_metadata_task, bulk_ingest_task
 
 router = APIRouter()
 
 UPLOAD_DIR = "media/raw"
 PROCESSED_DIR = "media/processed"
+BULK_DIR = "media/bulk"
+
+# Metadata facets kept in compact listings
+COMPACT_FACETS = ("category", "color", "pattern")
 
 # Ensure directories exist
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DIR, exist_ok=True)
+os.makedirs(BULK_DIR, exist_ok=True)
 
 # Additional imports
 from fastapi import Depends
-from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.deps import get_async_db
+from app.api.files import save_upload_file
 from app.models.garment import Garment
-from app.core.embeddings import embedding_service
-
-
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from app.models.ingestion_job import IngestionJob
+from app.core.embeddings import EmbeddingCache, embedding_service
+from app.core.garment_cache import garment_cache
+from app.core.derivatives import derivative_urls
+from app.core.search import InvalidCursor, asearch_garments
 
 @router.post("/upload")
 async def upload_garment(
@@ -36,7 +39,7 @@ async def upload_garment(
     category: Optional[str] = Form(None),
     color: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Upload a raw garment image with optional manual metadata.
@@ -62,8 +65,7 @@ async def upload_garment(
 
     # Save Uploaded File
     try:
-        with open(raw_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await save_upload_file(file, raw_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not save file: {str(e)}")
 
@@ -75,7 +77,7 @@ async def upload_garment(
     
     # Generate Embedding
     embedding_text = f"{color or ''} {category or ''} {description or ''}".strip()
-    embedding_vector = embedding_service.generate_embedding(embedding_text)
+    embedding_vector = await embedding_service.agenerate_embedding(embedding_text)
 
     # Create DB Record
     garment = Garment(
@@ -86,8 +88,7 @@ async def upload_garment(
         embedding=embedding_vector
     )
     db.add(garment)
-    db.commit()
-    db.refresh(garment)
+    await db.commit()
 
     # Trigger Celery Tasks
     # 1. Background Removal
@@ -107,38 +108,147 @@ async def upload_garment(
         "raw_path": raw_path
     }
 
+@router.post("/bulk")
+async def bulk_upload(
+    archive: Optional[UploadFile] = File(None),
+    manifest: Optional[UploadFile] = File(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Bulk catalog import. Send exactly one of:
+    - `archive`: a zip or tar(.gz) of garment images.
+    - `manifest`: a text file with one local path (or JSON object with `path` and
+      optional `category`, `color`, `description`) per line.
+    The source is streamed to disk and processed by a background job.
+    Returns the job ID; progress is reported by GET /ingestion/bulk/{job_id}.
+    """
+    if (archive is None) == (manifest is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'archive' or 'manifest'.")
+
+    job_uuid = uuid.uuid4()
+    source = "archive" if archive is not None else "manifest"
+    upload = archive or manifest
+    source_path = os.path.join(BULK_DIR, f"{job_uuid}_{source}").replace("\\", "/")
+
+    try:
+        await save_upload_file(upload, source_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not save file: {str(e)}")
+
+    job = IngestionJob(id=job_uuid, source=source, source_path=source_path, status="pending")
+    db.add(job)
+    await db.commit()
+
+    task = bulk_ingest_task.delay(str(job_uuid))
+
+    return {
+        "message": "Bulk ingestion started",
+        "job_id": str(job_uuid),
+        "task_id": task.id
+    }
+
+@router.get("/bulk/{job_id}")
+async def get_bulk_status(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Job-level progress for a bulk import.
+    """
+    try:
+        job_uuid = uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+
+    job = await db.get(IngestionJob, job_uuid)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "job_id": str(job.id),
+        "source": job.source,
+        "status": job.status,
+        "error": job.error,
+        "total": job.total,
+        "inserted": job.inserted,
+        "processed": job.processed,
+        "failed": job.failed,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at
+    }
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Weak comparison (RFC 9110), as used for If-None-Match
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in tags]
+
+def _listing_headers(etag: str) -> dict:
+    # no-cache: browsers keep the body but revalidate (If-None-Match) on every fetch
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def _listing_item(row, compact: bool) -> dict:
+    # Normalize path for frontend (remove backslashes if any lingering, though we fixed ingestion)
+    image = row.processed_image_path.replace("\\", "/")
+    # WebP/AVIF renditions written by the worker before the garment became visible
+    derivatives = derivative_urls(image)
+    if compact:
+        metadata = row.metadata_json or {}
+        thumbnail = next(iter(derivatives["thumb"].values()), image) if derivatives else image
+        return {"id": str(row.id), "thumbnail": thumbnail, **{facet: metadata.get(facet) for facet in COMPACT_FACETS}}
+    return {"id": str(row.id), "image": image, "derivatives": derivatives, "metadata": row.metadata_json}
+
 @router.get("/garments")
-def list_garments(query: Optional[str] = None, db: Session = Depends(get_db)):
+async def list_garments(
+    request: Request,
+    query: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    compact: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    List all fully processed garments.
-    Optional 'query' parameter filters by metadata (category, color, description, tags).
+    List fully processed garments, newest first, one page at a time.
+    - `query`: rank by semantic similarity to the text instead (category, color, description, tags).
+    - `cursor`: `next_cursor` of the previous page (keyset on created_at, id).
+    - `compact`: items carry only id, thumbnail and the category / color / pattern facets.
+    Responses carry an ETag: send it back as If-None-Match to get a 304 while the catalog is unchanged.
     """
-    garments = db.query(Garment).filter(Garment.processed_image_path.isnot(None)).order_by(Garment.created_at.desc()).all()
-    
-    # Filter in Python for flexibility with the unstructured JSONB
+    query = EmbeddingCache.normalize(query) if query else None
+    listing_key = json.dumps({"q": query, "limit": limit, "cursor": cursor, "compact": compact}, sort_keys=True)
+    # Bumped by the workers whenever a garment's path or metadata changes
+    version = await run_in_threadpool(garment_cache.catalog_version)
+    if version is not None:
+        etag = garment_cache.listing_etag(version, listing_key)
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=_listing_headers(etag))
+        body = garment_cache.get_listing(version, listing_key)
+        if body is not None:
+            return JSONResponse(body, headers=_listing_headers(etag))
+
+    cacheable = True
+    embedding_query = None
+    # Semantic Search via PGVector (cosine distance over the HNSW index)
     if query:
-        # Proposed: Semantic Search via PGVector
-        embedding_query = embedding_service.generate_embedding(query)
-        if embedding_query:
-            # L2 Distance Sort (Similarity)
-            garments = db.query(Garment).filter(
-                Garment.processed_image_path.isnot(None)
-            ).order_by(
-                Garment.embedding.l2_distance(embedding_query)
-            ).limit(20).all()
-        else:
-           # Fallback to text search if embedding fails
-           pass
-    
-    return [
-        {
-            "id": str(g.id),
-            # Normalize path for frontend (remove backslashes if any lingering, though we fixed ingestion)
-            "image": g.processed_image_path.replace("\\", "/"), 
-            "metadata": g.metadata_json
-        }
-        for g in garments
-    ]
+        embedding_query = await embedding_service.agenerate_embedding(query)
+        if embedding_query is None:
+            # Fallback to plain listing if embedding fails (not cached under this query)
+            cacheable = False
+            cursor = None
+
+    # Projection: only id, path, metadata and created_at are read, never the embedding
+    try:
+        rows, next_cursor = await asearch_garments(db, embedding=embedding_query, limit=limit, cursor=cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    body = {"items": [_listing_item(row, compact) for row in rows], "next_cursor": next_cursor}
+
+    if version is not None and cacheable:
+        garment_cache.put_listing(version, listing_key, body)
+    else:
+        etag = garment_cache.listing_etag(None, listing_key, body)
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=_listing_headers(etag))
+    return JSONResponse(body, headers=_listing_headers(etag))
 
 @router.get("/status/{task_id}")
 def get_task_status(task_id: str):
@@ -1,7 +1,64 @@
-from fastapi import APIRouter
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.deps import get_async_db
+from app.core.embeddings import embedding_service
+from app.core.search import asearch_garments, InvalidCursor
 
 router = APIRouter()
 
 @router.get("/")
-def get_search():
-    return {"message": "Search endpoint"}
+async def search(
+    q: Optional[str] = None,
+    filters: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Hybrid garment search.
+    - `q`: free text, ranked by cosine similarity to the garment embeddings.
+    - `filters`: JSON object of metadata facets, e.g. {"color": "red", "category": "dress"}.
+    - `cursor`: `next_cursor` from the previous page.
+    """
+    facet_filters = None
+    if filters:
+        try:
+            facet_filters = json.loads(filters)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="filters must be a JSON object")
+        if not isinstance(facet_filters, dict):
+            raise HTTPException(status_code=400, detail="filters must be a JSON object")
+
+    # Concurrent queries are micro-batched into one encode call
+    embedding = await embedding_service.agenerate_embedding(q) if q else None
+    if q and embedding is None:
+        raise HTTPException(status_code=503, detail="Embedding model unavailable")
+
+    try:
+        rows, next_cursor = await asearch_garments(
+            db, embedding=embedding, filters=facet_filters, limit=limit, cursor=cursor
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "items": [
+            {
+                "id": str(row.id),
+                "image": row.processed_image_path.replace("\\", "/"),
+                "metadata": row.metadata_json,
+                "score": (1.0 - row.distance) if embedding is not None else None
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor
+    }
+
+@router.get("/cache")
+def get_embedding_cache_stats():
+    """
+    Query embedding cache hit rate and size for this API process.
+    """
+    return embedding_service.cache.stats()
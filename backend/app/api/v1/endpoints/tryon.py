@@ -1,9 +1,19 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-import shutil
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+import json
 import os
 import uuid
-from app.worker.vton_tasks import virtual_tryon_task
+from typing import Optional
+from app.worker.vton_tasks import virtual_tryon_task, virtual_tryon_batch_task
 from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.api.files import save_upload_file
+from app.core.progress import TERMINAL_STATUSES, stream_progress
+from app.core.tryon_cache import tryon_cache
+from app.core.derivatives import derivative_urls
+from app.core.storage import storage
+from app.core.inference_profiles import PROFILES, UnknownProfile, get_profile
 
 router = APIRouter()
 
@@ -13,41 +23,124 @@ RESULTS_DIR = "media/results"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
+async def _enqueue_tryon(person_path: str, person_hash: str, garment_id: str, profile: str):
+    """
+    Enqueues one try-on render, or reuses an identical finished / in-flight one.
+    Returns (response fields, whether a new task now owns person_path).
+    """
+    task_id = str(uuid.uuid4())
+    output_path = os.path.join(RESULTS_DIR, f"{task_id}_tryon.png").replace("\\", "/")
+
+    # Dedup: identical person image + garment + generation params reuse the earlier result
+    cache_key = None
+    if person_hash:
+        cache_key = tryon_cache.key_for(person_hash, garment_id, profile)
+
+        cached_path = await run_in_threadpool(tryon_cache.get_result, cache_key)
+        if cached_path:
+            return {
+                "status": "completed",
+                "result_path": cached_path,
+                "derivatives": derivative_urls(cached_path),
+                "profile": profile
+            }, False
+
+        # Join an identical try-on that is already queued or running
+        running_task_id = await run_in_threadpool(tryon_cache.claim, cache_key, task_id)
+        if running_task_id:
+            return {
+                "task_id": running_task_id,
+                "result_path_placeholder": output_path.replace(task_id, running_task_id),
+                "profile": profile
+            }, False
+
+    # Trigger Task (coalesced with other queued try-ons when batching is enabled)
+    task_fn = virtual_tryon_batch_task if settings.VTON_BATCH_SIZE > 1 else virtual_tryon_task
+    try:
+        # Blocking broker publish: keep it off the event loop
+        task = await run_in_threadpool(
+            task_fn.apply_async,
+            args=(person_path, garment_id, output_path),
+            kwargs={"cache_key": cache_key, "profile": profile},
+            task_id=task_id
+        )
+    except Exception as e:
+        if cache_key:
+            await run_in_threadpool(tryon_cache.release, cache_key, task_id)
+        raise HTTPException(status_code=503, detail=f"Could not queue try-on: {str(e)}")
+    return {"task_id": task.id, "result_path_placeholder": output_path, "profile": profile}, True
+
 @router.post("/")
 async def tryon(
     person_image: UploadFile = File(...),
-    garment_id: str = Form(...)
+    garment_id: str = Form(...),
+    profile: Optional[str] = Form(None),
+    refine: bool = Form(False)
 ):
     """
     Trigger a Virtual Try-On task.
+    - `profile`: inference profile (fast / balanced / quality), defaults to VTON_INFERENCE_PROFILE.
+    - `refine`: also queue a VTON_REFINE_PROFILE re-render, returned as `refine`
+      (e.g. profile=fast for a quick preview, then the quality result).
     """
     if person_image.content_type not in ["image/jpeg", "image/png", "image/webp"]:
          raise HTTPException(status_code=400, detail="Invalid image type")
 
+    try:
+        profile = get_profile(profile).name
+    except UnknownProfile as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    refine_profile = settings.VTON_REFINE_PROFILE if refine and settings.VTON_REFINE_PROFILE != profile else None
+
     # Save Person Image
-    task_uuid = uuid.uuid4()
-    task_id = str(task_uuid)
+    upload_id = str(uuid.uuid4())
     ext = person_image.filename.split(".")[-1]
     
-    person_filename = f"{task_id}_person.{ext}"
+    person_filename = f"{upload_id}_person.{ext}"
     person_path = os.path.join(UPLOAD_DIR, person_filename).replace("\\", "/")
-    
-    output_filename = f"{task_id}_tryon.png"
-    output_path = os.path.join(RESULTS_DIR, output_filename).replace("\\", "/")
 
     try:
-        with open(person_path, "wb") as buffer:
-            shutil.copyfileobj(person_image.file, buffer)
+        # Hashed while streaming to storage (dedup key)
+        person_sha256 = await save_upload_file(person_image, person_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not save file: {str(e)}")
 
-    # Trigger Task
-    task = virtual_tryon_task.delay(person_path, garment_id, output_path)
+    person_hash = person_sha256 if tryon_cache.enabled else None
+
+    try:
+        response, queued = await _enqueue_tryon(person_path, person_hash, garment_id, profile)
+    except HTTPException:
+        await run_in_threadpool(storage.delete, person_path)
+        raise
+    if refine_profile:
+        try:
+            response["refine"], refine_queued = await _enqueue_tryon(person_path, person_hash, garment_id, refine_profile)
+            queued = queued or refine_queued
+        except HTTPException as e:
+            # The main render is still valid: report the refine failure alongside it
+            response["refine"] = {"status": "failed", "error": e.detail, "profile": refine_profile}
+
+    if not queued:
+        # Every render was already available or in flight: the upload is not needed
+        await run_in_threadpool(storage.delete, person_path)
 
+    if response.get("status") == "completed":
+        response["message"] = "Try-On result reused"
+    elif queued:
+        response["message"] = "Try-On process started"
+    else:
+        response["message"] = "Try-On already in progress"
+    return response
+
+@router.get("/profiles")
+def list_profiles():
+    """
+    Available inference profiles and the configured defaults.
+    """
     return {
-        "message": "Try-On process started",
-        "task_id": task.id,
-        "result_path_placeholder": output_path
+        "default": settings.VTON_INFERENCE_PROFILE,
+        "refine": settings.VTON_REFINE_PROFILE,
+        "profiles": [profile.cache_params() for profile in PROFILES.values()]
     }
 
 @router.get("/status/{task_id}")
@@ -58,3 +151,43 @@ def get_tryon_status(task_id: str):
         "status": task_result.status,
         "result": task_result.result
     }
+
+def _celery_terminal_event(task_id: str):
+    """
+    Fallback for tasks that ended without a progress event (e.g. worker crash).
+    """
+    task_result = celery_app.AsyncResult(task_id)
+    if task_result.state == "SUCCESS":
+        result = task_result.result if isinstance(task_result.result, dict) else {"status": "completed"}
+        return {"task_id": task_id, "status": result.get("status", "completed"), "result": result}
+    if task_result.state == "FAILURE":
+        return {"task_id": task_id, "status": "failed", "result": {"status": "failed", "error": str(task_result.result)}}
+    return None
+
+@router.get("/stream/{task_id}")
+async def stream_tryon_status(task_id: str, request: Request):
+    """
+    Server-Sent Events stream of try-on progress.
+    Events: started, running (stage + diffusion step), then completed / failed (with result),
+    or timeout when nothing was heard from the task for too long.
+    Replaces polling /status/{task_id}: the client holds one connection fed by Redis pub/sub.
+    """
+    async def event_source():
+        async for event in stream_progress(task_id):
+            if await request.is_disconnected():
+                return
+            if event is None:
+                # Idle: check the result backend once in case the worker died silently
+                event = await run_in_threadpool(_celery_terminal_event, task_id)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+            yield f"data: {json.dumps(event)}\n\n"
+            if event.get("status") in TERMINAL_STATUSES:
+                return
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -10,8 +10,13 @@ celery_app = Celery(
 
 celery_app.conf.task_routes = {
     "app.worker.tasks.remove_background_task": "gpu-worker",
+    "app.worker.tasks.remove_background_batch_task": "gpu-worker",
     "app.worker.tasks.extract_metadata_task": "cpu-worker",
+    "app.worker.tasks.bulk_ingest_task": "cpu-worker",
+    "app.worker.tasks.bulk_ingest_chunk_done_task": "cpu-worker",
     "app.worker.tasks.virtual_tryon_task": "gpu-worker",
+    "app.worker.tasks.virtual_tryon_batch_task": "gpu-batch",  # Own queue: its worker prefetches whole batches
+    "app.worker.tasks.compute_garment_embeds_task": "gpu-worker",
 }
 
 celery_app.conf.update(
@@ -23,12 +28,70 @@ celery_app.conf.update(
     task_queues={
         "gpu-worker": {"exchange": "gpu-worker", "routing_key": "gpu-worker"},
         "cpu-worker": {"exchange": "cpu-worker", "routing_key": "cpu-worker"},
+        "gpu-batch": {"exchange": "gpu-batch", "routing_key": "gpu-batch"},
     },
     # Config for Long-Running Tasks (VTON ~15 mins)
     broker_heartbeat=0,              # Disable heartbeat to prevent timeouts during blocking inference
     broker_connection_timeout=3600,  # Allow long connection survival
-    worker_prefetch_multiplier=1,    # One task at a time (don't hoard)
+    # One task at a time (don't hoard); the gpu-batch worker raises it for batching (see below)
+    worker_prefetch_multiplier=1,
     task_acks_late=True,             # Ack only after task is done
     task_track_started=True,         # Track 'STARTED' state
     task_reject_on_worker_lost=True  # Re-queue if worker hard crashes
 )
+
+from celery.signals import celeryd_init
+
+@celeryd_init.connect
+def _configure_batching_prefetch(conf=None, options=None, **kwargs):
+    """
+    A worker consuming only gpu-batch (`-Q gpu-batch`, batched try-ons) prefetches a full batch.
+    Every other worker keeps a multiplier of 1, so long rembg / encoder / CPU tasks are not hoarded.
+    An explicit --prefetch-multiplier always wins.
+    """
+    options = options or {}
+    queues = options.get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    queues = {q.strip() for q in queues if q.strip()}
+    if queues == {"gpu-batch"} and not options.get("prefetch_multiplier"):
+        conf.worker_prefetch_multiplier = max(1, settings.VTON_BATCH_SIZE)
+
+# Metrics: task durations, memory high-water marks and a /metrics endpoint per worker
+import time
+from celery.signals import task_prerun, task_postrun, worker_init, worker_process_init, worker_process_shutdown
+from app.core import metrics
+
+_task_started = {}
+
+def _is_prefork(worker) -> bool:
+    # pool_cls is still the configured name ("prefork") or already the resolved TaskPool class
+    pool_cls = getattr(worker, "pool_cls", None) or celery_app.conf.worker_pool
+    name = pool_cls if isinstance(pool_cls, str) else f"{pool_cls.__module__}.{pool_cls.__name__}"
+    return "prefork" in name or name == "processes"
+
+@worker_init.connect
+def _start_metrics_server(sender=None, **kwargs):
+    # Runs in the parent: prefork children record into PROMETHEUS_MULTIPROC_DIR, read back by the server
+    metrics.start_worker_metrics_server(prefork=_is_prefork(sender))
+
+@worker_process_init.connect
+def _reset_db_pool(**kwargs):
+    # Prefork children must not reuse connections inherited from the parent
+    from app.db.session import worker_engine
+    worker_engine.dispose(close=False)
+
+@worker_process_shutdown.connect
+def _mark_metrics_process_dead(pid=None, **kwargs):
+    metrics.mark_process_dead(pid)
+
+@task_prerun.connect
+def _task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None and settings.METRICS_ENABLED:
+        metrics.TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+    metrics.record_memory_high_water(task.name if task is not None else None)
@@ -13,6 +13,16 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = "vton"
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
 
+    # Connection Pools (per process; the API and workers size theirs separately)
+    DB_API_POOL_SIZE: int = 10                  # API: async pool (and the sync pool of threadpool endpoints)
+    DB_API_MAX_OVERFLOW: int = 10
+    DB_WORKER_POOL_SIZE: int = 2                # Worker process: tasks use one connection at a time
+    DB_WORKER_MAX_OVERFLOW: int = 0             # Keeps connections bounded as worker replicas scale
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0       # Wait for a free connection before failing
+    DB_POOL_RECYCLE_SECONDS: int = 1800         # Reconnect periodically (server / proxy idle timeouts)
+    DB_COMPILED_CACHE_SIZE: int = 1000          # SQLAlchemy compiled statement cache per engine
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 256 # asyncpg prepared statements per connection (0 = off, e.g. pgbouncer)
+
     # Redis / Celery
     REDIS_HOST: str = "127.0.0.1"
     REDIS_PORT: int = 6379
@@ -26,18 +36,125 @@ class Settings(BaseSettings):
     CELERY_BROKER_URL: Optional[str] = None
     CELERY_RESULT_BACKEND: Optional[str] = None
 
+    # Media Storage (keys are the "media/..." paths stored in the DB)
+    STORAGE_BACKEND: str = "local"              # local (shared filesystem) / s3 (S3-compatible: AWS, MinIO)
+    STORAGE_LOCAL_ROOT: str = "."               # "local": keys resolve against this directory
+    STORAGE_S3_BUCKET: Optional[str] = None
+    STORAGE_S3_PREFIX: str = ""
+    STORAGE_S3_ENDPOINT_URL: Optional[str] = None  # e.g. http://minio:9000 (None = AWS)
+    STORAGE_S3_REGION: Optional[str] = None
+    STORAGE_S3_ACCESS_KEY_ID: Optional[str] = None      # None = default AWS credential chain
+    STORAGE_S3_SECRET_ACCESS_KEY: Optional[str] = None
+    STORAGE_S3_MAX_CONNECTIONS: int = 20
+    STORAGE_MULTIPART_CHUNK_MB: int = 8         # Multipart part size (and threshold) for streamed uploads
+    STORAGE_PRESIGN_EXPIRES_SECONDS: int = 3600 # Lifetime of presigned download URLs
+    STORAGE_CACHE_DIR: str = "media/cache/storage"  # "s3": local copies of hot objects (workers)
+    STORAGE_CACHE_MAX_MB: int = 2048            # LRU evicted beyond this
+
+    # Task Progress (Redis pub/sub for SSE streaming)
+    PROGRESS_REDIS_DB: int = 0
+    PROGRESS_EVENT_TTL_SECONDS: int = 3600      # How long the last event per task is kept
+    PROGRESS_STREAM_IDLE_SECONDS: int = 900     # SSE stream ends ("timeout" event) after this long without events
+    PROGRESS_STREAM_MAX_SECONDS: int = 3600     # Hard cap on an SSE stream's lifetime
+
+    # Metrics (Prometheus)
+    METRICS_ENABLED: bool = True
+    WORKER_METRICS_PORT: int = 9100             # Worker /metrics port (0 = off); the API serves /metrics itself
+
     # Keys based on environment
     GEMINI_API_KEY: Optional[str] = None
     
     # Resource Management
-    UNLOAD_PIPELINE_AFTER_TASK: bool = True
-    
+    UNLOAD_PIPELINE_AFTER_TASK: bool = False    # Keep models resident between tasks (registry evicts under budget)
+    MODEL_REGISTRY_RAM_BUDGET_MB: int = 0       # Host RAM budget for resident models (0 = unlimited)
+    MODEL_REGISTRY_VRAM_BUDGET_MB: int = 0      # GPU memory budget for resident models (0 = unlimited)
+
     # VTON Pipeline Tuning (for color accuracy)
     VTON_IP_ADAPTER_SCALE: float = 1.0          # Lower = less garment style influence (default was 1.0)
     VTON_CONTROLNET_SCALE: float = 1.0        # Lower = less pose rigidity (default was 1.0)
     VTON_INFERENCE_STRENGTH: float = 0.99       # Lower = preserve more of original (default was 0.99)
     VTON_GUIDANCE_SCALE: float = 7.5             # CFG scale for prompt adherence
     VTON_VAE_FULL_PRECISION: bool = False       # Decode VAE in float32 for better colors
+    VTON_PREVIEW_EVERY_N_STEPS: int = 0         # Publish a low-res preview every N diffusion steps (0 = off)
+    VTON_INFERENCE_PROFILE: str = "quality"     # Default profile: fast (LCM-LoRA) / balanced (DPM-Solver++) / quality
+    VTON_REFINE_PROFILE: str = "quality"        # Profile of the optional re-render after a fast preview
+
+    # CPU Inference Backend (UNet, ControlNet, VAE and image encoder exported to ONNX)
+    VTON_BACKEND: str = "torch"                 # torch / onnxruntime / openvino (the latter two run on CPU)
+    VTON_CPU_QUANTIZATION: str = "none"         # none / int8 (weights) / bf16 (OpenVINO only)
+    VTON_CPU_THREADS: int = 0                   # Runtime threads (0 = runtime default)
+    VTON_CPU_EXPORT_DIR: str = "media/cache/cpu_export"
+
+    # Debug Artifacts (cloth mask / DensePose images, written by a background thread)
+    VTON_DEBUG_ARTIFACTS: str = "off"           # off / sampled / always
+    VTON_DEBUG_SAMPLE_EVERY: int = 100          # "sampled": keep every Nth try-on
+    VTON_DEBUG_DIR: str = "media/debug"
+    VTON_DEBUG_MAX_MB: int = 256                # Oldest files removed beyond this
+    VTON_DEBUG_RETENTION_HOURS: int = 24        # 0 = keep until the size cap
+    VTON_DEBUG_QUEUE_SIZE: int = 64             # Pending writes; further artifacts are dropped
+
+    # VTON Batching (1 = disabled, each try-on runs on its own)
+    VTON_BATCH_SIZE: int = 1                    # Max try-on requests coalesced into one diffusion call
+    VTON_BATCH_WINDOW_SECONDS: float = 0.5      # Max time to wait for a batch to fill
+
+    # Try-On Result Dedup (person hash + garment + generation params)
+    TRYON_CACHE_ENABLED: bool = True
+    TRYON_CACHE_REDIS_DB: int = 1
+    TRYON_CACHE_TTL_SECONDS: int = 604800       # How long a finished result is reused
+    TRYON_INFLIGHT_TTL_SECONDS: int = 900       # Claim expiry, in case a worker dies mid-task
+
+    # Person Preprocessing Cache (cloth mask + DensePose, keyed by person image hash)
+    PREPROCESS_CACHE_ENABLED: bool = True
+    PREPROCESS_CACHE_DIR: str = "media/cache/preprocess"
+    PREPROCESS_CACHE_MAX_MB: int = 1024         # Local disk budget, LRU evicted
+    PREPROCESS_CACHE_REDIS: bool = False        # Shared Redis tier across workers
+    PREPROCESS_CACHE_REDIS_DB: int = 1
+    PREPROCESS_CACHE_REDIS_TTL_SECONDS: int = 86400
+
+    # Garment Metadata Cache (try-on lookups, ETag'd catalog listing)
+    GARMENT_CACHE_ENABLED: bool = True
+    GARMENT_CACHE_SIZE: int = 10000             # In-process records
+    GARMENT_CACHE_LOCAL_TTL_SECONDS: int = 60   # Bounds staleness in processes that did not do the invalidation
+    GARMENT_CACHE_REDIS_DB: int = 1
+    GARMENT_CACHE_REDIS_TTL_SECONDS: int = 86400
+    GARMENT_LISTING_CACHE_SIZE: int = 256       # Serialized listings per API process (per catalog version + query)
+
+    # Search
+    SEARCH_HNSW_EF_SEARCH: int = 100            # HNSW candidate list size (recall vs latency)
+    SEARCH_HNSW_ITERATIVE_SCAN: bool = True     # pgvector >= 0.8: scan on until filtered / later pages are full
+    SEARCH_HNSW_MAX_SCAN_TUPLES: int = 20000    # Iterative scan budget per query (grows with page depth)
+
+    # Query Embedding Cache
+    EMBEDDING_CACHE_SIZE: int = 10000           # In-process LRU entries (0 = disabled)
+    EMBEDDING_CACHE_TTL_SECONDS: int = 3600
+    EMBEDDING_CACHE_REDIS: bool = False         # Shared Redis tier across API replicas
+    EMBEDDING_CACHE_REDIS_DB: int = 1
+
+    # Embedding Execution
+    EMBEDDING_EXECUTOR_WORKERS: int = 2         # Dedicated encode threads (keeps the event loop free)
+    EMBEDDING_MICRO_BATCHING: bool = True       # Coalesce concurrent async encodes into one forward pass
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0
+
+    # Background Removal (rembg)
+    REMBG_MODEL: str = "u2net"
+    REMBG_INTRA_OP_THREADS: int = 0             # ONNX Runtime threads per op (0 = runtime default)
+    REMBG_INTER_OP_THREADS: int = 0             # Parallel ops (0 = sequential execution)
+    REMBG_BATCH_SIZE: int = 16                  # Images per remove_background_batch_task
+    REMBG_MATTING_EDGE_THRESHOLD: float = 0.25  # Run alpha matting at or above this edge uncertainty, measured at model resolution (0 = always)
+
+    # Image Derivatives (resized renditions of processed garments and try-on results)
+    DERIVATIVES_ENABLED: bool = True
+    DERIVATIVE_FORMATS: str = "webp"            # Comma separated, first is the default: webp, avif (needs pillow-avif-plugin)
+    DERIVATIVE_THUMB_WIDTH: int = 256           # Grid tiles
+    DERIVATIVE_MEDIUM_WIDTH: int = 512          # Previews / try-on result view
+    DERIVATIVE_QUALITY: int = 80
+
+    # Bulk Ingestion
+    BULK_INGEST_BATCH_SIZE: int = 256           # Garments per DB insert / embedding batch / Celery chord
+    BULK_INGEST_MAX_INFLIGHT_CHUNKS: int = 4    # Chunks queued for processing at once (backpressure)
+    BULK_INGEST_DEFER_SECONDS: int = 5          # Delay before a throttled import resumes (re-enqueued, never blocks a worker)
+    BULK_INGEST_ALLOWED_ROOT: str = "media/import"  # Manifest paths must live under this directory
 
     class Config:
         env_file = ".env"
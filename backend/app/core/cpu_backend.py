@@ -0,0 +1,407 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Execution backends for the diffusion components ("torch" = plain diffusers)
+BACKENDS = ("torch", "onnxruntime", "openvino")
+QUANTIZATIONS = ("none", "int8", "bf16")
+
+# Try-on resolution (height, width): exported graphs have a fixed spatial size and a dynamic batch
+EXPORT_SIZE = (1024, 768)
+ONNX_OPSET = 17
+# Inputs whose leading axis is not the batch (the scheduler timestep is one value per step)
+STATIC_INPUTS = ("timestep",)
+# Bump when exported graphs change shape, so cached exports are rebuilt
+# 2: static timestep axis
+EXPORT_FORMAT = 2
+
+
+def _dynamic_batch(names: Sequence[str]) -> Dict[str, Dict[int, str]]:
+    return {name: {0: "batch"} for name in names if name not in STATIC_INPUTS}
+
+
+# --- Export wrappers: flat tensor signatures around the diffusers modules ---
+# They call the class forward explicitly, since the instance forward is replaced once a runtime is attached.
+
+class _UNetExport(torch.nn.Module):
+    def __init__(self, unet, num_residuals: int):
+        super().__init__()
+        self.unet = unet
+        self.num_residuals = num_residuals
+        self.has_image_embeds = unet.encoder_hid_proj is not None
+
+    def forward(self, sample, timestep, encoder_hidden_states, *extra):
+        added_cond_kwargs = None
+        if self.has_image_embeds:
+            added_cond_kwargs = {"image_embeds": [extra[0]]}
+            extra = extra[1:]
+        return type(self.unet).forward(
+            self.unet, sample, timestep, encoder_hidden_states,
+            down_block_additional_residuals=list(extra[:self.num_residuals]),
+            mid_block_additional_residual=extra[self.num_residuals],
+            added_cond_kwargs=added_cond_kwargs,
+            return_dict=False,
+        )[0]
+
+
+class _ControlNetExport(torch.nn.Module):
+    def __init__(self, controlnet):
+        super().__init__()
+        self.controlnet = controlnet
+
+    def forward(self, sample, timestep, encoder_hidden_states, controlnet_cond):
+        # conditioning_scale is applied by the runtime wrapper, so it is not baked into the graph
+        down_samples, mid_sample = type(self.controlnet).forward(
+            self.controlnet, sample, timestep, encoder_hidden_states,
+            controlnet_cond=controlnet_cond, conditioning_scale=1.0, return_dict=False,
+        )
+        return (*down_samples, mid_sample)
+
+
+class _VAEEncoderExport(torch.nn.Module):
+    def __init__(self, vae):
+        super().__init__()
+        self.vae = vae
+
+    def forward(self, sample):
+        # Gaussian moments (mean, logvar); sampling stays in torch so generators are honoured
+        moments = self.vae.encoder(sample)
+        return self.vae.quant_conv(moments) if self.vae.quant_conv is not None else moments
+
+
+class _VAEDecoderExport(torch.nn.Module):
+    def __init__(self, vae):
+        super().__init__()
+        self.vae = vae
+
+    def forward(self, latent_sample):
+        if self.vae.post_quant_conv is not None:
+            latent_sample = self.vae.post_quant_conv(latent_sample)
+        return self.vae.decoder(latent_sample)
+
+
+class _ImageEncoderExport(torch.nn.Module):
+    def __init__(self, image_encoder):
+        super().__init__()
+        self.image_encoder = image_encoder
+
+    def forward(self, pixel_values):
+        hidden_states = type(self.image_encoder).forward(
+            self.image_encoder, pixel_values, output_hidden_states=True, return_dict=True
+        ).hidden_states
+        return hidden_states[-2], hidden_states[-1]
+
+
+# --- Runtimes ---
+
+class _OrtRunner:
+    def __init__(self, path: str):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if settings.VTON_CPU_THREADS > 0:
+            options.intra_op_num_threads = settings.VTON_CPU_THREADS
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, inputs: List[np.ndarray]) -> List[np.ndarray]:
+        return self.session.run(None, dict(zip(self.input_names, inputs)))
+
+
+class _OpenVINORunner:
+    def __init__(self, path: str, quantization: str):
+        import openvino as ov
+
+        core = ov.Core()
+        model = core.read_model(path)
+        if quantization == "int8":
+            import nncf
+            model = nncf.compress_weights(model)  # int8 weights, activations stay in float
+
+        config = {"INFERENCE_PRECISION_HINT": "bf16" if quantization == "bf16" else "f32"}
+        if settings.VTON_CPU_THREADS > 0:
+            config["INFERENCE_NUM_THREADS"] = settings.VTON_CPU_THREADS
+        self.compiled = core.compile_model(model, "CPU", config)
+        self.request = self.compiled.create_infer_request()
+
+    def __call__(self, inputs: List[np.ndarray]) -> List[np.ndarray]:
+        results = self.request.infer(inputs)
+        return [results[output] for output in self.compiled.outputs]
+
+
+def _to_numpy(tensor: torch.Tensor) -> np.ndarray:
+    return tensor.detach().to("cpu", dtype=torch.float32).numpy()
+
+
+def _to_torch(array: np.ndarray, like: torch.Tensor) -> torch.Tensor:
+    return torch.from_numpy(np.ascontiguousarray(array)).to(device=like.device, dtype=like.dtype)
+
+
+class CPUBackend:
+    """
+    Runs the UNet, ControlNet, VAE and IP-Adapter image encoder through ONNX Runtime or OpenVINO.
+
+    Each component is exported once to ONNX (cached under VTON_CPU_EXPORT_DIR, keyed by
+    model signature and quantization) and attached to the existing diffusers modules by
+    replacing their forward / encode / decode, so the diffusers pipeline, schedulers and
+    VTONPipeline.run() are unchanged.
+    """
+
+    def __init__(self, backend: str, quantization: str, signature: Dict, export_dir: Optional[str] = None,
+                 export_size: Tuple[int, int] = EXPORT_SIZE):
+        if backend not in BACKENDS or backend == "torch":
+            raise ValueError(f"Unsupported CPU backend '{backend}'. Use one of: {', '.join(BACKENDS[1:])}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization '{quantization}'. Use one of: {', '.join(QUANTIZATIONS)}")
+        if backend == "onnxruntime" and quantization == "bf16":
+            logger.warning("bf16 is not supported by the ONNX Runtime CPU provider, running in fp32")
+            quantization = "none"
+
+        self.backend = backend
+        self.quantization = quantization
+        self.signature = signature
+        self.export_dir = export_dir or settings.VTON_CPU_EXPORT_DIR
+        self.export_size = export_size
+        self.latent_scale = 8  # VAE downsampling factor (SD 1.x), taken from the pipeline on attach
+        self._unet_runners: Dict[str, object] = {}
+
+    # --- Export ---
+
+    def _component_path(self, name: str, variant: str = "") -> str:
+        key = json.dumps({**self.signature, "component": name, "variant": variant, "format": EXPORT_FORMAT},
+                         sort_keys=True)
+        digest = hashlib.sha256(key.encode()).hexdigest()[:12]
+        return os.path.join(self.export_dir, f"{name}{'-' + variant if variant else ''}-{digest}", "model.onnx")
+
+    def _export(self, path: str, build: Callable[[], Tuple[torch.nn.Module, Tuple[torch.Tensor, ...], List[str], List[str]]]) -> str:
+        """
+        Exports the graph returned by `build()` -> (module, example_inputs, input_names, output_names)
+        unless it is already cached, and returns the path of the model to load.
+        `build` is only called on a cache miss, so cached startups never run a torch forward.
+        """
+        if not os.path.exists(path):
+            print(f"Exporting {os.path.basename(os.path.dirname(path))} to ONNX (one-off, may take a few minutes)...")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with torch.no_grad():
+                module, example_inputs, input_names, output_names = build()
+                torch.onnx.export(
+                    module, example_inputs, tmp_path,
+                    input_names=input_names, output_names=output_names,
+                    dynamic_axes=_dynamic_batch(input_names + output_names),
+                    opset_version=ONNX_OPSET, do_constant_folding=True,
+                )
+            os.replace(tmp_path, path)
+
+        if self.backend == "onnxruntime" and self.quantization == "int8":
+            quantized_path = path.replace("model.onnx", "model.int8.onnx")
+            if not os.path.exists(quantized_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8, use_external_data_format=True)
+            return quantized_path
+        return path
+
+    def _runner(self, path: str):
+        if self.backend == "openvino":
+            return _OpenVINORunner(path, self.quantization)
+        return _OrtRunner(path)
+
+    def _latent_examples(self, unet, batch: int = 2):
+        height, width = self.export_size
+        sample = torch.randn(batch, unet.config.in_channels, height // self.latent_scale, width // self.latent_scale)
+        timestep = torch.tensor([999.0])
+        encoder_hidden_states = torch.randn(batch, 77, unet.config.cross_attention_dim)
+        return sample, timestep, encoder_hidden_states
+
+    # --- Attach ---
+
+    def attach(self, pipeline):
+        """
+        Exports (if needed) and attaches runtimes to every diffusion component of `pipeline`.
+        """
+        pipeline.to("cpu", dtype=torch.float32)
+        self.latent_scale = pipeline.vae_scale_factor
+        self._attach_controlnet(pipeline.controlnet, pipeline.unet)
+        self._attach_vae(pipeline.vae)
+        self.select_unet(pipeline)
+        pipeline._vton_cpu_backend = self
+        print(f"CPU backend ready ({self.backend}, quantization={self.quantization}).")
+        return pipeline
+
+    def _controlnet_residual_examples(self, controlnet, unet):
+        sample, timestep, encoder_hidden_states = self._latent_examples(unet)
+        height, width = self.export_size
+        controlnet_cond = torch.randn(sample.shape[0], 3, height, width)
+        with torch.no_grad():
+            down, mid = type(controlnet).forward(
+                controlnet, sample[:, :controlnet.config.in_channels], timestep, encoder_hidden_states,
+                controlnet_cond=controlnet_cond, return_dict=False,
+            )
+        return list(down), mid
+
+    def _attach_controlnet(self, controlnet, unet):
+        def build():
+            sample, timestep, encoder_hidden_states = self._latent_examples(unet)
+            sample = sample[:, :controlnet.config.in_channels]
+            height, width = self.export_size
+            controlnet_cond = torch.randn(sample.shape[0], 3, height, width)
+            num_residuals = len(controlnet.controlnet_down_blocks)
+            return (
+                _ControlNetExport(controlnet), (sample, timestep, encoder_hidden_states, controlnet_cond),
+                ["sample", "timestep", "encoder_hidden_states", "controlnet_cond"],
+                [f"down_{i}" for i in range(num_residuals)] + ["mid"],
+            )
+
+        runner = self._runner(self._export(self._component_path("controlnet"), build))
+
+        def forward(sample, timestep, encoder_hidden_states, controlnet_cond, conditioning_scale=1.0,
+                    return_dict=True, **kwargs):
+            outputs = runner([
+                _to_numpy(sample), _to_numpy(torch.as_tensor(timestep, dtype=torch.float32).reshape(1)),
+                _to_numpy(encoder_hidden_states), _to_numpy(controlnet_cond),
+            ])
+            outputs = [_to_torch(output, sample) * conditioning_scale for output in outputs]
+            down_samples, mid_sample = tuple(outputs[:-1]), outputs[-1]
+            if not return_dict:
+                return down_samples, mid_sample
+            from diffusers.models.controlnet import ControlNetOutput
+            return ControlNetOutput(down_block_res_samples=down_samples, mid_block_res_sample=mid_sample)
+
+        controlnet.forward = forward
+
+    def _attach_vae(self, vae):
+        from diffusers.models.autoencoders.vae import DecoderOutput, DiagonalGaussianDistribution
+        from diffusers.models.modeling_outputs import AutoencoderKLOutput
+
+        height, width = self.export_size
+        scale = self.latent_scale
+        encoder_runner = self._runner(self._export(
+            self._component_path("vae_encoder"),
+            lambda: (_VAEEncoderExport(vae), (torch.randn(1, 3, height, width),), ["sample"], ["moments"]),
+        ))
+        decoder_runner = self._runner(self._export(
+            self._component_path("vae_decoder"),
+            lambda: (
+                _VAEDecoderExport(vae),
+                (torch.randn(1, vae.config.latent_channels, height // scale, width // scale),),
+                ["latent_sample"], ["sample"],
+            ),
+        ))
+
+        # Replaces encode/decode (not forward): the pipeline calls these directly. Tiling is not needed on CPU.
+        def encode(x, return_dict=True):
+            moments = _to_torch(encoder_runner([_to_numpy(x)])[0], x)
+            posterior = DiagonalGaussianDistribution(moments)
+            return AutoencoderKLOutput(latent_dist=posterior) if return_dict else (posterior,)
+
+        def decode(z, return_dict=True, generator=None):
+            sample = _to_torch(decoder_runner([_to_numpy(z)])[0], z)
+            return DecoderOutput(sample=sample) if return_dict else (sample,)
+
+        vae.encode = encode
+        vae.decode = decode
+
+    def select_unet(self, pipeline, lora: Optional[str] = None):
+        """
+        Attaches the UNet runtime for a LoRA variant (None = base weights).
+        Compiled graphs cannot switch adapters, so each LoRA is fused and exported as its own variant.
+        """
+        unet = pipeline.unet
+        variant = hashlib.sha256(lora.encode()).hexdigest()[:8] if lora else ""
+        if variant not in self._unet_runners:
+            if lora:
+                pipeline.load_lora_weights(lora, adapter_name="cpu_export")
+                pipeline.fuse_lora()
+            try:
+                self._unet_runners[variant] = self._export_unet(pipeline, variant)
+            finally:
+                if lora:
+                    pipeline.unfuse_lora()
+                    pipeline.unload_lora_weights()
+        runner = self._unet_runners[variant]
+
+        def forward(sample, timestep, encoder_hidden_states, down_block_additional_residuals=None,
+                    mid_block_additional_residual=None, added_cond_kwargs=None, return_dict=True, **kwargs):
+            inputs = [
+                _to_numpy(sample), _to_numpy(torch.as_tensor(timestep, dtype=torch.float32).reshape(1)),
+                _to_numpy(encoder_hidden_states),
+            ]
+            if unet.encoder_hid_proj is not None:
+                inputs.append(_to_numpy(added_cond_kwargs["image_embeds"][0]))
+            inputs.extend(_to_numpy(residual) for residual in down_block_additional_residuals)
+            inputs.append(_to_numpy(mid_block_additional_residual))
+
+            output = _to_torch(runner(inputs)[0], sample)
+            if not return_dict:
+                return (output,)
+            from diffusers.models.unets.unet_2d_condition import UNet2DConditionOutput
+            return UNet2DConditionOutput(sample=output)
+
+        unet.forward = forward
+
+    def _export_unet(self, pipeline, variant: str):
+        unet = pipeline.unet
+
+        def build():
+            sample, timestep, encoder_hidden_states = self._latent_examples(unet)
+            # Residual shapes come from a reference ControlNet pass (class forward, torch weights)
+            down, mid = self._controlnet_residual_examples(pipeline.controlnet, unet)
+
+            example_inputs = [sample, timestep, encoder_hidden_states]
+            input_names = ["sample", "timestep", "encoder_hidden_states"]
+            if unet.encoder_hid_proj is not None:
+                # IP-Adapter Plus: penultimate CLIP hidden states, (batch, num_images, seq, dim)
+                projection = unet.encoder_hid_proj.image_projection_layers[0]
+                example_inputs.append(torch.randn(sample.shape[0], 1, 257, projection.proj_in.in_features))
+                input_names.append("image_embeds")
+            example_inputs.extend(down + [mid])
+            input_names.extend([f"down_{i}" for i in range(len(down))] + ["mid"])
+            return _UNetExport(unet, len(down)), tuple(example_inputs), input_names, ["out_sample"]
+
+        return self._runner(self._export(self._component_path("unet", variant), build))
+
+    def attach_image_encoder(self, image_encoder):
+        """
+        Attaches a runtime to the IP-Adapter CLIP image encoder. Only the last two hidden
+        states are returned, which is all VTONPipeline.encode_garment reads.
+        """
+        from transformers.modeling_outputs import BaseModelOutputWithPooling
+
+        image_encoder.to("cpu", dtype=torch.float32)
+        size = image_encoder.config.image_size
+        runner = self._runner(self._export(
+            self._component_path("image_encoder"),
+            lambda: (
+                _ImageEncoderExport(image_encoder), (torch.randn(1, 3, size, size),),
+                ["pixel_values"], ["penultimate_hidden_state", "last_hidden_state"],
+            ),
+        ))
+
+        def forward(pixel_values, output_hidden_states=None, return_dict=True, **kwargs):
+            penultimate, last = (_to_torch(output, pixel_values) for output in runner([_to_numpy(pixel_values)]))
+            return BaseModelOutputWithPooling(last_hidden_state=last, hidden_states=(penultimate, last))
+
+        image_encoder.forward = forward
+        return image_encoder
+
+
+def cpu_backend_from_settings(signature: Dict) -> Optional[CPUBackend]:
+    """
+    The configured CPU backend, or None when VTON_BACKEND is "torch".
+    """
+    if settings.VTON_BACKEND == "torch":
+        return None
+    return CPUBackend(
+        settings.VTON_BACKEND, settings.VTON_CPU_QUANTIZATION,
+        signature={**signature, "backend": settings.VTON_BACKEND},
+    )
@@ -0,0 +1,139 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from app.core.config import settings
+from app.core.disk_lru import DiskLRU
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "sampled", "always")
+
+
+def derived_path(source_path: str, suffix: str, ext: str = ".png", directory: Optional[str] = None) -> str:
+    """
+    `<stem><suffix><ext>` for a source file, e.g. ("raw/abc.jpeg", "_mask") -> "raw/abc_mask.png".
+    Works for any extension (unlike chained str.replace calls) and optionally moves it to `directory`.
+    """
+    stem, _ = os.path.splitext(source_path)
+    if directory is not None:
+        stem = os.path.join(directory, os.path.basename(stem))
+    return f"{stem}{suffix}{ext}".replace("\\", "/")
+
+
+class DebugArtifactWriter:
+    """
+    Saves intermediate images (cloth mask, DensePose) for inspection without slowing try-ons.
+
+    VTON_DEBUG_ARTIFACTS: "off", "sampled" (every VTON_DEBUG_SAMPLE_EVERY-th try-on) or "always".
+    Images are queued and PNG-encoded by a background thread; when the queue is full they are
+    dropped rather than blocking. VTON_DEBUG_DIR is capped at VTON_DEBUG_MAX_MB (oldest first)
+    and files older than VTON_DEBUG_RETENTION_HOURS are removed.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(DebugArtifactWriter, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._queue = None
+            cls._instance._thread = None
+            cls._instance._sequence = itertools.count()
+            cls._instance._disk = DiskLRU(
+                settings.VTON_DEBUG_DIR,
+                settings.VTON_DEBUG_MAX_MB * 1024 * 1024,
+                suffix=".png",
+                max_age_seconds=settings.VTON_DEBUG_RETENTION_HOURS * 3600 or None,
+            )
+            cls._instance._counters = {"written": 0, "dropped": 0, "failed": 0, "evictions": 0}
+        return cls._instance
+
+    @property
+    def mode(self) -> str:
+        mode = settings.VTON_DEBUG_ARTIFACTS
+        return mode if mode in MODES else "off"
+
+    def sample(self) -> bool:
+        """
+        Decides once per try-on whether its artifacts are kept.
+        """
+        mode = self.mode
+        if mode == "always":
+            return True
+        if mode == "sampled":
+            return next(self._sequence) % max(1, settings.VTON_DEBUG_SAMPLE_EVERY) == 0
+        return False
+
+    def save(self, image: Image.Image, source_path: str, suffix: str):
+        """
+        Queues `image` to be written as `<source stem><suffix>.png` under VTON_DEBUG_DIR.
+        The image must not be modified afterwards (the pipeline only reads its inputs).
+        """
+        filename = os.path.basename(derived_path(source_path, suffix))
+        try:
+            self._ensure_writer().put_nowait((filename, image))
+        except queue.Full:
+            with self._lock:
+                self._counters["dropped"] += 1
+
+    def flush(self, timeout: float = 5.0):
+        """
+        Waits until queued artifacts are written (best effort, e.g. before shutdown).
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue is not None and self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["files"] = len(self._disk)
+        stats["disk_bytes"] = self._disk.total_bytes
+        stats["mode"] = self.mode
+        stats["queued"] = self._queue.qsize() if self._queue is not None else 0
+        stats["max_bytes"] = settings.VTON_DEBUG_MAX_MB * 1024 * 1024
+        return stats
+
+    # --- Background writer ---
+
+    def _ensure_writer(self) -> queue.Queue:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._queue = self._queue or queue.Queue(maxsize=settings.VTON_DEBUG_QUEUE_SIZE)
+                self._thread = threading.Thread(target=self._run, name="debug-artifacts", daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def _run(self):
+        while True:
+            filename, image = self._queue.get()
+            try:
+                self._write(filename, image)
+            except Exception as e:
+                logger.warning(f"Failed to write debug artifact {filename}: {e}")
+                with self._lock:
+                    self._counters["failed"] += 1
+            finally:
+                self._queue.task_done()
+
+    def _write(self, filename: str, image: Image.Image):
+        path = self._disk.path(filename)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        # Debug output: favour speed over size
+        image.save(tmp_path, format="PNG", compress_level=1)
+        os.replace(tmp_path, path)
+
+        evictions = self._disk.add(filename)
+        with self._lock:
+            self._counters["written"] += 1
+            self._counters["evictions"] += evictions
+
+
+debug_artifacts = DebugArtifactWriter()
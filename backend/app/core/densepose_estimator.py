@@ -2,13 +2,11 @@ import torch
 import numpy as np
 from PIL import Image
 import os
+from typing import List
 
 try:
     from detectron2.config import get_cfg
     from detectron2.engine import DefaultPredictor
-    from detectron2.data import MetadataCatalog
-    from detectron2.utils.visualizer import Visualizer, ColorMode
-    import cv2
 except ImportError:
     print("Detectron2 not installed. DensePose will fail.")
 
@@ -160,38 +158,73 @@ class DensePoseEstimator:
             print(f"Failed to load DensePose: {e}")
             raise e
 
-    def run(self, pil_image: Image.Image) -> Image.Image:
+    def _predict(self, images_bgr: List[np.ndarray]):
         """
-        Returns the IUV (DensePose) image.
+        Batched DefaultPredictor: same resize augmentation, one model call for every image.
+        Returns the Instances of each image, left on the model device.
+        """
+        inputs = []
+        for image_bgr in images_bgr:
+            height, width = image_bgr.shape[:2]
+            if self.predictor.input_format == "RGB":
+                image_bgr = image_bgr[:, :, ::-1]
+            transformed = self.predictor.aug.get_transform(image_bgr).apply_image(image_bgr)
+            tensor = torch.as_tensor(transformed.astype("float32").transpose(2, 0, 1))
+            inputs.append({"image": tensor, "height": height, "width": width})
+
+        with torch.no_grad():
+            return [output["instances"] for output in self.predictor.model(inputs)]
+
+    def _rasterize_iuv(self, instances, height: int, width: int) -> torch.Tensor:
+        """
+        Writes the raw DensePose charts into a preallocated (3, H, W) uint8 IUV tensor:
+        channel 0 = body part index I (0 = background), 1 = U * 255, 2 = V * 255.
+        Overlapping people are painted by increasing score, so the most confident one wins.
+        """
+        from densepose.converters.chart_output_to_chart_result import densepose_chart_predictor_output_to_result
+
+        iuv = torch.zeros((3, height, width), dtype=torch.uint8, device=instances.pred_boxes.device)
+        if not instances.has("pred_densepose") or len(instances) == 0:
+            return iuv
+
+        for i in instances.scores.argsort().tolist():
+            # Resamples the S x S chart predictions to the box size, on device
+            result = densepose_chart_predictor_output_to_result(instances.pred_densepose[i], instances.pred_boxes[i])
+            x0, y0 = (max(int(c), 0) for c in instances.pred_boxes.tensor[i, :2].tolist())
+            box_height, box_width = result.labels.shape
+            x1, y1 = min(x0 + box_width, width), min(y0 + box_height, height)
+            if x1 <= x0 or y1 <= y0:
+                continue
+
+            labels = result.labels[:y1 - y0, :x1 - x0]
+            uv = result.uv[:, :y1 - y0, :x1 - x0]
+            foreground = labels > 0
+            region = iuv[:, y0:y1, x0:x1]
+            region[0][foreground] = labels[foreground].to(torch.uint8)
+            region[1:, foreground] = (uv[:, foreground] * 255).clamp(0, 255).to(torch.uint8)
+        return iuv
+
+    def run_batch(self, pil_images: List[Image.Image]) -> List[Image.Image]:
+        """
+        Returns the IUV (DensePose) image of each input, at the input size.
         """
         self.load_model()
-        
+
         # Convert PIL to BGR numpy (OpenCV format)
-        image_np = np.array(pil_image)
-        # RGB to BGR
-        image_bgr = image_np[:, :, ::-1].copy()
-        
-        with torch.no_grad():
-            outputs = self.predictor(image_bgr)["instances"]
-            # Move to CPU for visualization/numpy conversion
-            outputs = outputs.to("cpu")
-            
-        # Extract DensePose results
-        if not outputs.has("pred_densepose"):
-            print("No DensePose detected!")
-            # Return empty black image same size
-            return Image.new("RGB", pil_image.size, (0,0,0))
-            
-        # We need to visualize/render to IUV
-        # This is complex without the visualizer, but let's try using the Visualizer to get the IUV style map
-        # Or standard IUV extraction.
-        
-        # Simplified approach: Use Visualizer to draw "DensePose" mode
-        # However, IDM-VTON often expects the raw I, U, V channels mapped to RGB.
-        
-        # PROPOSED: Just return the visualized densepose which looks like the colorful body map.
-        visualizer = Visualizer(image_bgr, MetadataCatalog.get(self.predictor.cfg.DATASETS.TEST[0]))
-        out = visualizer.draw_instance_predictions(outputs)
-        res_bgr = out.get_image()
-        
-        return Image.fromarray(res_bgr[:, :, ::-1])
+        images_bgr = [np.ascontiguousarray(np.asarray(image.convert("RGB"))[:, :, ::-1]) for image in pil_images]
+
+        results = []
+        for image_bgr, instances in zip(images_bgr, self._predict(images_bgr)):
+            if not instances.has("pred_densepose") or len(instances) == 0:
+                print("No DensePose detected!")
+            height, width = image_bgr.shape[:2]
+            iuv = self._rasterize_iuv(instances, height, width)
+            # Single device -> host copy per image
+            results.append(Image.fromarray(iuv.permute(1, 2, 0).cpu().numpy(), mode="RGB"))
+        return results
+
+    def run(self, pil_image: Image.Image) -> Image.Image:
+        """
+        Returns the IUV (DensePose) image.
+        """
+        return self.run_batch([pil_image])[0]
@@ -0,0 +1,97 @@
+import logging
+import os
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from app.core.config import settings
+from app.core.debug_artifacts import derived_path
+from app.core.storage import storage
+
+logger = logging.getLogger(__name__)
+
+# Largest first: each rendition is resized from the previous one
+RENDITIONS = ("medium", "thumb")
+
+# Extension -> Pillow format
+FORMATS = {"webp": "WEBP", "avif": "AVIF"}
+
+_warned_unavailable = set()
+
+
+def rendition_widths() -> Dict[str, int]:
+    return {"medium": settings.DERIVATIVE_MEDIUM_WIDTH, "thumb": settings.DERIVATIVE_THUMB_WIDTH}
+
+
+def _format_available(fmt: str) -> bool:
+    if fmt == "avif" and "AVIF" not in Image.SAVE:
+        try:
+            import pillow_avif  # noqa: F401  Registers the AVIF codec (pillow-avif-plugin)
+        except ImportError:
+            pass
+    return FORMATS[fmt] in Image.SAVE
+
+
+def derivative_formats() -> List[str]:
+    """
+    Configured DERIVATIVE_FORMATS that this process can encode, in order (the first is the default).
+    """
+    formats = []
+    for fmt in (f.strip().lower() for f in settings.DERIVATIVE_FORMATS.split(",")):
+        if fmt not in FORMATS:
+            continue
+        if not _format_available(fmt):
+            if fmt not in _warned_unavailable:
+                _warned_unavailable.add(fmt)
+                logger.warning(f"Derivative format {fmt} is not supported by this Pillow build; skipping it")
+            continue
+        formats.append(fmt)
+    return formats
+
+
+def derivative_path(source_path: str, rendition: str, fmt: str) -> str:
+    """
+    e.g. ("media/processed/abc_clean.png", "thumb", "webp") -> "media/processed/abc_clean_thumb.webp"
+    """
+    return derived_path(source_path, f"_{rendition}", f".{fmt}")
+
+
+def derivative_urls(source_path: Optional[str]) -> Dict[str, Dict[str, str]]:
+    """
+    {rendition: {format: path}} for an image, as produced by `generate_derivatives`.
+    Paths are deterministic, so listings can expose them without touching the files.
+    """
+    if not source_path or not settings.DERIVATIVES_ENABLED:
+        return {}
+    formats = derivative_formats()
+    return {rendition: {fmt: derivative_path(source_path, rendition, fmt) for fmt in formats} for rendition in RENDITIONS}
+
+
+def generate_derivatives(source_path: str, image: Optional[Image.Image] = None) -> Dict[str, Dict[str, str]]:
+    """
+    Stores the resized renditions of the `source_path` key (or of `image`, its already decoded
+    pixels) in every configured format next to the source. Returns `derivative_urls(source_path)`.
+    """
+    if not settings.DERIVATIVES_ENABLED:
+        return {}
+    formats = derivative_formats()
+    if image is None:
+        with Image.open(storage.local_path(source_path)) as source:
+            image = source.copy()
+
+    widths = rendition_widths()
+    current = image
+    for rendition in RENDITIONS:
+        width = min(widths[rendition], current.width)
+        height = max(1, round(current.height * width / current.width))
+        # reducing_gap: fast integer downscale first, then LANCZOS for the last step
+        current = current.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for fmt in formats:
+            key = derivative_path(source_path, rendition, fmt)
+            path = storage.writable_path(key)
+            tmp_path = f"{path}.tmp"
+            # method 4: WebP encoder speed/size trade-off (6 = slowest)
+            current.save(tmp_path, FORMATS[fmt], quality=settings.DERIVATIVE_QUALITY, method=4)
+            os.replace(tmp_path, path)  # Listings may already point at it: never expose a partial file
+            storage.commit(key, f"image/{fmt}")
+    return derivative_urls(source_path)
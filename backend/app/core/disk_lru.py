@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class DiskLRU:
+    """
+    Size-bounded LRU index of the files under a directory, shared by the local disk caches
+    (preprocess cache, storage cache, debug artifacts). Keys are paths relative to `root`.
+
+    The index is rebuilt from the directory on first use, oldest first by `clock` ("mtime" or
+    "atime"), so it survives restarts. Callers write files themselves (atomically), then `add`
+    them; entries beyond `max_bytes` or older than `max_age_seconds` are removed, newest kept.
+    """
+    def __init__(self, root: str, max_bytes: int, suffix: Optional[str] = None, recursive: bool = False,
+                 clock: str = "mtime", max_age_seconds: Optional[float] = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.recursive = recursive
+        self.clock = clock
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._index = None  # key -> (last use, size), least recently used first
+        self._total_bytes = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._load_index()
+            return self._total_bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load_index())
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._load_index()
+
+    def touch(self, key: str) -> bool:
+        """
+        Marks `key` as recently used. Returns whether it is indexed.
+        """
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            if entry is None:
+                return False
+            index[key] = (time.time(), entry[1])
+            index.move_to_end(key)
+        if self.clock == "mtime":
+            try:
+                # mtime doubles as the LRU clock when the index is rebuilt
+                os.utime(self.path(key))
+            except OSError:
+                pass
+        return True
+
+    def add(self, key: str, size: Optional[int] = None) -> int:
+        """
+        Indexes a file now complete at `path(key)` and evicts beyond the limits.
+        Returns the number of files evicted.
+        """
+        if size is None:
+            size = os.path.getsize(self.path(key))
+        with self._lock:
+            index = self._load_index()
+            self._total_bytes += size - index.pop(key, (0, 0))[1]
+            index[key] = (time.time(), size)
+            return self._evict_locked()
+
+    def discard(self, key: str):
+        with self._lock:
+            self._total_bytes -= self._load_index().pop(key, (0, 0))[1]
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict_locked(self) -> int:
+        expired_before = time.time() - self.max_age_seconds if self.max_age_seconds else None
+        evictions = 0
+        while len(self._index) > 1:
+            key, (last_used, size) = next(iter(self._index.items()))
+            if self._total_bytes <= self.max_bytes and (expired_before is None or last_used >= expired_before):
+                break
+            self._index.popitem(last=False)
+            self._total_bytes -= size
+            evictions += 1
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+        return evictions
+
+    def _load_index(self) -> "OrderedDict[str, Tuple[float, int]]":
+        # Caller holds the lock
+        if self._index is None:
+            os.makedirs(self.root, exist_ok=True)
+            entries = []
+            for directory, _, filenames in self._walk():
+                for filename in filenames:
+                    if filename.endswith(".tmp") or (self.suffix and not filename.endswith(self.suffix)):
+                        continue
+                    path = os.path.join(directory, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    last_used = stat.st_atime if self.clock == "atime" else stat.st_mtime
+                    entries.append((last_used, os.path.relpath(path, self.root).replace("\\", "/"), stat.st_size))
+            entries.sort()
+            self._index = OrderedDict((key, (last_used, size)) for last_used, key, size in entries)
+            self._total_bytes = sum(size for _, size in self._index.values())
+        return self._index
+
+    def _walk(self):
+        if self.recursive:
+            yield from os.walk(self.root)
+        else:
+            yield self.root, [], [entry.name for entry in os.scandir(self.root) if entry.is_file()]
@@ -1,8 +1,127 @@
 from sentence_transformers import SentenceTransformer
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import asyncio
 import logging
+import threading
+import time
+import numpy as np
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+class EmbeddingCache:
+    """
+    Bounded in-process LRU of query embeddings with TTL, backed by an optional
+    shared Redis tier so every API replica benefits from the others' lookups.
+    """
+    def __init__(self):
+        self._entries = OrderedDict()  # key -> (expires_at, embedding list)
+        self._lock = threading.Lock()
+        self._redis = None
+        self._counters = {"hits": 0, "local_hits": 0, "redis_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # all-MiniLM-L6-v2 is uncased and ignores extra whitespace, so this does not change the embedding
+        return " ".join(text.lower().split())
+
+    def get(self, key: str):
+        embedding = self.get_local(key)
+        if embedding is not None:
+            return embedding
+        return self.get_shared(key)
+
+    def get_local(self, key: str):
+        """
+        In-process LRU only: never blocks, safe to call on the event loop.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, embedding = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    self._counters["local_hits"] += 1
+                    return embedding
+                del self._entries[key]
+        return None
+
+    def get_shared(self, key: str):
+        """
+        Redis tier lookup after a local miss (blocking I/O: run it off the event loop).
+        """
+        embedding = self._redis_get(key)
+        with self._lock:
+            if embedding is not None:
+                self._counters["hits"] += 1
+                self._counters["redis_hits"] += 1
+            else:
+                self._counters["misses"] += 1
+        if embedding is not None:
+            self._local_put(key, embedding)
+        return embedding
+
+    def put(self, key: str, embedding):
+        self._local_put(key, embedding)
+        self._redis_put(key, embedding)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["max_size"] = settings.EMBEDDING_CACHE_SIZE
+        return stats
+
+    def _local_put(self, key: str, embedding):
+        if settings.EMBEDDING_CACHE_SIZE <= 0:
+            return
+        expires_at = time.monotonic() + settings.EMBEDDING_CACHE_TTL_SECONDS
+        with self._lock:
+            self._entries[key] = (expires_at, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.EMBEDDING_CACHE_SIZE:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _redis_client(self):
+        if not settings.EMBEDDING_CACHE_REDIS:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.EMBEDDING_CACHE_REDIS_DB)
+        return self._redis
+
+    def _redis_key(self, key: str) -> str:
+        return f"vton:embedding:{key}"
+
+    def _redis_get(self, key: str):
+        try:
+            client = self._redis_client()
+            data = client.get(self._redis_key(key)) if client else None
+            return np.frombuffer(data, dtype=np.float32).tolist() if data else None
+        except Exception as e:
+            logger.warning(f"Embedding cache Redis read failed: {e}")
+            return None
+
+    def _redis_put(self, key: str, embedding):
+        try:
+            client = self._redis_client()
+            if client:
+                data = np.asarray(embedding, dtype=np.float32).tobytes()
+                client.set(self._redis_key(key), data, ex=settings.EMBEDDING_CACHE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Embedding cache Redis write failed: {e}")
+
 class EmbeddingService:
     _instance = None
     _model = None
@@ -11,32 +130,193 @@ class EmbeddingService:
         if cls._instance is None:
             cls._instance = super(EmbeddingService, cls).__new__(cls)
             cls._instance.model_name = "all-MiniLM-L6-v2"
+            cls._instance.cache = EmbeddingCache()
+            # Dedicated pool so encoding never runs on (or starves) the event loop's default executor
+            cls._instance._executor = ThreadPoolExecutor(
+                max_workers=settings.EMBEDDING_EXECUTOR_WORKERS, thread_name_prefix="embedding"
+            )
+            cls._instance._model_lock = threading.Lock()
+            cls._instance._batch_queue = None
+            cls._instance._batch_loop = None
+            cls._instance._batch_tasks = set()
         return cls._instance
 
     @property
     def model(self):
         if self._model is None:
-            logger.info(f"Loading Embedding Model ({self.model_name})...")
-            # Force CPU usage (device='cpu') since these models are small and fast on CPU
-            # This saves GPU memory for the heavy VTON models
-            self._model = SentenceTransformer(self.model_name, device='cpu')
-            logger.info("Embedding Model Loaded.")
+            with self._model_lock:
+                if self._model is None:
+                    logger.info(f"Loading Embedding Model ({self.model_name})...")
+                    # Force CPU usage (device='cpu') since these models are small and fast on CPU
+                    # This saves GPU memory for the heavy VTON models
+                    self._model = SentenceTransformer(self.model_name, device='cpu')
+                    logger.info("Embedding Model Loaded.")
         return self._model
 
+    def _encode(self, keys: List[str]) -> List[list]:
+        """
+        One model.encode call for already-normalized texts; results are cached.
+        """
+        # Encode returns numpy array, convert to list for PGVector/JSON compatibility
+        # normalize_embeddings=True makes cosine similarity == dot product (better for valid search)
+        embeddings = [e.tolist() for e in self.model.encode(keys, normalize_embeddings=True)]
+        for key, embedding in zip(keys, embeddings):
+            self.cache.put(key, embedding)
+        return embeddings
+
+    def _encode_one(self, key: str):
+        try:
+            return self._encode([key])[0]
+        except Exception as e:
+            logger.error(f"Failed to generate embedding: {e}")
+            return None
+
+    def _resolve(self, keys: List[str]) -> List[list]:
+        """
+        Shared cache tier first, then one encode call for the remaining keys.
+        Runs on the embedding executor so Redis round trips stay off the event loop.
+        """
+        resolved = {}
+        for key in keys:
+            embedding = self.cache.get_shared(key)
+            if embedding is not None:
+                resolved[key] = embedding
+        missing = [key for key in keys if key not in resolved]
+        if missing:
+            resolved.update(zip(missing, self._encode(missing)))
+        return [resolved[key] for key in keys]
+
+    def _resolve_one(self, key: str):
+        try:
+            return self._resolve([key])[0]
+        except Exception as e:
+            logger.error(f"Failed to generate embedding: {e}")
+            return None
+
     def generate_embedding(self, text: str):
         """
         Generates a 384-dimensional embedding for the given text.
+        Repeated texts (e.g. popular search queries) are served from the cache.
+        Blocking: from async code use `agenerate_embedding`.
+        """
+        if not text:
+            return None
+
+        key = self.cache.normalize(text)
+        if not key:
+            return None
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        return self._encode_one(key)
+
+    def generate_embeddings(self, texts: List[str]) -> List[Optional[list]]:
+        """
+        Batched variant of `generate_embedding`: every cache miss is encoded in a single forward pass.
+        Returns one embedding (or None for empty text / failure) per input, in order.
+        """
+        results: List[Optional[list]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        for index, text in enumerate(texts):
+            key = self.cache.normalize(text) if text else ""
+            if not key:
+                continue
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                missing.setdefault(key, []).append(index)
+
+        if missing:
+            keys = list(missing)
+            try:
+                for key, embedding in zip(keys, self._encode(keys)):
+                    for index in missing[key]:
+                        results[index] = embedding
+            except Exception as e:
+                logger.error(f"Failed to generate embeddings for batch of {len(keys)}: {e}")
+        return results
+
+    async def agenerate_embedding(self, text: str):
+        """
+        Awaitable `generate_embedding`. In-process cache hits return immediately; the Redis tier
+        and encoding run on the embedding thread pool, micro-batched with concurrent requests when enabled.
         """
         if not text:
             return None
-            
+
+        key = self.cache.normalize(text)
+        if not key:
+            return None
+
+        cached = self.cache.get_local(key)
+        if cached is not None:
+            return cached
+
+        if settings.EMBEDDING_MICRO_BATCHING:
+            return await self._submit_to_batch(key)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._resolve_one, key)
+
+    async def agenerate_embeddings(self, texts: List[str]) -> List[Optional[list]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.generate_embeddings, texts)
+
+    async def _submit_to_batch(self, key: str):
+        loop = asyncio.get_running_loop()
+        if self._batch_queue is None or self._batch_loop is not loop:
+            self._batch_loop = loop
+            self._batch_queue = asyncio.Queue()
+            self._track(loop.create_task(self._collect_batches(self._batch_queue)))
+
+        future = loop.create_future()
+        self._batch_queue.put_nowait((key, future))
+        return await future
+
+    async def _collect_batches(self, queue: asyncio.Queue):
+        """
+        Gathers requests arriving within EMBEDDING_BATCH_WINDOW_MS (up to EMBEDDING_BATCH_MAX_SIZE)
+        into one encode call. Batches are dispatched without waiting, bounded by the executor size.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + settings.EMBEDDING_BATCH_WINDOW_MS / 1000
+            while len(batch) < settings.EMBEDDING_BATCH_MAX_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._track(loop.create_task(self._run_batch(batch)))
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        keys = list(dict.fromkeys(key for key, _ in batch))
         try:
-            # Encode returns numpy array, convert to list for PGVector/JSON compatibility
-            # normalize_embeddings=True makes cosine similarity == dot product (better for valid search)
-            embedding = self.model.encode(text, normalize_embeddings=True)
-            return embedding.tolist()
+            embeddings = await loop.run_in_executor(self._executor, self._resolve, keys)
+            by_key = dict(zip(keys, embeddings))
         except Exception as e:
-            logger.error(f"Failed to generate embedding: {e}")
-            return None
+            logger.error(f"Failed to generate embeddings for batch of {len(keys)}: {e}")
+            by_key = {}
+
+        for key, future in batch:
+            if not future.done():
+                future.set_result(by_key.get(key))
+
+    def _track(self, task: asyncio.Task):
+        # Keep a strong reference so pending tasks are not garbage collected
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    def shutdown(self):
+        for task in list(self._batch_tasks):
+            task.cancel()
+        self._batch_queue = None
+        self._batch_loop = None
+        self._executor.shutdown(wait=False)
 
 embedding_service = EmbeddingService()
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class GarmentCache:
+    """
+    Read-through cache of garment records (processed path, metadata, embedding presence).
+
+    - Records: in-process LRU (short TTL) in front of a shared Redis tier, loaded from Postgres
+      on a miss. Writers call `invalidate` after committing, which drops the Redis entries and
+      bumps the catalog version.
+    - Listings: the catalog version identifies the current catalog, so `GET /ingestion/garments`
+      serves an ETag and reuses serialized listings until the next invalidation.
+    Without Redis, records are cached per process only and listings are always rebuilt.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(GarmentCache, cls).__new__(cls)
+            cls._instance._records = OrderedDict()   # garment id -> (expires_at, record)
+            cls._instance._listings = OrderedDict()  # (catalog version, listing key) -> response body
+            cls._instance._lock = threading.Lock()
+            cls._instance._redis = None
+            cls._instance._counters = {"hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0, "listing_hits": 0}
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return settings.GARMENT_CACHE_ENABLED
+
+    # --- Records ---
+
+    def get(self, garment_id: str) -> Optional[Dict[str, Any]]:
+        """
+        {"id", "processed_image_path", "metadata", "has_embedding"}, or None if the garment does not exist.
+        """
+        return self.get_many([garment_id]).get(str(garment_id))
+
+    def get_many(self, garment_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Records by id; unknown ids are left out. All misses are loaded in one query.
+        """
+        ids = list(dict.fromkeys(str(g) for g in garment_ids))
+        if not self.enabled:
+            return self._load(ids)
+
+        records, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for garment_id in ids:
+                entry = self._records.get(garment_id)
+                if entry is not None and entry[0] > now:
+                    self._records.move_to_end(garment_id)
+                    records[garment_id] = entry[1]
+                    self._counters["hits"] += 1
+                else:
+                    missing.append(garment_id)
+
+        if missing:
+            from_redis = self._redis_get(missing)
+            with self._lock:
+                self._counters["redis_hits"] += len(from_redis)
+                self._counters["misses"] += len(missing) - len(from_redis)
+            version = self.catalog_version()
+            loaded = self._load([g for g in missing if g not in from_redis])
+            self._redis_put(loaded, version)
+            for record in list(from_redis.values()) + list(loaded.values()):
+                self._local_put(record)
+            records.update(from_redis)
+            records.update(loaded)
+        return records
+
+    def invalidate(self, *garment_ids: str):
+        """
+        Call after committing a change to these garments (path, metadata or embedding).
+        """
+        ids = [str(g) for g in garment_ids]
+        with self._lock:
+            for garment_id in ids:
+                self._records.pop(garment_id, None)
+            self._counters["invalidations"] += len(ids)
+        client = self._client()
+        if client is None or not ids:
+            return
+        try:
+            pipe = client.pipeline()
+            pipe.delete(*(self._record_key(g) for g in ids))
+            pipe.incr(self._version_key())
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Garment cache invalidation failed: {e}")
+
+    # --- Listings ---
+
+    def catalog_version(self) -> Optional[int]:
+        """
+        Current catalog version, or None when it can't be tracked (cache disabled / Redis down).
+        """
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            return int(client.get(self._version_key()) or 0)
+        except Exception as e:
+            logger.warning(f"Garment cache version read failed: {e}")
+            return None
+
+    @staticmethod
+    def listing_etag(version: Optional[int], key: str, body: Any = None) -> str:
+        """
+        Strong ETag from the catalog version and the listing `key` (its request parameters),
+        or weak (body hash) when the version is unknown.
+        """
+        if version is not None:
+            digest = hashlib.sha256(json.dumps([version, key]).encode()).hexdigest()[:32]
+            return f'"{digest}"'
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()[:32]
+        return f'W/"{digest}"'
+
+    def get_listing(self, version: int, key: str) -> Any:
+        with self._lock:
+            body = self._listings.get((version, key))
+            if body is not None:
+                self._listings.move_to_end((version, key))
+                self._counters["listing_hits"] += 1
+            return body
+
+    def put_listing(self, version: int, key: str, body: Any):
+        if settings.GARMENT_LISTING_CACHE_SIZE <= 0:
+            return
+        with self._lock:
+            self._listings[(version, key)] = body
+            self._listings.move_to_end((version, key))
+            while len(self._listings) > settings.GARMENT_LISTING_CACHE_SIZE:
+                self._listings.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["records"] = len(self._records)
+            stats["listings"] = len(self._listings)
+        return stats
+
+    # --- Internals ---
+
+    def _load(self, garment_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not garment_ids:
+            return {}
+        from uuid import UUID
+        from app.db.session import worker_session
+        from app.models.garment import Garment
+
+        uuids = []
+        for garment_id in garment_ids:
+            try:
+                uuids.append(UUID(garment_id))
+            except ValueError:
+                pass
+        if not uuids:
+            return {}
+        # Projection: the embedding itself is never loaded
+        with worker_session() as db:
+            rows = db.query(
+                Garment.id, Garment.processed_image_path, Garment.metadata_json,
+                Garment.embedding.isnot(None).label("has_embedding")
+            ).filter(Garment.id.in_(uuids)).all()
+        return {
+            str(row.id): {
+                "id": str(row.id),
+                "processed_image_path": row.processed_image_path,
+                "metadata": row.metadata_json,
+                "has_embedding": bool(row.has_embedding),
+            }
+            for row in rows
+        }
+
+    def _local_put(self, record: Dict[str, Any]):
+        if settings.GARMENT_CACHE_SIZE <= 0:
+            return
+        expires_at = time.monotonic() + settings.GARMENT_CACHE_LOCAL_TTL_SECONDS
+        with self._lock:
+            self._records[record["id"]] = (expires_at, record)
+            self._records.move_to_end(record["id"])
+            while len(self._records) > settings.GARMENT_CACHE_SIZE:
+                self._records.popitem(last=False)
+
+    def _redis_get(self, garment_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        client = self._client()
+        if client is None:
+            return {}
+        try:
+            values = client.mget([self._record_key(g) for g in garment_ids])
+            return {g: json.loads(v) for g, v in zip(garment_ids, values) if v is not None}
+        except Exception as e:
+            logger.warning(f"Garment cache Redis read failed: {e}")
+            return {}
+
+    def _redis_put(self, records: Dict[str, Dict[str, Any]], version: Optional[int]):
+        """
+        Shares loaded records, unless the catalog changed since `version` was read: the rows may
+        predate an invalidation that already ran, and must not outlive it in Redis.
+        """
+        client = self._client()
+        if client is None or not records or version is None:
+            return
+        import redis
+        try:
+            with client.pipeline() as pipe:
+                pipe.watch(self._version_key())
+                if int(pipe.get(self._version_key()) or 0) != version:
+                    return
+                pipe.multi()
+                for garment_id, record in records.items():
+                    pipe.set(self._record_key(garment_id), json.dumps(record), ex=settings.GARMENT_CACHE_REDIS_TTL_SECONDS)
+                pipe.execute()
+        except redis.WatchError:
+            pass
+        except Exception as e:
+            logger.warning(f"Garment cache Redis write failed: {e}")
+
+    def _client(self):
+        if not self.enabled:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.GARMENT_CACHE_REDIS_DB)
+        return self._redis
+
+    def _record_key(self, garment_id: str) -> str:
+        return f"vton:garment:{garment_id}"
+
+    def _version_key(self) -> str:
+        return "vton:garments:version"
+
+
+garment_cache = GarmentCache()
@@ -0,0 +1,198 @@
+import logging
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, start_http_server
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds: from sub-millisecond DB updates to multi-minute CPU try-ons
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+STEP_BUCKETS = (0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "vton_stage_duration_seconds",
+    "Duration of pipeline and task stages",
+    ["component", "stage"],
+    buckets=DURATION_BUCKETS,
+)
+DIFFUSION_STEP_SECONDS = Histogram(
+    "vton_diffusion_step_seconds",
+    "Duration of one denoising step (whole batch)",
+    ["profile", "batch_size"],
+    buckets=STEP_BUCKETS,
+)
+TASK_SECONDS = Histogram(
+    "vton_task_duration_seconds",
+    "Celery task duration",
+    ["task", "state"],
+    buckets=DURATION_BUCKETS,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "vton_http_request_duration_seconds",
+    "API request latency",
+    ["method", "route", "status"],
+    buckets=DURATION_BUCKETS,
+)
+MEMORY_HIGH_WATER_BYTES = Gauge(
+    "vton_memory_high_water_bytes",
+    "Process lifetime memory high-water mark",
+    ["kind"],  # cpu_rss, gpu_allocated, gpu_reserved
+)
+TASK_GPU_PEAK_BYTES = Histogram(
+    "vton_task_gpu_memory_peak_bytes",
+    "Peak GPU memory allocated during a task",
+    ["task"],
+    buckets=tuple(2 ** 30 * n for n in (0.25, 0.5, 1, 2, 3, 4, 6, 8, 12, 16, 24, 48, 80)),
+)
+REMBG_CUTOUTS = Counter(
+    "vton_rembg_cutouts_total",
+    "Background removals by cutout mode (naive = alpha matting skipped)",
+    ["mode"],  # matting, naive
+)
+REMBG_EDGE_UNCERTAINTY = Histogram(
+    "vton_rembg_edge_uncertainty",
+    "Mask edge uncertainty at model resolution (compare with REMBG_MATTING_EDGE_THRESHOLD)",
+    buckets=(0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0),
+)
+PREPROCESS_CACHE_LOOKUPS = Counter(
+    "vton_preprocess_cache_lookups_total",
+    "Person preprocessing cache lookups",
+    ["kind", "result"],  # result: disk_hit, redis_hit, miss
+)
+PREPROCESS_CACHE_EVICTIONS = Counter(
+    "vton_preprocess_cache_evictions_total",
+    "Preprocessing cache entries evicted from local disk (PREPROCESS_CACHE_MAX_MB)",
+)
+PREPROCESS_CACHE_DISK_BYTES = Gauge(
+    "vton_preprocess_cache_disk_bytes",
+    "Size of the local preprocessing cache",
+    multiprocess_mode="max",  # Worker processes share the directory
+)
+
+# CUDA peak counters are reset per task, so the lifetime maximum is kept here
+_gpu_high_water = {"gpu_allocated": 0, "gpu_reserved": 0}
+
+
+def observe_stage(component: str, stage: str, seconds: float):
+    if settings.METRICS_ENABLED:
+        STAGE_SECONDS.labels(component, stage).observe(seconds)
+
+
+@contextmanager
+def timed(component: str, stage: str):
+    """
+    Times a block into vton_stage_duration_seconds{component, stage} (also when it raises).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(component, stage, time.perf_counter() - start)
+
+
+def observe_diffusion_step(profile: str, batch_size: int, seconds: float):
+    if settings.METRICS_ENABLED:
+        DIFFUSION_STEP_SECONDS.labels(profile, str(batch_size)).observe(seconds)
+
+
+def record_rembg_cutout(matting: bool, edge_uncertainty: float):
+    if settings.METRICS_ENABLED:
+        REMBG_CUTOUTS.labels("matting" if matting else "naive").inc()
+        REMBG_EDGE_UNCERTAINTY.observe(edge_uncertainty)
+
+
+def record_preprocess_cache_lookup(kind: str, result: str):
+    if settings.METRICS_ENABLED:
+        PREPROCESS_CACHE_LOOKUPS.labels(kind, result).inc()
+
+
+def record_preprocess_cache_disk(total_bytes: int, evictions: int = 0):
+    if not settings.METRICS_ENABLED:
+        return
+    PREPROCESS_CACHE_DISK_BYTES.set(total_bytes)
+    if evictions:
+        PREPROCESS_CACHE_EVICTIONS.inc(evictions)
+
+
+def record_memory_high_water(task: Optional[str] = None):
+    """
+    Updates the process high-water gauges. With `task`, also records the GPU peak
+    of that task and resets the CUDA peak counters for the next one.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    MEMORY_HIGH_WATER_BYTES.labels("cpu_rss").set(max_rss if sys.platform == "darwin" else max_rss * 1024)
+
+    torch = sys.modules.get("torch")  # Only processes that already use torch report GPU memory
+    if torch is None or not torch.cuda.is_available():
+        return
+    allocated = torch.cuda.max_memory_allocated()
+    for kind, value in (("gpu_allocated", allocated), ("gpu_reserved", torch.cuda.max_memory_reserved())):
+        _gpu_high_water[kind] = max(_gpu_high_water[kind], value)
+        MEMORY_HIGH_WATER_BYTES.labels(kind).set(_gpu_high_water[kind])
+    if task is not None:
+        TASK_GPU_PEAK_BYTES.labels(task).observe(allocated)
+        torch.cuda.reset_peak_memory_stats()
+
+
+def _registry():
+    """
+    Collects from every process of a multi-process deployment when PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    from prometheus_client import REGISTRY
+    return REGISTRY
+
+
+def render_latest():
+    """
+    (body, content type) of the current metrics, for the API's /metrics endpoint.
+    """
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_worker_metrics_server(prefork: bool = False):
+    """
+    Serves worker metrics on WORKER_METRICS_PORT (the API serves its own on /metrics).
+
+    The server runs in the worker's main process. Under the prefork pool, tasks run in child
+    processes, so their samples only reach it through PROMETHEUS_MULTIPROC_DIR: without it the
+    endpoint would serve the idle parent's registry, and the server is not started.
+    """
+    if not settings.METRICS_ENABLED or settings.WORKER_METRICS_PORT <= 0:
+        return
+    if prefork and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        logger.error(
+            "Worker metrics server not started: the prefork pool needs PROMETHEUS_MULTIPROC_DIR "
+            "(or run the worker with -P solo / threads)"
+        )
+        return
+    try:
+        start_http_server(settings.WORKER_METRICS_PORT, registry=_registry())
+        logger.info(f"Worker metrics on :{settings.WORKER_METRICS_PORT}/metrics")
+    except OSError as e:
+        logger.warning(f"Worker metrics server not started: {e}")
+
+
+def mark_process_dead(pid: Optional[int] = None):
+    """
+    Drops the live gauge samples of an exited process from PROMETHEUS_MULTIPROC_DIR
+    (prefork children are recycled, e.g. by --max-tasks-per-child).
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(pid or os.getpid())
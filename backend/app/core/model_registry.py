@@ -0,0 +1,227 @@
+import gc
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import torch
+
+from app.core.config import settings
+from app.core.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Memory pools a component can be charged against
+POOL_RAM = "ram"
+POOL_VRAM = "vram"
+
+
+def estimate_bytes(obj: Any) -> int:
+    """
+    Best-effort estimate of the memory held by a loaded model object.
+    Understands torch modules, diffusers pipelines (via `.components`)
+    and wrappers exposing `.model` / `.predictor` (Detectron2, DensePose).
+    """
+    if obj is None:
+        return 0
+    if isinstance(obj, torch.nn.Module):
+        tensors = itertools.chain(obj.parameters(), obj.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    components = getattr(obj, "components", None)
+    if isinstance(components, dict):
+        return sum(estimate_bytes(c) for c in components.values())
+
+    for attr in ("predictor", "model"):
+        inner = getattr(obj, attr, None)
+        if inner is not None and inner is not obj:
+            return estimate_bytes(inner)
+    return 0
+
+
+class _Component:
+    def __init__(self, name: str, loader: Callable[[], Any], pool: str,
+                 sizer: Callable[[Any], int], unloader: Optional[Callable[[Any], None]]):
+        self.name = name
+        self.loader = loader
+        self.pool = pool
+        self.sizer = sizer
+        self.unloader = unloader
+
+        self.obj = None
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.last_load_seconds = 0.0
+        self.total_load_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.obj is not None,
+            "pool": self.pool,
+            "resident_bytes": self.resident_bytes if self.obj is not None else 0,
+            "last_known_bytes": self.resident_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "last_load_seconds": round(self.last_load_seconds, 3),
+            "total_load_seconds": round(self.total_load_seconds, 3),
+        }
+
+
+class ModelRegistry:
+    """
+    Keeps model components resident across tasks.
+    Components are loaded lazily on first `get()` and evicted least-recently-used
+    first when the RAM or VRAM pool they are charged to exceeds its budget.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ModelRegistry, cls).__new__(cls)
+            cls._instance._components = {}
+            cls._instance._lru = OrderedDict()  # Loaded component names, oldest first
+            cls._instance._lock = threading.RLock()
+        return cls._instance
+
+    def register(self, name: str, loader: Callable[[], Any], pool: str = POOL_RAM,
+                 sizer: Callable[[Any], int] = estimate_bytes,
+                 unloader: Optional[Callable[[Any], None]] = None):
+        """
+        Declares a component. Re-registering an existing name keeps its stats
+        and any resident instance.
+        """
+        if pool not in (POOL_RAM, POOL_VRAM):
+            raise ValueError(f"Unknown memory pool: {pool}")
+        with self._lock:
+            existing = self._components.get(name)
+            if existing is not None:
+                existing.loader, existing.pool = loader, pool
+                existing.sizer, existing.unloader = sizer, unloader
+                return
+            self._components[name] = _Component(name, loader, pool, sizer, unloader)
+
+    def budget_bytes(self, pool: str) -> int:
+        """0 means unlimited."""
+        budget_mb = settings.MODEL_REGISTRY_VRAM_BUDGET_MB if pool == POOL_VRAM else settings.MODEL_REGISTRY_RAM_BUDGET_MB
+        return max(budget_mb, 0) * 1024 * 1024
+
+    def resident_bytes(self, pool: str) -> int:
+        with self._lock:
+            return sum(self._components[n].resident_bytes for n in self._lru if self._components[n].pool == pool)
+
+    def is_loaded(self, name: str) -> bool:
+        with self._lock:
+            return name in self._lru
+
+    def get(self, name: str) -> Any:
+        with self._lock:
+            component = self._components.get(name)
+            if component is None:
+                raise KeyError(f"Model component '{name}' is not registered")
+
+            if component.obj is not None:
+                component.hits += 1
+                self._lru.move_to_end(name)
+                return component.obj
+
+            component.misses += 1
+            # Size from a previous load (if any) lets us make room before loading
+            self._make_room(component.pool, component.resident_bytes, keep=name)
+
+            logger.info(f"Loading model component '{name}'...")
+            start = time.perf_counter()
+            obj = component.loader()
+            elapsed = time.perf_counter() - start
+
+            component.obj = obj
+            component.last_load_seconds = elapsed
+            observe_stage("model_load", name, elapsed)
+            component.total_load_seconds += elapsed
+            try:
+                component.resident_bytes = int(component.sizer(obj))
+            except Exception as e:
+                logger.warning(f"Could not size model component '{name}': {e}")
+                component.resident_bytes = 0
+            self._lru[name] = None
+            self._lru.move_to_end(name)
+
+            logger.info(
+                f"Loaded '{name}' in {elapsed:.2f}s "
+                f"({component.resident_bytes / 1024 / 1024:.0f} MB, pool={component.pool})"
+            )
+            self._make_room(component.pool, 0, keep=name)
+            return obj
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            evicted = self._evict_locked(name)
+        if evicted:
+            self._free_memory()
+        return evicted
+
+    def evict_all(self):
+        with self._lock:
+            for name in list(self._lru):
+                self._evict_locked(name)
+        self._free_memory()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "components": {name: c.stats() for name, c in self._components.items()},
+                "pools": {
+                    pool: {"resident_bytes": self.resident_bytes(pool), "budget_bytes": self.budget_bytes(pool)}
+                    for pool in (POOL_RAM, POOL_VRAM)
+                },
+            }
+
+    def _make_room(self, pool: str, incoming_bytes: int, keep: str):
+        budget = self.budget_bytes(pool)
+        if not budget:
+            return
+
+        evicted_any = False
+        while self.resident_bytes(pool) + incoming_bytes > budget:
+            victim = next(
+                (n for n in self._lru if n != keep and self._components[n].pool == pool),
+                None,
+            )
+            if victim is None:
+                # A single component larger than the budget is still allowed to load
+                break
+            logger.info(f"Evicting '{victim}' to stay within the {pool} budget")
+            self._evict_locked(victim)
+            evicted_any = True
+
+        if evicted_any:
+            self._free_memory()
+
+    def _evict_locked(self, name: str) -> bool:
+        if name not in self._lru:
+            return False
+        component = self._components[name]
+        obj, component.obj = component.obj, None
+        del self._lru[name]
+        component.evictions += 1
+
+        if component.unloader is not None:
+            try:
+                component.unloader(obj)
+            except Exception as e:
+                logger.warning(f"Unloader for '{name}' failed: {e}")
+        del obj
+        return True
+
+    def _free_memory(self):
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+            torch.cuda.ipc_collect()
+
+
+model_registry = ModelRegistry()
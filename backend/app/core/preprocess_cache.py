@@ -0,0 +1,173 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.disk_lru import DiskLRU
+
+logger = logging.getLogger(__name__)
+
+
+class PreprocessCache:
+    """
+    Content-addressed cache for person-side preprocessing outputs
+    (cloth mask, DensePose map), keyed by a hash of the normalized person image.
+
+    Tier 1 is local disk with LRU eviction under PREPROCESS_CACHE_MAX_MB.
+    Tier 2 (optional) is Redis, shared by every worker.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(PreprocessCache, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._disk = DiskLRU(settings.PREPROCESS_CACHE_DIR, settings.PREPROCESS_CACHE_MAX_MB * 1024 * 1024, suffix=".png")
+            cls._instance._redis = None
+            cls._instance._counters = {"hits": 0, "disk_hits": 0, "redis_hits": 0, "misses": 0, "evictions": 0}
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PREPROCESS_CACHE_ENABLED
+
+    @staticmethod
+    def key_for(image: Image.Image) -> str:
+        """
+        Hash of the decoded pixels (not the uploaded bytes), so re-encoded or
+        re-uploaded copies of the same selfie share an entry.
+        """
+        pixels = np.asarray(image)
+        digest = hashlib.sha256()
+        digest.update(f"{image.mode}:{pixels.shape}".encode())
+        digest.update(pixels.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str, kind: str) -> Optional[Image.Image]:
+        if not self.enabled:
+            return None
+
+        image = self._disk_get(key, kind)
+        if image is not None:
+            self._count("hits", "disk_hits")
+            metrics.record_preprocess_cache_lookup(kind, "disk_hit")
+            return image
+
+        data = self._redis_get(key, kind)
+        if data is not None:
+            try:
+                image = self._decode(data)
+                # Promote to local disk so the next lookup is served locally
+                self._disk_put(key, kind, data)
+                self._count("hits", "redis_hits")
+                metrics.record_preprocess_cache_lookup(kind, "redis_hit")
+                return image
+            except Exception as e:
+                logger.warning(f"Corrupt preprocess cache entry in Redis ({key[:12]}/{kind}): {e}")
+
+        self._count("misses")
+        metrics.record_preprocess_cache_lookup(kind, "miss")
+        return None
+
+    def put(self, key: str, kind: str, image: Image.Image):
+        if not self.enabled:
+            return
+        try:
+            buffer = io.BytesIO()
+            # Lossless, but favour speed over size
+            image.save(buffer, format="PNG", compress_level=1)
+            data = buffer.getvalue()
+            self._disk_put(key, kind, data)
+            self._redis_put(key, kind, data)
+        except Exception as e:
+            logger.warning(f"Failed to write preprocess cache entry ({key[:12]}/{kind}): {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        entries, total_bytes = len(self._disk), self._disk.total_bytes
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = round(counters["hits"] / lookups, 4) if lookups else 0.0
+        counters["entries"] = entries
+        counters["disk_bytes"] = total_bytes
+        counters["max_bytes"] = settings.PREPROCESS_CACHE_MAX_MB * 1024 * 1024
+        return counters
+
+    # --- Disk tier ---
+
+    def _filename(self, key: str, kind: str) -> str:
+        return f"{key}_{kind}.png"
+
+    def _disk_get(self, key: str, kind: str) -> Optional[Image.Image]:
+        filename = self._filename(key, kind)
+        try:
+            image = Image.open(self._disk.path(filename))
+            image.load()
+        except (FileNotFoundError, OSError):
+            return None
+        self._disk.touch(filename)
+        return image
+
+    def _disk_put(self, key: str, kind: str, data: bytes):
+        filename = self._filename(key, kind)
+        path = self._disk.path(filename)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # Atomic, readers never see partial files
+
+        evictions = self._disk.add(filename, len(data))
+        with self._lock:
+            self._counters["evictions"] += evictions
+        metrics.record_preprocess_cache_disk(self._disk.total_bytes, evictions)
+
+    # --- Redis tier ---
+
+    def _redis_client(self):
+        if not settings.PREPROCESS_CACHE_REDIS:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.PREPROCESS_CACHE_REDIS_DB)
+        return self._redis
+
+    def _redis_key(self, key: str, kind: str) -> str:
+        return f"vton:preprocess:{kind}:{key}"
+
+    def _redis_get(self, key: str, kind: str) -> Optional[bytes]:
+        try:
+            client = self._redis_client()
+            return client.get(self._redis_key(key, kind)) if client else None
+        except Exception as e:
+            logger.warning(f"Preprocess cache Redis read failed: {e}")
+            return None
+
+    def _redis_put(self, key: str, kind: str, data: bytes):
+        try:
+            client = self._redis_client()
+            if client:
+                client.set(self._redis_key(key, kind), data, ex=settings.PREPROCESS_CACHE_REDIS_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Preprocess cache Redis write failed: {e}")
+
+    @staticmethod
+    def _decode(data: bytes) -> Image.Image:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image
+
+    def _count(self, *names: str):
+        with self._lock:
+            for name in names:
+                self._counters[name] += 1
+
+
+preprocess_cache = PreprocessCache()
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Terminal event statuses: the stream closes after sending one of these
+# ("timeout": the API gave up waiting; the client can still poll /status/{task_id})
+TERMINAL_STATUSES = {"completed", "failed", "timeout"}
+
+_sync_client = None
+
+
+def _channel(task_id: str) -> str:
+    return f"vton:progress:{task_id}"
+
+
+def _state_key(task_id: str) -> str:
+    return f"vton:progress:last:{task_id}"
+
+
+def _client():
+    global _sync_client
+    if _sync_client is None:
+        import redis
+        _sync_client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.PROGRESS_REDIS_DB)
+    return _sync_client
+
+
+def publish_progress(task_id: Optional[str], status: str, **fields: Any):
+    """
+    Publishes a progress event for a task (worker side).
+    The latest event is also stored so clients connecting mid-task get the current state.
+    Failures are logged and never interrupt the task.
+    """
+    if not task_id:
+        return
+    event = {"task_id": task_id, "status": status, "ts": time.time(), **fields}
+    try:
+        payload = json.dumps(event)
+        client = _client()
+        pipe = client.pipeline()
+        pipe.set(_state_key(task_id), payload, ex=settings.PROGRESS_EVENT_TTL_SECONDS)
+        pipe.publish(_channel(task_id), payload)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to publish progress for {task_id}: {e}")
+
+
+class ProgressHub:
+    """
+    One Redis pub/sub connection per API process (pattern subscription on every progress channel),
+    fanning events out to the per-task queues of the connected SSE clients.
+    Client count therefore never multiplies Redis connections.
+    """
+    def __init__(self):
+        self._client = None
+        self._reader = None
+        self._loop = None
+        self._ready = None  # Set while the pattern subscription is active
+        self._queues: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def subscribe(self, task_id: str) -> asyncio.Queue:
+        self._ensure_reader()
+        queue = asyncio.Queue()
+        self._queues.setdefault(task_id, set()).add(queue)
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=5.0)
+        except asyncio.TimeoutError:
+            logger.warning("Progress subscriber not connected yet; relying on the stored state")
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        queues = self._queues.get(task_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._queues[task_id]
+
+    async def last_event(self, task_id: str) -> Optional[Dict[str, Any]]:
+        self._ensure_reader()
+        last = await self._client.get(_state_key(task_id))
+        return json.loads(last) if last is not None else None
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = self._reader = self._loop = self._ready = None
+
+    def _ensure_reader(self):
+        loop = asyncio.get_running_loop()
+        if self._reader is not None and self._loop is loop and not self._reader.done():
+            return
+        import redis.asyncio as aioredis
+        if self._client is None or self._loop is not loop:
+            self._client = aioredis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.PROGRESS_REDIS_DB)
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._reader = loop.create_task(self._read())
+
+    async def _read(self):
+        prefix = _channel("")
+        while True:
+            pubsub = self._client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{prefix}*")
+                self._ready.set()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    task_id = message["channel"].decode()[len(prefix):]
+                    queues = self._queues.get(task_id)
+                    if queues:
+                        event = json.loads(message["data"])
+                        for queue in list(queues):
+                            queue.put_nowait(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Clients fall back to the result backend while disconnected (see the SSE endpoint)
+                logger.warning(f"Progress subscriber lost its Redis connection: {e}")
+                self._ready.clear()
+                await asyncio.sleep(1.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+
+progress_hub = ProgressHub()
+
+
+async def stream_progress(task_id: str, heartbeat_seconds: float = 15.0) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yields progress events for a task until a terminal event (API side).
+    Yields None as a heartbeat when nothing happened for `heartbeat_seconds`.
+    Ends with a "timeout" event after PROGRESS_STREAM_IDLE_SECONDS without events, or once the stream
+    has been open PROGRESS_STREAM_MAX_SECONDS (e.g. unknown or expired task ids, which stay PENDING).
+    """
+    loop = asyncio.get_running_loop()
+    started = last_activity = loop.time()
+    # Subscribe before reading the stored state so no event falls in between
+    queue = await progress_hub.subscribe(task_id)
+    try:
+        event = await progress_hub.last_event(task_id)
+        if event is not None:
+            yield event
+            if event.get("status") in TERMINAL_STATUSES:
+                return
+
+        while True:
+            now = loop.time()
+            if now - last_activity >= settings.PROGRESS_STREAM_IDLE_SECONDS or now - started >= settings.PROGRESS_STREAM_MAX_SECONDS:
+                yield {"task_id": task_id, "status": "timeout", "ts": time.time()}
+                return
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            last_activity = loop.time()
+            yield event
+            if event.get("status") in TERMINAL_STATUSES:
+                return
+    finally:
+        progress_hub.unsubscribe(task_id, queue)
@@ -0,0 +1,146 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Select, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.garment import Garment
+
+# pgvector caps hnsw.ef_search at 1000
+HNSW_EF_SEARCH_MAX = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        payload["id"] = uuid.UUID(payload["id"])
+        payload["n"] = max(0, int(payload.get("n", 0)))
+        return payload
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+
+
+def build_search_query(
+    embedding: Optional[List[float]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> Tuple[Select, Dict[str, Any]]:
+    """
+    The search statement (one row more than `limit`) and the HNSW scan settings to SET LOCAL for it.
+    Shared by the sync and async entry points.
+
+    An HNSW scan only returns about ef_search candidates. The keyset condition and JSONB filters are
+    applied after it, so a deep page or a selective filter would come back short. With
+    SEARCH_HNSW_ITERATIVE_SCAN (pgvector >= 0.8), the scan continues in distance order until the page
+    is full or SEARCH_HNSW_MAX_SCAN_TUPLES tuples were visited. Otherwise ef_search grows with the
+    page depth, up to HNSW_EF_SEARCH_MAX: results past about 1000 rows (fewer with filters) are not reachable.
+    """
+    columns = [Garment.id, Garment.processed_image_path, Garment.metadata_json, Garment.created_at]
+    after = decode_cursor(cursor) if cursor else None
+    scan_settings = {}
+
+    if embedding is not None:
+        distance = Garment.embedding.cosine_distance(embedding)
+        query = select(*columns, distance.label("distance")).where(Garment.embedding.isnot(None))
+        if after is not None:
+            if "d" not in after:
+                raise InvalidCursor("Cursor does not belong to a semantic search")
+            query = query.where(tuple_(distance, Garment.id) > tuple_(after["d"], after["id"]))
+        query = query.order_by(distance, Garment.id)
+
+        # Rows on the previous pages, which the scan walks past again
+        depth = after["n"] if after is not None else 0
+        if settings.SEARCH_HNSW_ITERATIVE_SCAN:
+            scan_settings["hnsw.iterative_scan"] = "strict_order"
+            scan_settings["hnsw.max_scan_tuples"] = max(settings.SEARCH_HNSW_MAX_SCAN_TUPLES, depth + limit + 1)
+            scan_settings["hnsw.ef_search"] = min(HNSW_EF_SEARCH_MAX, max(settings.SEARCH_HNSW_EF_SEARCH, limit + 1))
+        else:
+            scan_settings["hnsw.ef_search"] = min(HNSW_EF_SEARCH_MAX, max(settings.SEARCH_HNSW_EF_SEARCH, depth + limit + 1))
+    else:
+        query = select(*columns)
+        if after is not None:
+            if "c" not in after:
+                raise InvalidCursor("Cursor does not belong to a catalog listing")
+            created_at = datetime.fromisoformat(after["c"])
+            query = query.where(tuple_(Garment.created_at, Garment.id) < tuple_(created_at, after["id"]))
+        query = query.order_by(Garment.created_at.desc(), Garment.id.desc())
+
+    query = query.where(Garment.processed_image_path.isnot(None))
+    if filters:
+        # `@>` is served by the jsonb_path_ops GIN index
+        query = query.where(Garment.metadata_json.contains(filters))
+
+    # Fetch one extra row to know whether another page exists
+    return query.limit(limit + 1), scan_settings
+
+
+def _page(rows: List[Any], limit: int, semantic: bool, cursor: Optional[str]) -> Tuple[List[Any], Optional[str]]:
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if semantic:
+            depth = decode_cursor(cursor)["n"] if cursor else 0
+            next_cursor = encode_cursor({"d": last.distance, "id": str(last.id), "n": depth + limit})
+        else:
+            next_cursor = encode_cursor({"c": last.created_at.isoformat(), "id": str(last.id)})
+    return rows, next_cursor
+
+
+def _scan_statements(scan_settings: Dict[str, Any]) -> List[Any]:
+    return [text(f"SET LOCAL {name} = {value}") for name, value in scan_settings.items()]
+
+
+def search_garments(
+    db: Session,
+    embedding: Optional[List[float]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Hybrid catalog search over processed garments.
+    - `embedding`: rank by cosine distance (HNSW index, vector_cosine_ops).
+    - `filters`: JSONB containment on metadata_json (GIN index), e.g. {"color": "red"}.
+    Without an embedding, results are ordered newest first.
+    Pagination is keyset based: pass the returned cursor to fetch the next page.
+    Returns (rows, next_cursor); rows expose id, processed_image_path, metadata_json, distance.
+    """
+    query, scan_settings = build_search_query(embedding, filters, limit, cursor)
+    for statement in _scan_statements(scan_settings):
+        db.execute(statement)
+    rows = db.execute(query).all()
+    return _page(rows, limit, embedding is not None, cursor)
+
+
+async def asearch_garments(
+    db: AsyncSession,
+    embedding: Optional[List[float]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    search_garments on an AsyncSession (asyncpg).
+    """
+    query, scan_settings = build_search_query(embedding, filters, limit, cursor)
+    for statement in _scan_statements(scan_settings):
+        await db.execute(statement)
+    rows = (await db.execute(query)).all()
+    return _page(rows, limit, embedding is not None, cursor)
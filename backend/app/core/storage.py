@@ -0,0 +1,238 @@
+import logging
+import mimetypes
+import os
+import shutil
+import time
+import uuid
+from typing import BinaryIO, Optional
+
+from app.core.config import settings
+from app.core.disk_lru import DiskLRU
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("local", "s3")
+
+# Copy buffer for streamed writes
+CHUNK_SIZE = 1024 * 1024
+
+
+def guess_content_type(key: str) -> Optional[str]:
+    return mimetypes.guess_type(key)[0]
+
+
+class LocalStorage:
+    """
+    Media on the local filesystem. Keys are the relative paths stored in the DB
+    ("media/raw/<id>.jpg"), resolved against STORAGE_LOCAL_ROOT, and served by the
+    API's /media mount. API and workers must share the directory (e.g. a volume).
+    """
+    name = "local"
+
+    def __init__(self, root: str = "."):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def save_stream(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None):
+        path = self.writable_path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as buffer:
+            shutil.copyfileobj(fileobj, buffer, CHUNK_SIZE)
+        os.replace(tmp_path, path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key: str, expires_seconds: Optional[int] = None) -> str:
+        # Relative to the API origin (served by StaticFiles)
+        return key
+
+    def local_path(self, key: str, required: bool = True) -> Optional[str]:
+        """
+        A readable local file for `key`; None (or FileNotFoundError if `required`) when missing.
+        """
+        path = self._path(key)
+        if os.path.exists(path):
+            return path
+        if required:
+            raise FileNotFoundError(key)
+        return None
+
+    def writable_path(self, key: str) -> str:
+        """
+        Where to write `key` locally; call `commit(key)` once the file is complete.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return path
+
+    def commit(self, key: str, content_type: Optional[str] = None):
+        # Already in place
+        pass
+
+
+class LocalFileCache(DiskLRU):
+    """
+    Size-bounded LRU of downloaded / written objects under a directory, mirroring the key layout.
+    Used by remote backends so hot assets (garments, their embeddings) are read from local disk.
+    """
+    def __init__(self, root: str, max_bytes: int):
+        super().__init__(root, max_bytes, recursive=True, clock="atime")
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path(key)
+        hit = self.touch(key) and os.path.exists(path)
+        with self._lock:
+            self.counters["hits" if hit else "misses"] += 1
+        return path if hit else None
+
+    def add(self, key: str, size: Optional[int] = None) -> int:
+        """
+        Tracks a file that now exists at `path(key)` and evicts beyond the budget.
+        """
+        evictions = super().add(key, size)
+        with self._lock:
+            self.counters["evictions"] += evictions
+        return evictions
+
+
+class S3Storage:
+    """
+    S3-compatible object storage (AWS S3, MinIO, ...). Keys keep the "media/..." layout
+    under STORAGE_S3_PREFIX.
+    - Uploads stream through boto3's managed transfer (multipart above STORAGE_MULTIPART_CHUNK_MB).
+    - Clients download through presigned URLs.
+    - Workers read and write through a local cache (STORAGE_CACHE_DIR, LRU up to STORAGE_CACHE_MAX_MB).
+    """
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, access_key_id: Optional[str] = None,
+                 secret_access_key: Optional[str] = None, cache_dir: str = "media/cache/storage",
+                 cache_max_bytes: int = 2048 * 1024 * 1024):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=Config(signature_version="s3v4", max_pool_connections=settings.STORAGE_S3_MAX_CONNECTIONS),
+        )
+        chunk_size = max(5, settings.STORAGE_MULTIPART_CHUNK_MB) * 1024 * 1024  # S3 minimum part size is 5 MB
+        self._transfer = TransferConfig(multipart_threshold=chunk_size, multipart_chunksize=chunk_size)
+        self.cache = LocalFileCache(cache_dir, cache_max_bytes)
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _extra_args(self, key: str, content_type: Optional[str]) -> Optional[dict]:
+        content_type = content_type or guess_content_type(key)
+        return {"ContentType": content_type} if content_type else None
+
+    def save_stream(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None):
+        # Reads `fileobj` part by part: the upload is never held in memory as a whole
+        self._client.upload_fileobj(
+            fileobj, self.bucket, self._object_key(key),
+            ExtraArgs=self._extra_args(key, content_type), Config=self._transfer
+        )
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str):
+        self._client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        self.cache.discard(key)
+
+    def url(self, key: str, expires_seconds: Optional[int] = None) -> str:
+        return self._client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=expires_seconds or settings.STORAGE_PRESIGN_EXPIRES_SECONDS,
+        )
+
+    def local_path(self, key: str, required: bool = True) -> Optional[str]:
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        from botocore.exceptions import ClientError
+        path = self.cache.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        start = time.perf_counter()
+        try:
+            self._client.download_file(self.bucket, self._object_key(key), tmp_path, Config=self._transfer)
+        except ClientError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                if required:
+                    raise FileNotFoundError(key)
+                return None
+            raise
+        os.replace(tmp_path, path)
+        self.cache.add(key)
+        logger.info(f"Fetched {key} from storage in {time.perf_counter() - start:.2f}s")
+        return path
+
+    def writable_path(self, key: str) -> str:
+        path = self.cache.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def commit(self, key: str, content_type: Optional[str] = None):
+        """
+        Uploads the file written at `writable_path(key)`; it stays in the local cache.
+        """
+        self._client.upload_file(
+            self.cache.path(key), self.bucket, self._object_key(key),
+            ExtraArgs=self._extra_args(key, content_type), Config=self._transfer
+        )
+        self.cache.add(key)
+
+
+def create_storage():
+    """
+    The storage backend selected by STORAGE_BACKEND.
+    """
+    if settings.STORAGE_BACKEND == "s3":
+        if not settings.STORAGE_S3_BUCKET:
+            raise ValueError("STORAGE_BACKEND=s3 requires STORAGE_S3_BUCKET")
+        return S3Storage(
+            bucket=settings.STORAGE_S3_BUCKET,
+            prefix=settings.STORAGE_S3_PREFIX,
+            endpoint_url=settings.STORAGE_S3_ENDPOINT_URL,
+            region=settings.STORAGE_S3_REGION,
+            access_key_id=settings.STORAGE_S3_ACCESS_KEY_ID,
+            secret_access_key=settings.STORAGE_S3_SECRET_ACCESS_KEY,
+            cache_dir=settings.STORAGE_CACHE_DIR,
+            cache_max_bytes=settings.STORAGE_CACHE_MAX_MB * 1024 * 1024,
+        )
+    if settings.STORAGE_BACKEND != "local":
+        raise ValueError(f"Unknown STORAGE_BACKEND '{settings.STORAGE_BACKEND}', expected one of {', '.join(BACKENDS)}")
+    return LocalStorage(settings.STORAGE_LOCAL_ROOT)
+
+
+storage = create_storage()
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+from typing import Optional
+
+from app.core.config import settings
+from app.core.inference_profiles import get_profile
+from app.core.storage import storage
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pipeline changes in a way that alters outputs for identical inputs
+# 2: DensePose control image rasterized as raw I/U/V instead of Visualizer renders
+PIPELINE_VERSION = 2
+
+# Seed used by VTONPipeline.run / run_batch
+GENERATION_SEED = 42
+
+
+class TryOnCache:
+    """
+    Deduplicates try-ons by (person image hash, garment id, generation parameters).
+    - Completed results: key -> result path, so repeated requests return the existing file.
+    - In-flight requests: key -> task id, so concurrent duplicates share one Celery task.
+    Backed by Redis; when Redis is unavailable every request simply runs.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TryOnCache, cls).__new__(cls)
+            cls._instance._redis = None
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return settings.TRYON_CACHE_ENABLED
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def generation_params(profile: Optional[str] = None) -> dict:
+        return {
+            "v": PIPELINE_VERSION,
+            "seed": GENERATION_SEED,
+            "profile": get_profile(profile).cache_params(),  # Scheduler, steps, guidance, LoRA
+            "ip_adapter_scale": settings.VTON_IP_ADAPTER_SCALE,
+            "controlnet_scale": settings.VTON_CONTROLNET_SCALE,
+            "strength": settings.VTON_INFERENCE_STRENGTH,
+            "vae_full_precision": settings.VTON_VAE_FULL_PRECISION,
+            # ONNX / OpenVINO and int8 renders differ from torch ones
+            "backend": settings.VTON_BACKEND,
+            "quantization": settings.VTON_CPU_QUANTIZATION if settings.VTON_BACKEND != "torch" else "none",
+        }
+
+    def key_for(self, person_hash: str, garment_id: str, profile: Optional[str] = None) -> str:
+        payload = {"person": person_hash, "garment": garment_id, **self.generation_params(profile)}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def get_result(self, key: str) -> Optional[str]:
+        """
+        Returns the stored result path, or None (stale entries whose object is gone are dropped).
+        """
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            path = client.get(self._result_key(key))
+            if path is None:
+                return None
+            path = path.decode()
+            if storage.exists(path):
+                return path
+            client.delete(self._result_key(key))
+        except Exception as e:
+            logger.warning(f"Try-on cache read failed: {e}")
+        return None
+
+    def claim(self, key: str, task_id: str) -> Optional[str]:
+        """
+        Registers `task_id` as the in-flight task for `key`.
+        Returns None if the claim succeeded, otherwise the id of the task already running it.
+        """
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            if client.set(self._inflight_key(key), task_id, nx=True, ex=settings.TRYON_INFLIGHT_TTL_SECONDS):
+                return None
+            owner = client.get(self._inflight_key(key))
+            return owner.decode() if owner is not None else None
+        except Exception as e:
+            logger.warning(f"Try-on cache claim failed: {e}")
+            return None
+
+    def release(self, key: str, task_id: str):
+        """
+        Drops the in-flight claim of `task_id` (e.g. its task could not be queued), so identical
+        requests do not join a task that will never run. Claims of other tasks are left alone.
+        """
+        client = self._client()
+        if client is None:
+            return
+        import redis
+        try:
+            with client.pipeline() as pipe:
+                pipe.watch(self._inflight_key(key))
+                owner = pipe.get(self._inflight_key(key))
+                if owner is None or owner.decode() != task_id:
+                    return
+                pipe.multi()
+                pipe.delete(self._inflight_key(key))
+                pipe.execute()
+        except redis.WatchError:
+            pass
+        except Exception as e:
+            logger.warning(f"Try-on cache release failed: {e}")
+
+    def complete(self, key: Optional[str], result: dict):
+        """
+        Worker side: stores a successful result and releases the in-flight claim.
+        Failed results only release the claim so the next request retries.
+        """
+        client = self._client() if key else None
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline()
+            if result.get("status") == "completed" and result.get("result_path"):
+                pipe.set(self._result_key(key), result["result_path"], ex=settings.TRYON_CACHE_TTL_SECONDS)
+            pipe.delete(self._inflight_key(key))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Try-on cache write failed: {e}")
+
+    def _client(self):
+        if not self.enabled:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.TRYON_CACHE_REDIS_DB)
+        return self._redis
+
+    def _result_key(self, key: str) -> str:
+        return f"vton:tryon:result:{key}"
+
+    def _inflight_key(self, key: str) -> str:
+        return f"vton:tryon:inflight:{key}"
+
+
+tryon_cache = TryOnCache()
@@ -1,13 +1,116 @@
-from rembg import remove, new_session
+from rembg import new_session
 import torch
 from diffusers import AutoPipelineForInpainting, UNet2DConditionModel, EulerDiscreteScheduler
 from PIL import Image
 import os
+import time
 import numpy as np
-import io
-import gc
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from app.core.densepose_estimator import DensePoseEstimator
 from app.core.config import settings
+from app.core.model_registry import model_registry, estimate_bytes, POOL_RAM, POOL_VRAM
+from app.core.preprocess_cache import preprocess_cache
+from app.core.inference_profiles import InferenceProfile, SCHEDULERS, get_profile
+from app.core.cpu_backend import EXPORT_SIZE, cpu_backend_from_settings
+from app.core.debug_artifacts import debug_artifacts, derived_path
+from app.core.metrics import observe_diffusion_step, observe_stage, timed
+
+def _onnx_session_bytes(session) -> int:
+    """
+    rembg sessions wrap an ONNX Runtime session; use the model file size as
+    the resident size estimate.
+    """
+    try:
+        model_path = os.path.join(session.u2net_home(), f"{session.name()}.onnx")
+        return os.path.getsize(model_path)
+    except Exception:
+        return 0
+
+def ip_embeds_path(garment_image_path: str) -> str:
+    """
+    Location of the precomputed IP-Adapter embeddings for a processed garment image.
+    """
+    return f"{os.path.splitext(garment_image_path)[0]}_ip_embeds.pt"
+
+PROMPT = "model wearing this garment, best quality, photorealistic, accurate colors, good anatomy, high detail, high resolution"
+NEGATIVE_PROMPT = "low-resolution, bad anatomy, worst quality, low quality"
+NUM_INFERENCE_STEPS = 30  # Fallback only: the step count comes from the inference profile
+
+# Preprocess cache kind of the DensePose control image (raw I/U/V since format 1); bump when its format changes
+DENSEPOSE_CACHE_KIND = "densepose_iuv1"
+
+# progress_callback(stage, step, total_steps), e.g. ("diffusion", 12, 29)
+ProgressCallback = Callable[[str, int, int], None]
+
+def _report(progress_callback: Optional[ProgressCallback], stage: str, step: int = 0, total_steps: int = 0):
+    if progress_callback is None:
+        return
+    try:
+        progress_callback(stage, step, total_steps)
+    except Exception as e:
+        # Progress reporting must never break inference
+        print(f"Progress callback failed: {e}")
+
+# preview_callback(step, total_steps, image): low-res approximation of the in-progress result
+PreviewCallback = Callable[[int, int, Image.Image], None]
+
+# Linear latent -> RGB projection for SD 1.x latents: a cheap preview without running the VAE
+LATENT_RGB_FACTORS = torch.tensor([
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177],
+])
+
+def latents_to_previews(latents: torch.Tensor) -> List[Image.Image]:
+    """
+    Approximate-decodes a (batch, 4, h, w) latent tensor into one RGB image per sample,
+    at twice the latent resolution (e.g. 192x256 for a 768x1024 try-on).
+    """
+    factors = LATENT_RGB_FACTORS.to(device=latents.device, dtype=torch.float32)
+    rgb = torch.einsum("bchw,cr->bhwr", latents.float(), factors)
+    rgb = ((rgb + 1.0) / 2.0).clamp(0, 1).mul(255).to(torch.uint8).cpu().numpy()
+    return [
+        Image.fromarray(sample).resize((sample.shape[1] * 2, sample.shape[0] * 2), Image.Resampling.BILINEAR)
+        for sample in rgb
+    ]
+
+def _diffusion_step_callback(progress_callback: Optional[ProgressCallback],
+                             preview_callbacks: Optional[List[Optional[PreviewCallback]]] = None,
+                             profile: str = "", batch_size: int = 1):
+    """
+    Adapts a ProgressCallback (and optional per-sample PreviewCallbacks) to diffusers' callback_on_step_end.
+    Previews are produced every VTON_PREVIEW_EVERY_N_STEPS steps.
+    Also times each denoising step; `on_step_end.last_step_end` marks where the VAE decode starts.
+    """
+    preview_every = settings.VTON_PREVIEW_EVERY_N_STEPS
+    previews_enabled = preview_every > 0 and bool(preview_callbacks) and any(preview_callbacks)
+
+    def on_step_end(pipe, step_index, timestep, callback_kwargs):
+        # The first interval also covers prompt encoding and latent preparation
+        elapsed = time.perf_counter() - on_step_end.last_step_end
+        if step_index == 0:
+            observe_stage("vton", "diffusion_setup_and_first_step", elapsed)
+        else:
+            observe_diffusion_step(profile, batch_size, elapsed)
+
+        total_steps = getattr(pipe, "num_timesteps", None) or NUM_INFERENCE_STEPS
+        step = step_index + 1
+        _report(progress_callback, "diffusion", step, total_steps)
+
+        # The last step is followed by the real VAE decode, no preview needed
+        if previews_enabled and step % preview_every == 0 and step < total_steps:
+            try:
+                for callback, preview in zip(preview_callbacks, latents_to_previews(callback_kwargs["latents"])):
+                    if callback is not None:
+                        callback(step, total_steps, preview)
+            except Exception as e:
+                print(f"Preview generation failed: {e}")
+        on_step_end.last_step_end = time.perf_counter()  # Preview time is not counted as a step
+        return callback_kwargs
+
+    on_step_end.last_step_end = time.perf_counter()
+    return on_step_end
 
 class VTONPipeline:
     _instance = None
@@ -15,103 +118,187 @@ class VTONPipeline:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(VTONPipeline, cls).__new__(cls)
-            cls._instance.pipeline = None
-            cls._instance.mask_session = None
-            cls._instance.densepose_estimator = None
-            cls._instance.device = "cuda" if torch.cuda.is_available() else "cpu"
+            # ONNX Runtime / OpenVINO backends run the diffusion components on CPU
+            use_cuda = torch.cuda.is_available() and settings.VTON_BACKEND == "torch"
+            cls._instance.device = "cuda" if use_cuda else "cpu"
+            cls._instance._cpu_backend = None
+            cls._instance._register_components()
         return cls._instance
 
-    def load_model(self):
-        if self.pipeline is None:
-            print(f"Loading VTON Pipeline on {self.device}...")
-            try:
-                # 1. Load Masking Model (Cloth Segmentation)
-                if self.mask_session is None:
-                    print("Loading Cloth Segmentation Model (u2net_cloth_seg)...")
-                    self.mask_session = new_session("u2net_cloth_seg")
-
-                # 2. Load DensePose Estimator
-                if self.densepose_estimator is None:
-                    try:
-                        self.densepose_estimator = DensePoseEstimator(device=self.device)
-                    except Exception as dp_error:
-                        print(f"[{dp_error}] DensePose disabled (Optional). Continuing with IP-Adapter only.")
-                        self.densepose_estimator = None
-
-                # 3. Load ControlNet (DensePose) & Inpainting Model
-                print("Loading ControlNet + Inpainting Model + IP-Adapter Plus...")
-                
-                from diffusers import ControlNetModel, StableDiffusionControlNetInpaintPipeline, AutoencoderKL
-                
-                # Load DensePose ControlNet
-                controlnet = ControlNetModel.from_pretrained(
-                    "MnLgt/densepose", 
-                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
-                ) # Do not move to device yet
-
-                model_id = "runwayml/stable-diffusion-inpainting"
-                
-                # Use stabilityai's MSE VAE (known to fix purple artifacts in fp16)
-                # Loading in fp16 to match pipeline and avoid "Input type mismatch" errors
-                vae = AutoencoderKL.from_pretrained(
-                    "stabilityai/sd-vae-ft-mse",
-                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
-                ) # Do not move to device yet
-
-                self.pipeline = StableDiffusionControlNetInpaintPipeline.from_pretrained(
-                    model_id,
-                    controlnet=controlnet,
-                    vae=vae, 
-                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                    variant="fp16" if self.device == "cuda" else None,
-                    safety_checker=None
-                )
-                
-                # Load IP-Adapter Plus
-                self.pipeline.load_ip_adapter("h94/IP-Adapter", subfolder="models", weight_name="ip-adapter-plus_sd15.bin")
-                self.pipeline.set_ip_adapter_scale(settings.VTON_IP_ADAPTER_SCALE)
-                
-                self.pipeline.scheduler = EulerDiscreteScheduler.from_config(self.pipeline.scheduler.config)
-                
-                # Enable VAE Tiling to prevent OOM
-                self.pipeline.enable_vae_tiling()
-
-                # Enable Model CPU Offloading (Crucial for 4GB VRAM)
-                # This moves models to CPU and only loads the active one to GPU
-                # MUST BE CALLED LAST to include all loaded adapters
-                self.pipeline.enable_model_cpu_offload()
-
-                print("VTON Pipeline Loaded (with ControlNet).")
-                
-            except Exception as e:
-                print(f"Failed to load VTON model: {e}")
-                raise e
+    def _register_components(self):
+        accelerator_pool = POOL_VRAM if self.device == "cuda" else POOL_RAM
+        model_registry.register("cloth_seg", self._load_mask_session, pool=accelerator_pool, sizer=_onnx_session_bytes)
+        model_registry.register("densepose", self._load_densepose, pool=accelerator_pool)
+        # CPU offloading keeps the diffusion weights in host RAM between steps
+        model_registry.register("inpaint_pipeline", self._load_inpaint_pipeline, pool=POOL_RAM)
+        # Only needed for garments whose IP-Adapter embeddings were not precomputed at ingestion
+        model_registry.register(
+            "ip_image_encoder", self._load_ip_image_encoder, pool=accelerator_pool,
+            sizer=lambda encoder: estimate_bytes(encoder["image_encoder"]),
+        )
 
-    def unload_model(self):
-        print("Unloading VTON Pipeline components to free memory...")
-        
-        if self.pipeline:
-            del self.pipeline
-            self.pipeline = None
+    # Components are resolved through the registry so they stay resident across tasks
+    @property
+    def mask_session(self):
+        return model_registry.get("cloth_seg")
+
+    @property
+    def densepose_estimator(self):
+        return model_registry.get("densepose")
+
+    @property
+    def pipeline(self):
+        return model_registry.get("inpaint_pipeline")
+
+    @property
+    def cpu_backend(self):
+        """
+        The configured ONNX Runtime / OpenVINO backend (None for plain torch).
+        Shared by the pipeline and the image encoder so exports are resolved once.
+        """
+        if self._cpu_backend is None and settings.VTON_BACKEND != "torch":
+            self._cpu_backend = cpu_backend_from_settings({
+                "base": "runwayml/stable-diffusion-inpainting",
+                "controlnet": "MnLgt/densepose",
+                "vae": "stabilityai/sd-vae-ft-mse",
+                "ip_adapter": "h94/IP-Adapter/ip-adapter-plus_sd15.bin",
+                "ip_adapter_scale": settings.VTON_IP_ADAPTER_SCALE,  # Baked into the exported UNet
+                "size": EXPORT_SIZE,
+            })
+        return self._cpu_backend
+
+    def _load_mask_session(self):
+        print("Loading Cloth Segmentation Model (u2net_cloth_seg)...")
+        return new_session("u2net_cloth_seg")
+
+    @property
+    def ip_image_encoder(self):
+        return model_registry.get("ip_image_encoder")
+
+    def _load_densepose(self):
+        estimator = DensePoseEstimator(device=self.device)
+        estimator.load_model()
+        return estimator
+
+    def _load_inpaint_pipeline(self):
+        print(f"Loading VTON Pipeline on {self.device}...")
+        try:
+            # Load ControlNet (DensePose) & Inpainting Model
+            print("Loading ControlNet + Inpainting Model + IP-Adapter Plus...")
+            
+            from diffusers import ControlNetModel, StableDiffusionControlNetInpaintPipeline, AutoencoderKL
             
-        if self.mask_session:
-            del self.mask_session
-            self.mask_session = None
+            # Load DensePose ControlNet
+            controlnet = ControlNetModel.from_pretrained(
+                "MnLgt/densepose", 
+                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
+            ) # Do not move to device yet
+
+            model_id = "runwayml/stable-diffusion-inpainting"
             
-        if self.densepose_estimator:
-            # DensePose estimator might have its own cleanup if needed, 
-            # but usually dropping the reference is enough if it holds the model
-            del self.densepose_estimator
-            self.densepose_estimator = None
+            # Use stabilityai's MSE VAE (known to fix purple artifacts in fp16)
+            # Loading in fp16 to match pipeline and avoid "Input type mismatch" errors
+            vae = AutoencoderKL.from_pretrained(
+                "stabilityai/sd-vae-ft-mse",
+                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
+            ) # Do not move to device yet
+
+            pipeline = StableDiffusionControlNetInpaintPipeline.from_pretrained(
+                model_id,
+                controlnet=controlnet,
+                vae=vae, 
+                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+                variant="fp16" if self.device == "cuda" else None,
+                safety_checker=None
+            )
             
-        # Clear CUDA cache
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            torch.cuda.ipc_collect()
+            # Load IP-Adapter Plus (projection + attention weights only).
+            # Garment images are encoded separately, so the CLIP image encoder is not kept in the pipeline.
+            pipeline.load_ip_adapter(
+                "h94/IP-Adapter", subfolder="models", weight_name="ip-adapter-plus_sd15.bin",
+                image_encoder_folder=None
+            )
+            pipeline.set_ip_adapter_scale(settings.VTON_IP_ADAPTER_SCALE)
             
-        # Force GC
-        gc.collect()
-        
+            pipeline.scheduler = EulerDiscreteScheduler.from_config(pipeline.scheduler.config)
+            # Profiles swap schedulers per request; keep one instance per type, built from the same config
+            pipeline._vton_schedulers = {"euler": pipeline.scheduler}
+
+            if self.cpu_backend is not None:
+                # Exported graphs replace the torch forward passes; no offloading or tiling on CPU
+                self.cpu_backend.attach(pipeline)
+                print("VTON Pipeline Loaded (with ControlNet, CPU backend).")
+                return pipeline
+            
+            # Enable VAE Tiling to prevent OOM
+            pipeline.enable_vae_tiling()
+
+            # Enable Model CPU Offloading (Crucial for 4GB VRAM)
+            # This moves models to CPU and only loads the active one to GPU
+            # MUST BE CALLED LAST to include all loaded adapters
+            pipeline.enable_model_cpu_offload()
+
+            print("VTON Pipeline Loaded (with ControlNet).")
+            return pipeline
+            
+        except Exception as e:
+            print(f"Failed to load VTON model: {e}")
+            raise e
+
+    def _load_ip_image_encoder(self):
+        print("Loading IP-Adapter image encoder...")
+        from transformers import CLIPVisionModelWithProjection, CLIPImageProcessor
+
+        image_encoder = CLIPVisionModelWithProjection.from_pretrained(
+            "h94/IP-Adapter",
+            subfolder="models/image_encoder",
+            torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
+        ).to(self.device)
+        image_encoder.eval()
+        if self.cpu_backend is not None:
+            self.cpu_backend.attach_image_encoder(image_encoder)
+        return {"image_encoder": image_encoder, "feature_extractor": CLIPImageProcessor()}
+
+    def apply_profile(self, pipeline, profile: InferenceProfile):
+        """
+        Switches the resident pipeline to the profile's scheduler and (un)loads LCM-LoRA.
+        Weights are only downloaded the first time a profile needs them.
+        """
+        schedulers = pipeline._vton_schedulers
+        if profile.scheduler not in schedulers:
+            import diffusers
+            scheduler_cls = getattr(diffusers, SCHEDULERS[profile.scheduler])
+            schedulers[profile.scheduler] = scheduler_cls.from_config(schedulers["euler"].config)
+        pipeline.scheduler = schedulers[profile.scheduler]
+
+        if getattr(pipeline, "_vton_cpu_backend", None) is not None:
+            # Compiled graphs cannot toggle adapters: each LoRA has its own exported UNet
+            pipeline._vton_cpu_backend.select_unet(pipeline, profile.lcm_lora)
+        elif profile.lcm_lora:
+            adapter_name = f"lcm_{profile.name}"
+            loaded = pipeline.get_list_adapters().get("unet", [])
+            if adapter_name not in loaded:
+                print(f"Loading LCM-LoRA ({profile.lcm_lora})...")
+                pipeline.load_lora_weights(profile.lcm_lora, adapter_name=adapter_name)
+            pipeline.enable_lora()
+            pipeline.set_adapters([adapter_name], adapter_weights=[1.0])
+        elif pipeline.get_list_adapters():
+            pipeline.disable_lora()
+
+    def load_model(self):
+        """
+        Warms every component. Components that are already resident are not reloaded.
+        """
+        self.mask_session
+        try:
+            self.densepose_estimator
+        except Exception as dp_error:
+            print(f"[{dp_error}] DensePose disabled (Optional). Continuing with IP-Adapter only.")
+        self.pipeline
+
+    def unload_model(self):
+        print("Unloading VTON Pipeline components to free memory...")
+        model_registry.evict_all()
         print("VTON Pipeline unloaded.")
 
     def preprocess_image(self, image_path):
@@ -120,59 +307,113 @@ class VTONPipeline:
     def generate_mask(self, image: Image.Image) -> Image.Image:
         """
         Generates a mask of the CLOTHING on the person.
+        Calls the segmentation session directly: `rembg.remove` would PNG-encode the input,
+        cut out and vertically stack one image per class, PNG-encode that and we would decode it again.
         """
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        img_bytes = img_byte_arr.getvalue()
+        # u2net_cloth_seg predicts one mask per class (Upper, Lower, Full), at the input size
+        masks = self.mask_session.predict(image)
 
-        output_bytes = remove(img_bytes, session=self.mask_session)
-        result_img = Image.open(io.BytesIO(output_bytes))
-        
-        mask = result_img.split()[-1] # A channel
-        
-        # u2net_cloth_seg often returns vertically stacked images (Upper, Lower, Full)
-        # If height is 3x width (or 3x intended height), split and merge.
-        if mask.height == image.height * 3:
-            print("Detected stacked cloth segmentation mask. Merging...")
-            from PIL import ImageChops
-            
-            w, h = image.size
-            top = mask.crop((0, 0, w, h))
-            middle = mask.crop((0, h, w, h*2))
-            bottom = mask.crop((0, h*2, w, h*3))
-            
-            # Combine all parts to mask ALL clothing
-            merged = ImageChops.lighter(top, middle)
-            merged = ImageChops.lighter(merged, bottom)
-            return merged
-            
-        return mask
+        # Combine all parts to mask ALL clothing (pixel-wise max, same as chaining ImageChops.lighter)
+        merged = np.maximum.reduce([np.asarray(mask.convert("L")) for mask in masks])
+        return Image.fromarray(merged, mode="L")
 
-    def run(self, person_image_path: str, garment_image_path: str):
-        self.load_model()
-        
-        person_img = self.preprocess_image(person_image_path)
-        garment_img = self.preprocess_image(garment_image_path)
+    def encode_garment(self, garment_img: Image.Image) -> Dict[str, torch.Tensor]:
+        """
+        Computes the IP-Adapter Plus conditioning for a garment: the penultimate CLIP
+        hidden states of the image and of an all-zero image (used for CFG).
+        """
+        encoder = self.ip_image_encoder
+        image_encoder = encoder["image_encoder"]
+        pixel_values = encoder["feature_extractor"](garment_img, return_tensors="pt").pixel_values
+        pixel_values = pixel_values.to(device=self.device, dtype=image_encoder.dtype)
+
+        with torch.no_grad():
+            image_embeds = image_encoder(pixel_values, output_hidden_states=True).hidden_states[-2]
+            negative_image_embeds = image_encoder(torch.zeros_like(pixel_values), output_hidden_states=True).hidden_states[-2]
+
+        return {
+            "image_embeds": image_embeds.to("cpu", dtype=torch.float16),
+            "negative_image_embeds": negative_image_embeds.to("cpu", dtype=torch.float16),
+        }
+
+    def save_garment_embeds(self, garment_image_path: str) -> str:
+        """
+        Encodes a processed garment image and persists its embeddings next to it.
+        """
+        embeds = self.encode_garment(self.preprocess_image(garment_image_path))
+        embeds_path = ip_embeds_path(garment_image_path)
+        tmp_path = f"{embeds_path}.tmp"
+        torch.save(embeds, tmp_path)
+        os.replace(tmp_path, embeds_path)
+        return embeds_path
+
+    def load_garment_embeds(self, garment_image_path: str) -> Dict[str, torch.Tensor]:
+        """
+        Loads the embeddings precomputed at ingestion, falling back to encoding
+        (and persisting) them for garments ingested before embeddings existed.
+        """
+        embeds_path = ip_embeds_path(garment_image_path)
+        if os.path.exists(embeds_path):
+            try:
+                return torch.load(embeds_path, map_location="cpu")
+            except Exception as e:
+                print(f"Failed to load garment embeddings {embeds_path}: {e}")
+
+        print("No precomputed garment embeddings, encoding garment...")
+        self.save_garment_embeds(garment_image_path)
+        return torch.load(embeds_path, map_location="cpu")
+
+    def prepare_inputs(self, person_image_path: str, garment_image_path: str,
+                       progress_callback: Optional[ProgressCallback] = None,
+                       densepose_img: Optional[Image.Image] = None):
+        """
+        Runs the person-side preprocessing (cloth mask + DensePose) and loads the garment conditioning.
+        `densepose_img` skips DensePose when it was already computed (e.g. batched by run_batch).
+        Returns (person_img, garment_embeds, mask_img, densepose_img).
+        """
+        # Components are fetched stage by stage so the registry can keep them warm
+        _report(progress_callback, "preprocess")
+        with timed("vton", "preprocess"):
+            person_img = self.preprocess_image(person_image_path)
+            garment_embeds = self.load_garment_embeds(garment_image_path)
         
+        save_debug = debug_artifacts.sample()
+
+        # Repeat try-ons with the same selfie skip both models
+        cache_key = preprocess_cache.key_for(person_img) if preprocess_cache.enabled else None
+
         # 1. Generate Cloth Mask
-        print("Generating cloth mask...")
-        mask_img = self.generate_mask(person_img)
-        
-        # DEBUG: Save mask
-        debug_mask_path = person_image_path.replace(".jpg", "_mask.png").replace(".png", "_mask.png").replace(".webp", "_mask.png")
-        mask_img.save(debug_mask_path)
+        mask_img = preprocess_cache.get(cache_key, "mask") if cache_key else None
+        if mask_img is None:
+            _report(progress_callback, "mask")
+            print("Generating cloth mask...")
+            with timed("vton", "mask"):
+                mask_img = self.generate_mask(person_img)
+            if cache_key:
+                preprocess_cache.put(cache_key, "mask", mask_img)
         
+        if save_debug:
+            debug_artifacts.save(mask_img, person_image_path, "_mask")
+
         # 2. Generate DensePose
-        densepose_img = None
-        if self.densepose_estimator:
+        if densepose_img is None and cache_key:
+            densepose_img = preprocess_cache.get(cache_key, DENSEPOSE_CACHE_KIND)
+        densepose_estimator = None
+        if densepose_img is None:
+            try:
+                densepose_estimator = self.densepose_estimator
+            except Exception as dp_error:
+                print(f"[{dp_error}] DensePose disabled (Optional). Continuing with IP-Adapter only.")
+
+        if densepose_estimator:
             try:
+                _report(progress_callback, "densepose")
                 print("Generating DensePose...")
-                densepose_img = self.densepose_estimator.run(person_img)
-                # Ensure it's the same size
-                densepose_img = densepose_img.resize(person_img.size)
-                
-                debug_pose_path = person_image_path.replace(".jpg", "_densepose.png").replace(".png", "_densepose.png").replace(".webp", "_densepose.png")
-                densepose_img.save(debug_pose_path)
+                # IUV map at the person image size (resampling would corrupt the part indices)
+                with timed("vton", "densepose"):
+                    densepose_img = densepose_estimator.run(person_img)
+                if cache_key:
+                    preprocess_cache.put(cache_key, DENSEPOSE_CACHE_KIND, densepose_img)
             except Exception as e:
                 print(f"DensePose generation failed: {e}")
         
@@ -180,42 +421,107 @@ class VTONPipeline:
              # Create black image if DensePose failed
              densepose_img = Image.new("RGB", person_img.size, (0, 0, 0))
 
-        # 3. Run Inference with ControlNet + IP-Adapter Plus
-        prompt = "model wearing this garment, best quality, photorealistic, accurate colors, good anatomy, high detail, high resolution"
-        negative_prompt = "low-resolution, bad anatomy, worst quality, low quality"
+        # Ensure DensePose is RGB if present
+        densepose_img = densepose_img.convert("RGB")
+        if save_debug:
+            debug_artifacts.save(densepose_img, person_image_path, "_densepose")
+
+        return person_img, garment_embeds, mask_img, densepose_img
 
+    def _batch_densepose(self, person_image_paths: List[str]) -> List[Optional[Image.Image]]:
+        """
+        DensePose for every person image not already in the preprocess cache, in one model call.
+        Returns one IUV image (or None, left to prepare_inputs) per path.
+        """
+        results: List[Optional[Image.Image]] = [None] * len(person_image_paths)
+        if len(person_image_paths) < 2:
+            return results
+        try:
+            pending = []
+            for index, path in enumerate(person_image_paths):
+                person_img = self.preprocess_image(path)
+                cache_key = preprocess_cache.key_for(person_img) if preprocess_cache.enabled else None
+                cached = preprocess_cache.get(cache_key, DENSEPOSE_CACHE_KIND) if cache_key else None
+                if cached is not None:
+                    results[index] = cached
+                else:
+                    pending.append((index, person_img, cache_key))
+
+            if pending:
+                print(f"Generating DensePose for {len(pending)} image(s) in one batch...")
+                with timed("vton", "densepose_batch"):
+                    images = self.densepose_estimator.run_batch([person_img for _, person_img, _ in pending])
+                for (index, _, cache_key), densepose_img in zip(pending, images):
+                    results[index] = densepose_img
+                    if cache_key:
+                        preprocess_cache.put(cache_key, DENSEPOSE_CACHE_KIND, densepose_img)
+        except Exception as e:
+            # Each job falls back to its own DensePose pass (or a black map)
+            print(f"Batched DensePose failed: {e}")
+        return results
+
+    def garment_image_embeds(self, pipeline, garment_embeds: List[Dict[str, torch.Tensor]], guidance_scale: float):
+        """
+        Stacks per-garment embeddings into the `ip_adapter_image_embeds` layout the
+        pipeline expects for a batch: (batch, num_images, seq, dim), negatives first under CFG.
+        """
+        dtype = pipeline.unet.dtype
+        positives = [e["image_embeds"].unsqueeze(1) for e in garment_embeds]
+        if guidance_scale > 1.0:
+            negatives = [e["negative_image_embeds"].unsqueeze(1) for e in garment_embeds]
+            stacked = torch.cat(negatives + positives)
+        else:
+            stacked = torch.cat(positives)
+        return [stacked.to(device=pipeline._execution_device, dtype=dtype)]  # Single IP-Adapter loaded
+
+    def run(self, person_image_path: str, garment_image_path: str,
+            progress_callback: Optional[ProgressCallback] = None,
+            preview_callback: Optional[PreviewCallback] = None,
+            profile: Optional[str] = None):
+        inference_profile = get_profile(profile)
+        person_img, garment_embeds, mask_img, densepose_img = self.prepare_inputs(
+            person_image_path, garment_image_path, progress_callback
+        )
+
+        # 3. Run Inference with ControlNet + IP-Adapter Plus
         generator = torch.Generator(device=self.device).manual_seed(42)
         
-        # Ensure DensePose is RGB if present
-        if densepose_img:
-            densepose_img = densepose_img.convert("RGB")
+        pipeline = self.pipeline
+        self.apply_profile(pipeline, inference_profile)
+        guidance_scale = inference_profile.effective_guidance_scale
 
         # Apply VAE full precision if configured (helps with color accuracy)
-        original_vae_dtype = self.pipeline.vae.dtype
+        original_vae_dtype = pipeline.vae.dtype
         if settings.VTON_VAE_FULL_PRECISION and self.device == "cuda":
-            self.pipeline.vae.to(dtype=torch.float32)
+            pipeline.vae.to(dtype=torch.float32)
             print("VAE set to float32 for color accuracy.")
 
-        result = self.pipeline(
-            prompt=prompt,
-            negative_prompt=negative_prompt,
+        step_callback = _diffusion_step_callback(progress_callback, [preview_callback], inference_profile.name)
+        result = pipeline(
+            prompt=PROMPT,
+            negative_prompt=NEGATIVE_PROMPT,
             image=person_img,
             mask_image=mask_img,
             control_image=densepose_img,  # Pass DensePose to ControlNet
-            ip_adapter_image=garment_img, # Pass Garment to IP-Adapter
+            ip_adapter_image_embeds=self.garment_image_embeds(pipeline, [garment_embeds], guidance_scale), # Pass Garment to IP-Adapter
             controlnet_conditioning_scale=settings.VTON_CONTROLNET_SCALE,
-            guidance_scale=settings.VTON_GUIDANCE_SCALE,
-            num_inference_steps=30,
+            guidance_scale=guidance_scale,
+            num_inference_steps=inference_profile.num_inference_steps,
             strength=settings.VTON_INFERENCE_STRENGTH, 
-            generator=generator
+            generator=generator,
+            callback_on_step_end=step_callback
         ).images[0]
+        # VAE decode (+ image post-processing) runs after the last step callback
+        observe_stage("vton", "vae_decode", time.perf_counter() - step_callback.last_step_end)
         
         # Restore VAE dtype
         if settings.VTON_VAE_FULL_PRECISION and self.device == "cuda":
-            self.pipeline.vae.to(dtype=original_vae_dtype)
+            pipeline.vae.to(dtype=original_vae_dtype)
         
-        output_path = person_image_path.replace(".jpg", "_tryon.png").replace(".png", "_tryon.png").replace(".webp", "_tryon.png")
-        result.save(output_path)
+        _report(progress_callback, "saving")
+        output_path = derived_path(person_image_path, "_tryon")
+        with timed("vton", "save"):
+            result.save(output_path)
         
         # Check config to unload
         if settings.UNLOAD_PIPELINE_AFTER_TASK:
@@ -223,4 +529,90 @@ class VTONPipeline:
         
         return output_path
 
+    def run_batch(self, jobs: List[Tuple[str, str, str]],
+                  progress_callbacks: Optional[List[Optional[ProgressCallback]]] = None,
+                  preview_callbacks: Optional[List[Optional[PreviewCallback]]] = None,
+                  profile: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Runs several try-ons through a single diffusion call.
+        `jobs` is a list of (person_image_path, garment_image_path, output_path);
+        `progress_callbacks` / `preview_callbacks` optionally hold one callback per job.
+        Every job in the batch runs with the same inference `profile`.
+        Returns one result dict per job, in order. A job whose preprocessing fails
+        is reported as failed without affecting the rest of the batch.
+        """
+        inference_profile = get_profile(profile)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(jobs)
+        callbacks = progress_callbacks or [None] * len(jobs)
+        previews = preview_callbacks or [None] * len(jobs)
+        densepose_imgs = self._batch_densepose([person_path for person_path, _, _ in jobs])
+        prepared = []
+        for index, (person_path, garment_path, output_path) in enumerate(jobs):
+            try:
+                prepared.append((index, output_path, self.prepare_inputs(
+                    person_path, garment_path, callbacks[index], densepose_img=densepose_imgs[index]
+                )))
+            except Exception as e:
+                results[index] = {"status": "failed", "error": str(e)}
+
+        if prepared:
+            print(f"Running batched try-on for {len(prepared)} request(s)...")
+            try:
+                person_imgs, garment_embeds, mask_imgs, densepose_imgs = (list(x) for x in zip(*(p[2] for p in prepared)))
+                pipeline = self.pipeline
+                self.apply_profile(pipeline, inference_profile)
+                guidance_scale = inference_profile.effective_guidance_scale
+
+                original_vae_dtype = pipeline.vae.dtype
+                if settings.VTON_VAE_FULL_PRECISION and self.device == "cuda":
+                    pipeline.vae.to(dtype=torch.float32)
+
+                # One generator per sample keeps each result identical to an unbatched run
+                generators = [torch.Generator(device=self.device).manual_seed(42) for _ in prepared]
+
+                # Every job in the batch advances together
+                batch_callbacks = [callbacks[index] for index, _, _ in prepared if callbacks[index]]
+                def batch_progress(stage, step, total_steps):
+                    for callback in batch_callbacks:
+                        _report(callback, stage, step, total_steps)
+
+                step_callback = _diffusion_step_callback(
+                    batch_progress if batch_callbacks else None,
+                    [previews[index] for index, _, _ in prepared],  # Aligned with the batch samples
+                    inference_profile.name, len(prepared)
+                )
+                images = pipeline(
+                    prompt=[PROMPT] * len(prepared),
+                    negative_prompt=[NEGATIVE_PROMPT] * len(prepared),
+                    image=person_imgs,
+                    mask_image=mask_imgs,
+                    control_image=densepose_imgs,
+                    ip_adapter_image_embeds=self.garment_image_embeds(pipeline, garment_embeds, guidance_scale),
+                    controlnet_conditioning_scale=settings.VTON_CONTROLNET_SCALE,
+                    guidance_scale=guidance_scale,
+                    num_inference_steps=inference_profile.num_inference_steps,
+                    strength=settings.VTON_INFERENCE_STRENGTH,
+                    generator=generators,
+                    callback_on_step_end=step_callback
+                ).images
+                observe_stage("vton", "vae_decode", time.perf_counter() - step_callback.last_step_end)
+
+                if settings.VTON_VAE_FULL_PRECISION and self.device == "cuda":
+                    pipeline.vae.to(dtype=original_vae_dtype)
+
+                for (index, output_path, _), image in zip(prepared, images):
+                    _report(callbacks[index], "saving")
+                    with timed("vton", "save"):
+                        image.save(output_path)
+                    results[index] = {"status": "completed", "result_path": output_path}
+            except Exception as e:
+                print(f"Batched try-on failed: {e}")
+                for index, _, _ in prepared:
+                    results[index] = {"status": "failed", "error": str(e)}
+
+        if settings.UNLOAD_PIPELINE_AFTER_TASK:
+            self.unload_model()
+
+        return results
+
 vton_pipeline = VTONPipeline()
@@ -1,2 +1,3 @@
 from app.db.base_class import Base
 from app.models.garment import Garment
+from app.models.ingestion_job import IngestionJob
@@ -1,6 +1,72 @@
+from contextlib import contextmanager
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+# Engines connect lazily, so each process only opens connections for the pools it uses:
+# the API uses `async_engine` (and `engine` for the remaining sync code), workers use `worker_engine`.
+
+
+def _pool_options(pool_size: int, max_overflow: int) -> dict:
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": True,
+        "query_cache_size": settings.DB_COMPILED_CACHE_SIZE,  # Compiled SQL statements per engine
+    }
+
+
+# --- API: sync (threadpool endpoints, startup migrations) ---
+engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URI,
+    **_pool_options(settings.DB_API_POOL_SIZE, settings.DB_API_MAX_OVERFLOW)
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# --- API: async (asyncpg) ---
+def async_database_uri(uri: str) -> str:
+    """
+    postgresql[+driver]://... -> postgresql+asyncpg://...
+    """
+    return make_url(uri).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+async_engine = create_async_engine(
+    async_database_uri(settings.SQLALCHEMY_DATABASE_URI),
+    # Server-side prepared statements, cached per connection (set 0 behind pgbouncer in transaction mode)
+    connect_args={"prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE},
+    **_pool_options(settings.DB_API_POOL_SIZE, settings.DB_API_MAX_OVERFLOW)
+)
+# pgvector values travel in text form (the SQLAlchemy Vector type converts both ways), so no asyncpg codec is needed
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# --- Workers: small bounded pool per process ---
+# Postgres connections stay at (replicas x processes) x (DB_WORKER_POOL_SIZE + DB_WORKER_MAX_OVERFLOW)
+worker_engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URI,
+    **_pool_options(settings.DB_WORKER_POOL_SIZE, settings.DB_WORKER_MAX_OVERFLOW)
+)
+WorkerSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=worker_engine)
+
+
+@contextmanager
+def worker_session():
+    """
+    Session from the worker pool for a short lookup or update inside a task.
+    Rolls back on error; the connection goes back to the pool on exit.
+    """
+    db = WorkerSessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -2,10 +2,11 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
+import os
 from app.api.v1.api import api_router
 from app.core.config import settings
 from app.core.celery_app import celery_app
-from app.db.session import engine
+from app.db.session import async_engine, engine
 from app.db.base import Base
 
 # Setup Logging
@@ -32,6 +33,14 @@ async def lifespan(app: FastAPI):
 
         Base.metadata.create_all(bind=engine)
         logger.info("Database tables created.")
+
+        # Migration: create indexes missing on existing tables (create_all only adds them with new tables)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                try:
+                    index.create(bind=engine, checkfirst=True)
+                except Exception as e:
+                    logger.warning(f"Migration warning (index {index.name}): {e}")
     except Exception as e:
         logger.error(f"Error creating database tables: {e}")
 
@@ -47,7 +56,12 @@ async def lifespan(app: FastAPI):
         logger.warning("Application will continue, but background tasks may fail.")
     
     yield
-    # Shutdown logic (if any)
+    # Shutdown: stop the embedding thread pool / micro-batcher, close pooled connections
+    from app.core.embeddings import embedding_service
+    from app.core.progress import progress_hub
+    embedding_service.shutdown()
+    await progress_hub.close()
+    await async_engine.dispose()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -56,8 +70,43 @@ app = FastAPI(
 )
 
 from fastapi.staticfiles import StaticFiles
-app.mount("/media", StaticFiles(directory="media"), name="media")
+from fastapi.responses import RedirectResponse
+from app.core.storage import storage
+
+if storage.name == "local":
+    app.mount("/media", StaticFiles(directory=os.path.join(settings.STORAGE_LOCAL_ROOT, "media")), name="media")
+else:
+    # Same URLs as the local mount: redirect to a presigned URL, the bytes never pass through the API
+    @app.get("/media/{path:path}", include_in_schema=False)
+    def media_redirect(path: str):
+        return RedirectResponse(storage.url(f"media/{path}"), status_code=307)
+
+
+# Request latency per route template (not raw path, to bound label cardinality)
+import time
+from fastapi import Request, Response
+from app.core import metrics
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        if settings.METRICS_ENABLED:
+            route = request.scope.get("route")
+            metrics.HTTP_REQUEST_SECONDS.labels(
+                request.method, getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - start)
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    metrics.record_memory_high_water()
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
 
 # Set all CORS enabled origins
 app.add_middleware(
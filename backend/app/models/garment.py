@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, func
+from sqlalchemy import Column, String, DateTime, Index, func
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from pgvector.sqlalchemy import Vector
 from app.db.base_class import Base
@@ -17,3 +17,28 @@ class Garment(Base):
     embedding = Column(Vector(384))
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # ANN index for semantic search (embeddings are normalized, so cosine distance)
+        Index(
+            "ix_garments_embedding_hnsw",
+            embedding,
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+        # Faceted filters (metadata_json @> '{"color": "red"}')
+        Index(
+            "ix_garments_metadata_gin",
+            metadata_json,
+            postgresql_using="gin",
+            postgresql_ops={"metadata_json": "jsonb_path_ops"},
+        ),
+        # Keyset pagination of the listing: ORDER BY created_at DESC, id DESC (scanned backwards)
+        Index(
+            "ix_garments_created_at_id",
+            created_at,
+            id,
+            postgresql_where=processed_image_path.isnot(None),
+        ),
+    )
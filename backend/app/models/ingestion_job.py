@@ -0,0 +1,29 @@
+import uuid
+from sqlalchemy import Column, String, Integer, Text, DateTime, func
+from sqlalchemy.dialects.postgresql import UUID
+from app.db.base_class import Base
+
+class IngestionJob(Base):
+    """
+    Progress of a bulk catalog import (archive or manifest of local paths).
+    Counters are updated atomically by the streaming task and the per-chunk chord callbacks.
+    """
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    source = Column(String, nullable=False)  # 'archive' | 'manifest'
+    source_path = Column(String, nullable=False)
+
+    # pending -> streaming -> processing -> completed | failed
+    status = Column(String, nullable=False, default="pending")
+    error = Column(Text, nullable=True)
+
+    total = Column(Integer, nullable=False, default=0)         # Entries read from the source
+    inserted = Column(Integer, nullable=False, default=0)      # Garment rows created
+    processed = Column(Integer, nullable=False, default=0)     # Background removal completed
+    failed = Column(Integer, nullable=False, default=0)        # Unreadable entries + failed processing
+    chunks_dispatched = Column(Integer, nullable=False, default=0)
+    chunks_completed = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
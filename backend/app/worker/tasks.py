@@ -1,55 +1,213 @@
 import os
-from celery import shared_task
-from rembg import remove
-from PIL import Image
-import io
+from celery import shared_task, current_app, chord
+from rembg import new_session
+from rembg.bg import alpha_matting_cutout, naive_cutout
+from PIL import Image, ImageFilter, ImageOps
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 import json
-from app.db.session import SessionLocal
+import shutil
+import tarfile
+import time
+import zipfile
+from app.core.derivatives import generate_derivatives
+from app.core.garment_cache import garment_cache
+from app.core.storage import storage
+from app.core.metrics import observe_stage, record_rembg_cutout, timed
+from app.db.session import worker_session
 from app.models.garment import Garment
-from uuid import UUID
+from app.models.ingestion_job import IngestionJob
+from uuid import UUID, uuid5
+
+# Half-width of the mask boundary band inspected for semi-transparent pixels
+REMBG_EDGE_BAND_PX = 2
+
+# Worker-level rembg sessions, one per model, created on first use and reused by every task
+_rembg_sessions = {}
+
+def get_rembg_session(model_name: str = None):
+    """
+    Returns the persistent rembg session for a model (REMBG_MODEL by default).
+    ONNX Runtime threading follows REMBG_INTRA_OP_THREADS / REMBG_INTER_OP_THREADS (0 = runtime default).
+    """
+    from app.core.config import settings
+    model_name = model_name or settings.REMBG_MODEL
+
+    session = _rembg_sessions.get(model_name)
+    if session is None:
+        import onnxruntime as ort
+        from rembg.sessions import sessions_class
+
+        sess_opts = ort.SessionOptions()
+        if settings.REMBG_INTRA_OP_THREADS > 0:
+            sess_opts.intra_op_num_threads = settings.REMBG_INTRA_OP_THREADS
+        if settings.REMBG_INTER_OP_THREADS > 0:
+            sess_opts.inter_op_num_threads = settings.REMBG_INTER_OP_THREADS
+            sess_opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+        session_class = next((sc for sc in sessions_class if sc.name() == model_name), None)
+        if session_class is None:
+            session = new_session(model_name)
+        else:
+            session = session_class(model_name, sess_opts)
+        _rembg_sessions[model_name] = session
+    return session
+
+# Square input size of each rembg model; masks come back LANCZOS-upscaled to the image size
+REMBG_MODEL_RESOLUTION = {"isnet-general-use": 1024, "isnet-anime": 1024, "birefnet-general": 1024, "birefnet-portrait": 1024}
+REMBG_DEFAULT_RESOLUTION = 320  # u2net, u2netp, u2net_cloth_seg, silueta
+
+def edge_uncertainty(mask: Image.Image, model_name: str = None) -> float:
+    """
+    Fraction of pixels along the mask boundary that are semi-transparent.
+    Clean studio cut-outs score near 0; hair, fur and sheer fabric score high.
+    Measured at the model's resolution: the upscaling interpolates every edge of the returned
+    mask into a soft ramp, which would make almost any garment look uncertain. There, a clean edge
+    has at most one transition pixel across the 2 * REMBG_EDGE_BAND_PX + 1 band (score <= 0.2).
+    """
+    from app.core.config import settings
+    resolution = REMBG_MODEL_RESOLUTION.get(model_name or settings.REMBG_MODEL, REMBG_DEFAULT_RESOLUTION)
+    if max(mask.size) > resolution:
+        # NEAREST samples the model's own predictions back out of the upscaled mask
+        mask = mask.resize((resolution, resolution), Image.Resampling.NEAREST)
+    band = REMBG_EDGE_BAND_PX * 2 + 1
+    # Morphological gradient: pixels that change between dilation and erosion form the boundary band
+    boundary = np.asarray(mask.filter(ImageFilter.MaxFilter(band))) != np.asarray(mask.filter(ImageFilter.MinFilter(band)))
+    if not boundary.any():
+        return 0.0
+    alpha = np.asarray(mask)[boundary]
+    uncertain = (alpha > 16) & (alpha < 240)
+    return float(uncertain.mean())
+
+def _remove_background(input_path: str, output_path: str) -> dict:
+    """
+    Background removal + resize, kept in PIL end-to-end (no encoded-bytes round trip).
+    Segmentation runs once; alpha matting only runs when the mask edge is uncertain.
+    Returns per-image timings and the matting decision.
+    """
+    from app.core.config import settings
+    timings = {}
+
+    start = time.perf_counter()
+    with Image.open(storage.local_path(input_path)) as source:
+        image = ImageOps.exif_transpose(source).convert("RGB")
+    timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mask = get_rembg_session().predict(image)[0]
+    timings["segmentation"] = time.perf_counter() - start
+
+    score = edge_uncertainty(mask)
+    use_matting = score >= settings.REMBG_MATTING_EDGE_THRESHOLD
+
+    start = time.perf_counter()
+    if use_matting:
+        # alpha_matting improves edges for hair/transparency but is slower.
+        try:
+            image = alpha_matting_cutout(image, mask, foreground_threshold=240, background_threshold=10, erode_structure_size=10)
+        except ValueError:
+            # Matting fails on masks without a clear foreground/background split
+            image = naive_cutout(image, mask)
+    else:
+        image = naive_cutout(image, mask)
+    image = image.convert("RGBA")
+    timings["cutout"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # Standardize size (Optional: Maintain aspect ratio or force fit)
+    # For now, we resize to fixed width of 768, maintaining aspect ratio
+    base_width = 768
+    w_percent = (base_width / float(image.size[0]))
+    h_size = int((float(image.size[1]) * float(w_percent)))
+    image = image.resize((base_width, h_size), Image.Resampling.LANCZOS)
+
+    # Save
+    image.save(storage.writable_path(output_path), "PNG")
+    storage.commit(output_path, "image/png")
+    timings["resize_save"] = time.perf_counter() - start
+
+    # Grid / preview renditions, written before the DB update makes the garment visible
+    start = time.perf_counter()
+    try:
+        generate_derivatives(output_path, image)
+    except Exception as e:
+        # Optional: listings fall back to the full image
+        print(f"Derivative generation failed for {output_path}: {e}")
+    timings["derivatives"] = time.perf_counter() - start
+
+    for stage, seconds in timings.items():
+        observe_stage("rembg", stage, seconds)
+    observe_stage("rembg", "matting" if use_matting else "naive_cutout", timings["cutout"])
+    # Skip ratio and score distribution, used to tune REMBG_MATTING_EDGE_THRESHOLD
+    record_rembg_cutout(use_matting, score)
+    print(
+        f"rembg {os.path.basename(input_path)}: edge_uncertainty={score:.3f} matting={use_matting} "
+        f"total={sum(timings.values()):.2f}s"
+    )
+
+    return {
+        "alpha_matting": use_matting,
+        "edge_uncertainty": round(score, 4),
+        "timings": {k: round(v, 4) for k, v in timings.items()},
+    }
+
+def _after_background_removed(processed: dict):
+    """
+    Records processed paths ({garment_id: output_path}) in one DB transaction and
+    queues IP-Adapter embedding precomputation for each garment.
+    """
+    if not processed:
+        return
+
+    with worker_session() as db:
+        with timed("db", "update_processed_paths"):
+            garments = db.query(Garment).filter(Garment.id.in_([UUID(g) for g in processed])).all()
+            for garment in garments:
+                garment.processed_image_path = processed[str(garment.id)]
+            db.commit()
+    garment_cache.invalidate(*processed)
+
+    # Precompute IP-Adapter conditioning on the GPU worker (sent by name to avoid importing torch here)
+    for garment_id, output_path in processed.items():
+        current_app.send_task("app.worker.tasks.compute_garment_embeds_task", args=[output_path, garment_id])
 
 @shared_task(name="app.worker.tasks.remove_background_task")
 def remove_background_task(input_path: str, output_path: str, garment_id: str):
     """
     Reads an image from input_path, removes background, removes any alpha matting artifacts,
     resizes to standard VTON size (768x1024), and saves to output_path.
-    Updates the Garment record in DB.
+    Updates the Garment record in DB and queues IP-Adapter embedding precomputation.
     """
     try:
-        # Load image
-        with open(input_path, "rb") as input_file:
-            input_data = input_file.read()
+        stats = _remove_background(input_path, output_path)
+        _after_background_removed({garment_id: output_path})
+        return {"status": "completed", "output_path": output_path, **stats}
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
 
-        # Remove background
-        # alpha_matting=True improves edges for hair/transparency but is slower.
-        output_data = remove(input_data, alpha_matting=True)
-        
-        # Post-process with PIL
-        image = Image.open(io.BytesIO(output_data)).convert("RGBA")
-        
-        # Standardize size (Optional: Maintain aspect ratio or force fit)
-        # For now, we resize to fixed width of 768, maintaining aspect ratio
-        base_width = 768
-        w_percent = (base_width / float(image.size[0]))
-        h_size = int((float(image.size[1]) * float(w_percent)))
-        image = image.resize((base_width, h_size), Image.Resampling.LANCZOS)
-
-        # Save
-        image.save(output_path, "PNG")
-        
-        # Update DB
-        db = SessionLocal()
+@shared_task(name="app.worker.tasks.remove_background_batch_task")
+def remove_background_batch_task(items: list):
+    """
+    Batch variant of remove_background_task for bulk ingestion.
+    `items` is a list of [input_path, output_path, garment_id]. All images share the
+    worker's rembg session and the DB is updated once for the whole batch.
+    Returns one result dict per item, in order.
+    """
+    results = []
+    processed = {}
+    for input_path, output_path, garment_id in items:
         try:
-            garment = db.query(Garment).filter(Garment.id == UUID(garment_id)).first()
-            if garment:
-                garment.processed_image_path = output_path
-                db.commit()
-        finally:
-            db.close()
-            
-        return {"status": "completed", "output_path": output_path}
+            stats = _remove_background(input_path, output_path)
+            processed[garment_id] = output_path
+            results.append({"status": "completed", "output_path": output_path, **stats})
+        except Exception as e:
+            results.append({"status": "failed", "error": str(e)})
+
+    try:
+        _after_background_removed(processed)
     except Exception as e:
-        return {"status": "failed", "error": str(e)}
+        return [{"status": "failed", "error": str(e)} for _ in items]
+    return results
 
 @shared_task(name="app.worker.tasks.extract_metadata_task")
 def extract_metadata_task(image_path: str, garment_id: str):
@@ -69,7 +227,7 @@ def extract_metadata_task(image_path: str, garment_id: str):
         model = genai.GenerativeModel('gemini-2.5-flash-lite')
 
         # Load image
-        img = Image.open(image_path)
+        img = Image.open(storage.local_path(image_path))
 
         prompt = """
         Analyze this garment image and return a JSON object with the following fields:
@@ -83,7 +241,8 @@ def extract_metadata_task(image_path: str, garment_id: str):
         Return ONLY the JSON.
         """
         
-        response = model.generate_content([prompt, img])
+        with timed("metadata", "gemini_generate"):
+            response = model.generate_content([prompt, img])
         # simple cleanup in case it returns markdown blocks
         text = response.text.replace("```json", "").replace("```", "").strip()
         
@@ -94,22 +253,297 @@ def extract_metadata_task(image_path: str, garment_id: str):
             metadata_obj = {"raw_text": text, "error": "Invalid JSON"}
 
         # Update DB
-        db = SessionLocal()
+        with worker_session() as db:
+            with timed("db", "update_metadata"):
+                garment = db.query(Garment).filter(Garment.id == UUID(garment_id)).first()
+                if garment:
+                    # Merge with existing metadata (Manual inputs take precedence)
+                    existing_meta = garment.metadata_json or {}
+                    # Start with VLM data
+                    merged_meta = metadata_obj.copy()
+                    # Overwrite with existing manual data (so user input is respected)
+                    merged_meta.update(existing_meta)
+
+                    garment.metadata_json = merged_meta
+                    db.commit()
+        garment_cache.invalidate(garment_id)
+
+        return {"status": "completed", "metadata": text}
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
+
+RAW_DIR = "media/raw"
+PROCESSED_DIR = "media/processed"
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
+
+def _is_image(filename: str) -> bool:
+    return filename.rsplit(".", 1)[-1].lower() in IMAGE_EXTENSIONS and not os.path.basename(filename).startswith(".")
+
+def _iter_archive(path: str, start: int = 0):
+    """
+    Yields (filename, file object, metadata) for each image in a zip archive, from the `start`-th image on.
+    Entries are read one at a time; the archive is never extracted as a whole.
+    Tarballs are converted by `_spool_archive` first, so a resumed import seeks straight to its offset.
+    """
+    with zipfile.ZipFile(path) as archive:
+        images = [info for info in archive.infolist() if not info.is_dir() and _is_image(info.filename)]
+        for info in images[start:]:
+            with archive.open(info) as entry:
+                yield os.path.basename(info.filename), entry, {}
+
+def _spool_archive(job_id: UUID, source_path: str) -> str:
+    """
+    Rewrites a tar(.gz) upload once as an uncompressed zip of its images and points the job at it.
+    A compressed tar stream can only be read from the start: without this, every resumed chunk
+    would decompress everything already imported. Returns the key of the (zip) source.
+    """
+    local_source = storage.local_path(source_path)
+    if zipfile.is_zipfile(local_source):
+        return source_path
+
+    key = f"{source_path}.zip"
+    path = storage.writable_path(key)
+    tmp_path = f"{path}.tmp"
+    # Stream mode: sequential reads, works for compressed tarballs of any size
+    with tarfile.open(local_source, mode="r|*") as archive, zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED, allowZip64=True) as spooled:
+        for member in archive:
+            if not member.isfile() or not _is_image(member.name):
+                continue
+            # Images are already compressed: store them as is
+            with archive.extractfile(member) as entry, spooled.open(member.name, "w", force_zip64=True) as out:
+                shutil.copyfileobj(entry, out, 1024 * 1024)
+    os.replace(tmp_path, path)
+    storage.commit(key, "application/zip")
+
+    with worker_session() as db:
+        db.query(IngestionJob).filter(IngestionJob.id == job_id).update(
+            {IngestionJob.source_path: key}, synchronize_session=False
+        )
+        db.commit()
+    storage.delete(source_path)
+    return key
+
+def _iter_manifest(path: str, start: int = 0):
+    """
+    Yields (filename, file object, metadata) for each manifest line, from the `start`-th entry on.
+    A line is either a bare path or a JSON object {"path": ..., "category": ..., "color": ..., "description": ...}.
+    Paths must live under BULK_INGEST_ALLOWED_ROOT; invalid entries yield a None file object.
+    """
+    from app.core.config import settings
+    allowed_root = os.path.realpath(settings.BULK_INGEST_ALLOWED_ROOT)
+
+    index = 0
+    with open(path, "r", encoding="utf-8") as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line:
+                continue
+            index += 1
+            if index <= start:
+                continue
+            try:
+                entry = json.loads(line) if line.startswith("{") else {"path": line}
+                source = os.path.realpath(entry.pop("path"))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                yield line, None, {}
+                continue
+
+            if os.path.commonpath([allowed_root, source]) != allowed_root or not _is_image(source):
+                yield source, None, {}
+                continue
+            try:
+                with open(source, "rb") as entry_file:
+                    yield os.path.basename(source), entry_file, entry
+            except OSError:
+                yield source, None, {}
+
+def _update_job_counters(job_id: UUID, **increments):
+    """
+    Atomic `col = col + n` updates so concurrent chord callbacks never lose counts.
+    """
+    with worker_session() as db:
+        values = {getattr(IngestionJob, name): getattr(IngestionJob, name) + amount for name, amount in increments.items()}
+        db.query(IngestionJob).filter(IngestionJob.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+
+def _finalize_job_if_done(job_id: UUID):
+    with worker_session() as db:
+        db.query(IngestionJob).filter(
+            IngestionJob.id == job_id,
+            IngestionJob.status == "processing",
+            IngestionJob.chunks_completed == IngestionJob.chunks_dispatched,
+        ).update({IngestionJob.status: "completed"}, synchronize_session=False)
+        db.commit()
+
+def _set_job_status(job_id: UUID, status: str, error: str = None):
+    with worker_session() as db:
+        db.query(IngestionJob).filter(IngestionJob.id == job_id).update(
+            {IngestionJob.status: status, IngestionJob.error: error}, synchronize_session=False
+        )
+        db.commit()
+
+def _has_capacity(job_id: UUID) -> bool:
+    """
+    Backpressure: bound the number of chunks queued on the workers at once.
+    """
+    from app.core.config import settings
+    with worker_session() as db:
+        job = db.query(IngestionJob.chunks_dispatched, IngestionJob.chunks_completed).filter(IngestionJob.id == job_id).one()
+    return job.chunks_dispatched - job.chunks_completed < settings.BULK_INGEST_MAX_INFLIGHT_CHUNKS
+
+def _defer_ingest(job_id: str, offset: int):
+    """
+    Re-enqueues the rest of the import from entry `offset` instead of blocking a worker slot,
+    so the chunks it waits on can run on the same worker.
+    """
+    from app.core.config import settings
+    bulk_ingest_task.apply_async(args=(job_id, offset), countdown=settings.BULK_INGEST_DEFER_SECONDS)
+    return {"status": "deferred", "job_id": job_id, "offset": offset}
+
+def _flush_chunk(job_id: UUID, chunk):
+    """
+    Batch-encodes embeddings, batch-inserts the Garment rows and fans out processing as a chord.
+    Garment ids are derived from the job and entry index, so a redelivered task inserts (and
+    dispatches) only the rows a previous attempt did not commit.
+    """
+    from app.core.config import settings
+    from app.core.embeddings import embedding_service
+
+    texts = [
+        f"{meta.get('color') or ''} {meta.get('category') or ''} {meta.get('description') or ''}".strip()
+        for _, _, meta in chunk
+    ]
+    embeddings = embedding_service.generate_embeddings(texts)
+
+    rows = [
+        {
+            "id": garment_id,
+            "filename": filename,
+            "raw_image_path": raw_path,
+            "metadata_json": meta,
+            "embedding": embedding,
+        }
+        for (garment_id, (filename, raw_path), meta), embedding in zip(chunk, embeddings)
+    ]
+    with worker_session() as db:
+        inserted_ids = set(db.execute(
+            pg_insert(Garment).values(rows).on_conflict_do_nothing(index_elements=[Garment.id]).returning(Garment.id)
+        ).scalars())
+        rows = [row for row in rows if row["id"] in inserted_ids]
+        if rows:
+            # Same transaction: a chunk is counted exactly when its rows exist
+            db.query(IngestionJob).filter(IngestionJob.id == job_id).update(
+                {
+                    IngestionJob.inserted: IngestionJob.inserted + len(rows),
+                    IngestionJob.chunks_dispatched: IngestionJob.chunks_dispatched + 1,
+                },
+                synchronize_session=False,
+            )
+        db.commit()
+    if not rows:
+        return
+
+    items = [
+        [
+            row["raw_image_path"],
+            os.path.join(PROCESSED_DIR, f"{row['id']}_clean.png").replace("\\", "/"),
+            str(row["id"]),
+        ]
+        for row in rows
+    ]
+    batch_size = max(1, settings.REMBG_BATCH_SIZE)
+    header = [
+        remove_background_batch_task.s(items[i:i + batch_size])
+        for i in range(0, len(items), batch_size)
+    ]
+    # Metadata extraction (Gemini) is part of the chord, so it counts toward BULK_INGEST_MAX_INFLIGHT_CHUNKS
+    metadata = [extract_metadata_task.s(row["raw_image_path"], str(row["id"])) for row in rows]
+    chord(header + metadata)(bulk_ingest_chunk_done_task.s(str(job_id), len(header)))
+
+@shared_task(name="app.worker.tasks.bulk_ingest_task")
+def bulk_ingest_task(job_id: str, offset: int = 0):
+    """
+    Streams a bulk import (zip/tar archive or manifest of local paths) into the catalog, from entry `offset` on.
+    Entries are streamed to media storage (media/raw) one at a time, grouped into chunks of BULK_INGEST_BATCH_SIZE,
+    and each chunk is inserted and dispatched for processing. While BULK_INGEST_MAX_INFLIGHT_CHUNKS chunks are
+    still processing, the task re-enqueues itself from the next entry and returns.
+    Progress is tracked on the IngestionJob row.
+    """
+    from app.core.config import settings
+
+    job_uuid = UUID(job_id)
+    with worker_session() as db:
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_uuid).first()
+        if not job:
+            return {"status": "failed", "error": "Job not found"}
+        source, source_path = job.source, job.source_path
+
+    try:
+        if not _has_capacity(job_uuid):
+            return _defer_ingest(job_id, offset)
+
+        _set_job_status(job_uuid, "streaming")
+        if source == "archive":
+            source_path = _spool_archive(job_uuid, source_path)
+        local_source = storage.local_path(source_path)
+        iter_entries = _iter_archive if source == "archive" else _iter_manifest
+        entries = iter_entries(local_source, start=offset)
+
+        chunk = []
+        total = unreadable = 0
         try:
-            garment = db.query(Garment).filter(Garment.id == UUID(garment_id)).first()
-            if garment:
-                # Merge with existing metadata (Manual inputs take precedence)
-                existing_meta = garment.metadata_json or {}
-                # Start with VLM data
-                merged_meta = metadata_obj.copy()
-                # Overwrite with existing manual data (so user input is respected)
-                merged_meta.update(existing_meta)
-                
-                garment.metadata_json = merged_meta
-                db.commit()
+            for filename, entry_file, metadata in entries:
+                offset += 1
+                total += 1
+                if entry_file is None:
+                    unreadable += 1
+                    continue
+
+                # Stable per entry: a redelivered task overwrites the same raw file and row
+                garment_id = uuid5(job_uuid, str(offset))
+                extension = filename.rsplit(".", 1)[-1].lower()
+                raw_path = os.path.join(RAW_DIR, f"{garment_id}.{extension}").replace("\\", "/")
+                storage.save_stream(raw_path, entry_file)
+
+                # Same manual metadata keys as single uploads
+                meta = {key: metadata[key] for key in ("category", "color", "description") if metadata.get(key)}
+                chunk.append((garment_id, (filename, raw_path), meta))
+
+                if len(chunk) >= settings.BULK_INGEST_BATCH_SIZE:
+                    _update_job_counters(job_uuid, total=total, failed=unreadable)
+                    total = unreadable = 0
+                    _flush_chunk(job_uuid, chunk)
+                    chunk = []
+                    if not _has_capacity(job_uuid):
+                        return _defer_ingest(job_id, offset)
         finally:
-            db.close()
+            entries.close()
 
-        return {"status": "completed", "metadata": text}
+        _update_job_counters(job_uuid, total=total, failed=unreadable)
+        if chunk:
+            _flush_chunk(job_uuid, chunk)
+
+        _set_job_status(job_uuid, "processing")
+        _finalize_job_if_done(job_uuid)
+
+        storage.delete(source_path)
+        return {"status": "completed", "job_id": job_id}
     except Exception as e:
+        _set_job_status(job_uuid, "failed", str(e))
         return {"status": "failed", "error": str(e)}
+
+@shared_task(name="app.worker.tasks.bulk_ingest_chunk_done_task")
+def bulk_ingest_chunk_done_task(results, job_id: str, rembg_batches: int = None):
+    """
+    Chord callback: records the outcome of one chunk of background removals.
+    The first `rembg_batches` results come from remove_background_batch_task (a list of per-item
+    results each); the rest are the chunk's metadata extractions, which do not affect the counts.
+    """
+    job_uuid = UUID(job_id)
+    if rembg_batches is not None:
+        results = results[:rembg_batches]
+    results = [r for batch in results for r in (batch if isinstance(batch, list) else [batch])]
+    completed = sum(1 for r in results if isinstance(r, dict) and r.get("status") == "completed")
+    _update_job_counters(job_uuid, processed=completed, failed=len(results) - completed, chunks_completed=1)
+    _finalize_job_if_done(job_uuid)
+    return {"status": "completed", "processed": completed}
@@ -1,38 +1,207 @@
 from celery import shared_task
-from app.core.vton_pipeline import vton_pipeline
-from app.db.session import SessionLocal
-from app.models.garment import Garment
-from uuid import UUID
+from celery_batches import Batches
+from app.core.config import settings
+from app.core.vton_pipeline import ip_embeds_path, vton_pipeline
+from app.core.progress import publish_progress
+from app.core.tryon_cache import tryon_cache
+from app.core.garment_cache import garment_cache
+from app.core.derivatives import generate_derivatives
+from app.core.metrics import timed
+from app.core.storage import storage
 import shutil
 import os
 
-@shared_task(name="app.worker.tasks.virtual_tryon_task")
-def virtual_tryon_task(person_image_path: str, garment_id: str, output_path: str):
+def _progress_publisher(task_id: str):
+    """
+    Pipeline progress callback that forwards stage/step events to the task's progress channel.
+    """
+    def publish(stage: str, step: int, total_steps: int):
+        publish_progress(task_id, "running", stage=stage, step=step, total_steps=total_steps)
+    return publish
+
+PREVIEW_DIR = "media/previews"
+
+def _preview_path(task_id: str) -> str:
+    return os.path.join(PREVIEW_DIR, f"{task_id}_preview.jpg").replace("\\", "/")
+
+def _discard_preview(task_id: str):
+    """
+    Previews are only useful while the task runs: the terminal event carries the result.
+    """
+    if settings.VTON_PREVIEW_EVERY_N_STEPS <= 0:
+        return
+    try:
+        storage.delete(_preview_path(task_id))
+    except Exception as e:
+        print(f"Failed to delete preview of {task_id}: {e}")
+
+def _preview_publisher(task_id: str):
+    """
+    Pipeline preview callback: writes the approximate decode as a small JPEG
+    (overwritten each time) and announces it on the task's progress channel.
+    """
+    def publish(step: int, total_steps: int, image):
+        preview_path = _preview_path(task_id)
+        local_path = storage.writable_path(preview_path)
+        tmp_path = f"{local_path}.tmp"
+        image.save(tmp_path, "JPEG", quality=70)
+        os.replace(tmp_path, local_path)  # Clients never fetch a half-written file
+        storage.commit(preview_path, "image/jpeg")
+        publish_progress(task_id, "running", stage="diffusion", step=step, total_steps=total_steps, preview=preview_path)
+    return publish
+
+def _garment_local_path(garment_path: str) -> str:
+    """
+    Local copy of a processed garment and its precomputed IP-Adapter embeddings, if any
+    (hot garments stay in the storage cache between try-ons).
+    """
+    local_path = storage.local_path(garment_path)
+    storage.local_path(ip_embeds_path(garment_path), required=False)
+    return local_path
+
+def _store_result(result: dict, output_path: str) -> dict:
+    """
+    Uploads a completed result written at storage.writable_path(output_path) and reports it by key.
+    """
+    if result.get("status") == "completed":
+        storage.commit(output_path, "image/png")
+        result["result_path"] = output_path
+    return result
+
+def _with_derivatives(result: dict) -> dict:
+    """
+    Adds WebP/AVIF renditions of a completed result (`derivatives`: {rendition: {format: path}}).
+    A failure here never fails the try-on itself.
+    """
+    if result.get("status") != "completed":
+        return result
+    try:
+        with timed("vton", "derivatives"):
+            result["derivatives"] = generate_derivatives(result["result_path"])
+    except Exception as e:
+        print(f"Derivative generation failed for {result['result_path']}: {e}")
+    return result
+
+def _publish_result(task_id: str, result: dict, cache_key: str = None):
+    _discard_preview(task_id)
+    tryon_cache.complete(cache_key, result)
+    publish_progress(task_id, result.get("status", "failed"), result=result)
+    return result
+
+@shared_task(bind=True, name="app.worker.tasks.virtual_tryon_task")
+def virtual_tryon_task(self, person_image_path: str, garment_id: str, output_path: str,
+                       cache_key: str = None, profile: str = None):
     """
     Performs Virtual Try-On.
-    1. Fetches garment processed path from DB.
+    1. Fetches garment processed path (garment cache, DB on a miss).
     2. Runs VTON pipeline.
     3. Saves result.
+    Progress is published to GET /tryon/stream/{task_id} subscribers.
+    `cache_key` (set by the API) records the result for deduplication.
+    `profile` selects the inference profile (None = VTON_INFERENCE_PROFILE).
     """
+    task_id = self.request.id
+    publish_progress(task_id, "started")
     try:
-        db = SessionLocal()
-        garment = db.query(Garment).filter(Garment.id == UUID(garment_id)).first()
-        db.close()
+        garment = garment_cache.get(garment_id)
 
-        if not garment or not garment.processed_image_path:
-            return {"status": "failed", "error": "Garment not found or not processed"}
+        if not garment or not garment["processed_image_path"]:
+            return _publish_result(task_id, {"status": "failed", "error": "Garment not found or not processed"}, cache_key)
 
-        garment_path = garment.processed_image_path.replace("\\", "/")
+        garment_path = garment["processed_image_path"].replace("\\", "/")
         
-        # Run Pipeline
+        # Run Pipeline on local copies of the stored inputs
         # In a real scenario, this returns a PIL Image or saves to path.
         # Our current skeleton returns the path it saved to.
-        result_path = vton_pipeline.run(person_image_path, garment_path)
+        result_path = vton_pipeline.run(
+            storage.local_path(person_image_path), _garment_local_path(garment_path),
+            progress_callback=_progress_publisher(task_id),
+            preview_callback=_preview_publisher(task_id),
+            profile=profile
+        )
         
         # Ensure result is moved/saved to final output_path if pipeline didn't do it
-        if result_path != output_path and os.path.exists(result_path):
-             shutil.move(result_path, output_path)
+        local_output = storage.writable_path(output_path)
+        if result_path != local_output and os.path.exists(result_path):
+             shutil.move(result_path, local_output)
 
-        return {"status": "completed", "result_path": output_path}
+        result = _store_result({"status": "completed"}, output_path)
+        return _publish_result(task_id, _with_derivatives(result), cache_key)
+    except Exception as e:
+        return _publish_result(task_id, {"status": "failed", "error": str(e)}, cache_key)
+
+@shared_task(name="app.worker.tasks.compute_garment_embeds_task")
+def compute_garment_embeds_task(processed_image_path: str, garment_id: str):
+    """
+    Precomputes the IP-Adapter image embeddings for a processed garment,
+    so try-ons load them instead of re-encoding the garment on every request.
+    Queued by remove_background_task once the processed image exists.
+    """
+    try:
+        vton_pipeline.save_garment_embeds(storage.local_path(processed_image_path))
+        embeds_path = ip_embeds_path(processed_image_path)
+        storage.commit(embeds_path, "application/octet-stream")
+        return {"status": "completed", "garment_id": garment_id, "embeds_path": embeds_path}
     except Exception as e:
         return {"status": "failed", "error": str(e)}
+
+@shared_task(
+    name="app.worker.tasks.virtual_tryon_batch_task",
+    base=Batches,
+    flush_every=settings.VTON_BATCH_SIZE,
+    flush_interval=settings.VTON_BATCH_WINDOW_SECONDS,
+)
+def virtual_tryon_batch_task(requests):
+    """
+    Batched Virtual Try-On.
+    Receives every request queued within the batch window (up to VTON_BATCH_SIZE),
+    runs them through one diffusion call per inference profile and stores each result
+    under its own task id, so clients poll /tryon/status exactly as for virtual_tryon_task.
+    """
+    results = {}
+    jobs = []
+    pending = []
+    for request in requests:
+        publish_progress(request.id, "started")
+    try:
+        garments = garment_cache.get_many(request.args[1] for request in requests)
+        garment_paths = {g["id"]: g["processed_image_path"] for g in garments.values() if g["processed_image_path"]}
+
+        for request in requests:
+            person_image_path, garment_id, output_path = request.args
+            garment_path = garment_paths.get(garment_id)
+            if not garment_path:
+                results[request.id] = {"status": "failed", "error": "Garment not found or not processed"}
+                continue
+            try:
+                jobs.append((
+                    storage.local_path(person_image_path),
+                    _garment_local_path(garment_path.replace("\\", "/")),
+                    storage.writable_path(output_path),
+                ))
+            except FileNotFoundError as e:
+                results[request.id] = {"status": "failed", "error": f"Input not found in storage: {e}"}
+                continue
+            pending.append(request)
+
+        # A diffusion call runs a single scheduler / step count, so batch per profile
+        by_profile = {}
+        for request, job in zip(pending, jobs):
+            by_profile.setdefault(request.kwargs.get("profile"), []).append((request, job))
+
+        for profile, group in by_profile.items():
+            group_requests = [request for request, _ in group]
+            callbacks = [_progress_publisher(request.id) for request in group_requests]
+            previews = [_preview_publisher(request.id) for request in group_requests]
+            batch_results = vton_pipeline.run_batch(
+                [job for _, job in group], progress_callbacks=callbacks, preview_callbacks=previews, profile=profile
+            )
+            for request, result in zip(group_requests, batch_results):
+                results[request.id] = _with_derivatives(_store_result(result, request.args[2]))
+    except Exception as e:
+        for request in requests:
+            results.setdefault(request.id, {"status": "failed", "error": str(e)})
+
+    for request in requests:
+        virtual_tryon_batch_task.backend.mark_as_done(request.id, results[request.id], request=request)
+        _publish_result(request.id, results[request.id], request.kwargs.get("cache_key"))
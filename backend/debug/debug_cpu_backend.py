@@ -0,0 +1,164 @@
+"""
+Parity check for the ONNX Runtime / OpenVINO backend (app/core/cpu_backend.py).
+Builds tiny random-weight UNet (with an IP-Adapter Plus projection) / ControlNet / VAE /
+CLIP image encoder (no downloads), exports them through CPUBackend and compares the
+runtime outputs with torch.
+
+    python debug/debug_cpu_backend.py --backend onnxruntime
+    python debug/debug_cpu_backend.py --backend openvino --quantization int8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import types
+
+import torch
+
+sys.path.append(os.getcwd())
+from app.core.cpu_backend import CPUBackend
+
+# Small image so exports take seconds: 64x48 pixels, VAE factor 2 -> 32x24 latents
+EXPORT_SIZE = (64, 48)
+LATENT_SCALE = 2
+# IP-Adapter Plus input: penultimate CLIP hidden states, as in CPUBackend._export_unet
+IMAGE_EMBED_TOKENS = 257
+
+
+def build_models():
+    from diffusers import AutoencoderKL, ControlNetModel, UNet2DConditionModel
+    from transformers import CLIPVisionConfig, CLIPVisionModelWithProjection
+
+    torch.manual_seed(0)
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64), layers_per_block=2, sample_size=32, in_channels=9, out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"), cross_attention_dim=32,
+    ).eval()
+    controlnet = ControlNetModel(
+        block_out_channels=(32, 64), layers_per_block=2, in_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"), cross_attention_dim=32,
+        conditioning_embedding_out_channels=(16, 32),
+    ).eval()
+    vae = AutoencoderKL(
+        block_out_channels=(32, 64), in_channels=3, out_channels=3, latent_channels=4,
+        down_block_types=("DownEncoderBlock2D", "DownEncoderBlock2D"),
+        up_block_types=("UpDecoderBlock2D", "UpDecoderBlock2D"),
+    ).eval()
+    image_encoder = CLIPVisionModelWithProjection(CLIPVisionConfig(
+        hidden_size=32, intermediate_size=37, num_attention_heads=4, num_hidden_layers=3,
+        image_size=32, patch_size=4, projection_dim=32,
+    )).eval()
+    attach_ip_adapter_plus(unet, image_encoder.config.hidden_size)
+    return unet, controlnet, vae, image_encoder
+
+
+def attach_ip_adapter_plus(unet, embed_dim: int, num_queries: int = 4):
+    """
+    What pipeline.load_ip_adapter does for ip-adapter-plus_sd15, with random weights:
+    a resampler projection on encoder_hid_proj and IP-Adapter processors on the cross-attentions.
+    """
+    from diffusers.models.attention_processor import AttnProcessor2_0, IPAdapterAttnProcessor2_0
+    from diffusers.models.embeddings import IPAdapterPlusImageProjection, MultiIPAdapterImageProjection
+
+    cross_attention_dim = unet.config.cross_attention_dim
+    block_out_channels = unet.config.block_out_channels
+    processors = {}
+    for name in unet.attn_processors:
+        if name.endswith("attn1.processor"):
+            processors[name] = AttnProcessor2_0()
+            continue
+        if name.startswith("mid_block"):
+            hidden_size = block_out_channels[-1]
+        elif name.startswith("up_blocks"):
+            hidden_size = list(reversed(block_out_channels))[int(name[len("up_blocks.")])]
+        else:
+            hidden_size = block_out_channels[int(name[len("down_blocks.")])]
+        processors[name] = IPAdapterAttnProcessor2_0(
+            hidden_size=hidden_size, cross_attention_dim=cross_attention_dim, num_tokens=(num_queries,), scale=0.8,
+        )
+    unet.set_attn_processor(processors)
+
+    projection = IPAdapterPlusImageProjection(
+        embed_dims=embed_dim, output_dims=cross_attention_dim, hidden_dims=32, depth=1,
+        dim_head=8, heads=4, num_queries=num_queries, ffn_ratio=2,
+    )
+    unet.encoder_hid_proj = MultiIPAdapterImageProjection([projection])
+    unet.register_to_config(encoder_hid_dim_type="ip_image_proj")
+    unet.eval()
+
+
+def report(name, reference, candidate, tolerance):
+    diff = (reference - candidate).abs().max().item()
+    scale = reference.abs().max().item() or 1.0
+    ok = diff / scale <= tolerance
+    print(f"{name:<16} max abs diff {diff:.2e} (relative {diff / scale:.2e}) {'OK' if ok else 'MISMATCH'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", default="onnxruntime", choices=["onnxruntime", "openvino"])
+    parser.add_argument("--quantization", default="none", choices=["none", "int8", "bf16"])
+    args = parser.parse_args()
+    # Quantized weights / bf16 math are approximate by design
+    tolerance = 1e-3 if args.quantization == "none" else 5e-2
+
+    unet, controlnet, vae, image_encoder = build_models()
+    export_dir = tempfile.mkdtemp(prefix="vton_cpu_export_")
+    backend = CPUBackend(args.backend, args.quantization, signature={"debug": True},
+                         export_dir=export_dir, export_size=EXPORT_SIZE)
+    backend.latent_scale = LATENT_SCALE
+
+    height, width = EXPORT_SIZE
+    batch = 2
+    latents = torch.randn(batch, 4, height // LATENT_SCALE, width // LATENT_SCALE)
+    unet_input = torch.cat([latents, torch.randn(batch, 5, *latents.shape[2:])], dim=1)
+    timestep = torch.tensor(500)
+    text = torch.randn(batch, 77, 32)
+    added_cond_kwargs = {"image_embeds": [torch.randn(batch, 1, IMAGE_EMBED_TOKENS, image_encoder.config.hidden_size)]}
+    control = torch.rand(batch, 3, height, width)
+    image = torch.rand(batch, 3, height, width) * 2 - 1
+    pixels = torch.rand(1, 3, 32, 32)
+
+    # Torch references (class forwards, taken before the runtimes are attached)
+    with torch.no_grad():
+        ref_down, ref_mid = type(controlnet).forward(
+            controlnet, latents, timestep, text, controlnet_cond=control, conditioning_scale=0.8, return_dict=False
+        )
+        ref_unet = type(unet).forward(
+            unet, unet_input, timestep, text, down_block_additional_residuals=list(ref_down),
+            mid_block_additional_residual=ref_mid, added_cond_kwargs=added_cond_kwargs, return_dict=False,
+        )[0]
+        ref_moments = vae.quant_conv(vae.encoder(image))
+        ref_decoded = vae.decode(ref_moments[:, :4]).sample
+        ref_hidden = type(image_encoder).forward(image_encoder, pixels, output_hidden_states=True).hidden_states[-2]
+
+    backend._attach_controlnet(controlnet, unet)
+    backend._attach_vae(vae)
+    backend.select_unet(types.SimpleNamespace(unet=unet, controlnet=controlnet))
+    backend.attach_image_encoder(image_encoder)
+
+    with torch.no_grad():
+        down, mid = controlnet(latents, timestep, text, controlnet_cond=control, conditioning_scale=0.8, return_dict=False)
+        out = unet(unet_input, timestep, text, down_block_additional_residuals=list(ref_down),
+                   mid_block_additional_residual=ref_mid, added_cond_kwargs=added_cond_kwargs, return_dict=False)[0]
+        moments = vae.encode(image).latent_dist.parameters
+        decoded = vae.decode(ref_moments[:, :4]).sample
+        hidden = image_encoder(pixels, output_hidden_states=True).hidden_states[-2]
+
+    results = [
+        report("controlnet.mid", ref_mid, mid, tolerance),
+        *[report(f"controlnet.down{i}", r, c, tolerance) for i, (r, c) in enumerate(zip(ref_down, down))],
+        report("unet", ref_unet, out, tolerance),
+        report("vae.encode", ref_moments, moments, tolerance),
+        report("vae.decode", ref_decoded, decoded, tolerance),
+        report("image_encoder", ref_hidden, hidden, tolerance),
+    ]
+    print(f"Exports in {export_dir}")
+    print("PARITY OK" if all(results) else "PARITY FAILED")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
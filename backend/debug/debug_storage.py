@@ -0,0 +1,116 @@
+"""
+Round-trip check for the media storage backends (app/core/storage.py).
+Runs the same sequence the API and workers use (streamed upload, exists, presigned URL,
+worker local_path / writable_path + commit, cache eviction, delete) against:
+
+    python debug/debug_storage.py --backend local
+    python debug/debug_storage.py --backend s3 --moto        # in-process S3 stand-in (pip install moto)
+    python debug/debug_storage.py --backend s3 --endpoint-url http://localhost:9000 \\
+        --access-key minioadmin --secret-key minioadmin   # local MinIO
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import urllib.request
+
+sys.path.append(os.getcwd())
+from app.core.storage import LocalStorage, S3Storage
+
+BUCKET = "vton-debug"
+
+
+def check(name: str, ok: bool) -> bool:
+    print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def run_checks(storage, fetch_urls: bool) -> bool:
+    # Larger than one multipart part so S3 uploads are split
+    payload = os.urandom(12 * 1024 * 1024 + 123)
+    key = "media/raw/debug_storage.bin"
+    results = []
+
+    storage.save_stream(key, io.BytesIO(payload), "application/octet-stream")
+    results.append(check("exists after streamed upload", storage.exists(key)))
+
+    local = storage.local_path(key)
+    with open(local, "rb") as f:
+        results.append(check("local_path content", hashlib.sha256(f.read()).digest() == hashlib.sha256(payload).digest()))
+    results.append(check("local_path is cached", storage.local_path(key) == local))
+
+    derived = "media/processed/debug_storage_clean.png"
+    with open(storage.writable_path(derived), "wb") as f:
+        f.write(b"processed")
+    storage.commit(derived)
+    results.append(check("commit of a worker-written file", storage.exists(derived)))
+
+    url = storage.url(key)
+    results.append(check(f"url ({url[:60]}...)", bool(url)))
+    if fetch_urls and url.startswith("http"):
+        with urllib.request.urlopen(url) as response:
+            results.append(check("presigned URL download", response.read() == payload))
+
+    results.append(check("missing key, required=False", storage.local_path("media/raw/missing.bin", required=False) is None))
+    try:
+        storage.local_path("media/raw/missing.bin")
+        results.append(check("missing key raises FileNotFoundError", False))
+    except FileNotFoundError:
+        results.append(check("missing key raises FileNotFoundError", True))
+
+    if isinstance(storage, S3Storage):
+        # Budget below two objects: reading the first again must evict the second's copy
+        storage.cache.max_bytes = len(payload) + 1
+        storage.cache.discard(key)
+        storage.local_path(key)
+        results.append(check("cache evicts beyond its budget", storage.cache.counters["evictions"] > 0))
+
+    for k in (key, derived):
+        storage.delete(k)
+    results.append(check("delete", not storage.exists(key) and not storage.exists(derived)))
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["local", "s3"], default="local")
+    parser.add_argument("--moto", action="store_true", help="Use moto's in-process S3")
+    parser.add_argument("--endpoint-url", help="S3-compatible endpoint, e.g. MinIO")
+    parser.add_argument("--access-key")
+    parser.add_argument("--secret-key")
+    parser.add_argument("--region", default="us-east-1")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="vton_storage_")
+    if args.backend == "local":
+        ok = run_checks(LocalStorage(workdir), fetch_urls=False)
+    else:
+        mock = contextlib.nullcontext()
+        if args.moto:
+            from moto import mock_aws
+            os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+            os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+            mock = mock_aws()
+        with mock:
+            storage = S3Storage(
+                BUCKET, prefix="debug", endpoint_url=args.endpoint_url, region=args.region,
+                access_key_id=args.access_key, secret_access_key=args.secret_key,
+                cache_dir=os.path.join(workdir, "cache"),
+            )
+            try:
+                storage._client.create_bucket(Bucket=BUCKET)
+            except storage._client.exceptions.BucketAlreadyOwnedByYou:
+                pass
+            # moto intercepts boto3 only, so presigned URLs are fetched against real endpoints only
+            ok = run_checks(storage, fetch_urls=not args.moto)
+
+    print(f"Files in {workdir}")
+    print("STORAGE OK" if ok else "STORAGE FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
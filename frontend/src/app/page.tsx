@@ -4,23 +4,27 @@ import { useState, useEffect } from "react";
 import GarmentSelector from "@/components/GarmentSelector";
 import GarmentUploader from "@/components/GarmentUploader";
 import MagicMirror from "@/components/MagicMirror";
-import { Garment } from "@/types";
+import { Garment, GarmentPage } from "@/types";
 import { Shirt } from "lucide-react";
 
 export default function Home() {
   const [garments, setGarments] = useState<Garment[]>([]);
   const [selectedGarmentId, setSelectedGarmentId] = useState<string | null>(null);
   const [searchQuery, setSearchQuery] = useState("");
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
 
-  const fetchGarments = async (query = "") => {
+  // Pages are keyset based: pass the previous page's cursor to append the next one
+  const fetchGarments = async (query = "", cursor: string | null = null) => {
     try {
-      const url = query
-        ? `http://localhost:8000/api/v1/ingestion/garments?query=${encodeURIComponent(query)}`
-        : "http://localhost:8000/api/v1/ingestion/garments";
+      const params = new URLSearchParams();
+      if (query) params.set("query", query);
+      if (cursor) params.set("cursor", cursor);
+      const url = `http://localhost:8000/api/v1/ingestion/garments?${params.toString()}`;
 
       const res = await fetch(url);
-      const data = await res.json();
-      setGarments(data);
+      const data: GarmentPage = await res.json();
+      setGarments((prev) => (cursor ? [...prev, ...data.items] : data.items));
+      setNextCursor(data.next_cursor);
     } catch (err) {
       console.error("Failed to fetch garments", err);
     }
@@ -72,6 +76,14 @@ export default function Home() {
               selectedId={selectedGarmentId}
               onSelect={(id) => setSelectedGarmentId(id)}
             />
+            {nextCursor && (
+              <button
+                onClick={() => fetchGarments(searchQuery, nextCursor)}
+                className="w-full py-2 text-sm text-neutral-400 bg-neutral-900 rounded-xl hover:text-white transition-colors"
+              >
+                Load more
+              </button>
+            )}
           </div>
         </div>
 
@@ -28,7 +28,13 @@ export default function GarmentSelector({ garments, selectedId, onSelect }: Prop
               I should do that. For now, let's assume standard path structure.
           */}
                     <img
-                        src={`http://localhost:8000/${g.image}`}
+                        src={`http://localhost:8000/${g.derivatives?.thumb?.webp ?? g.image}`}
+                        onError={(e) => {
+                            // Garments processed before derivatives existed only have the full PNG
+                            const full = `http://localhost:8000/${g.image}`;
+                            if (e.currentTarget.src !== full) e.currentTarget.src = full;
+                        }}
+                        loading="lazy"
                         alt="Garment"
                         className="w-full h-full object-cover bg-neutral-800"
                     />
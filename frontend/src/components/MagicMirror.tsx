@@ -11,6 +11,7 @@ export default function MagicMirror({ selectedGarmentId }: Props) {
     const [personImage, setPersonImage] = useState<File | null>(null);
     const [previewUrl, setPreviewUrl] = useState<string | null>(null);
     const [resultUrl, setResultUrl] = useState<string | null>(null);
+    const [stepPreviewUrl, setStepPreviewUrl] = useState<string | null>(null);
     const [loading, setLoading] = useState(false);
     const [status, setStatus] = useState("");
 
@@ -20,6 +21,7 @@ export default function MagicMirror({ selectedGarmentId }: Props) {
             setPersonImage(file);
             setPreviewUrl(URL.createObjectURL(file));
             setResultUrl(null); // Reset result
+            setStepPreviewUrl(null);
         }
     };
 
@@ -40,7 +42,12 @@ export default function MagicMirror({ selectedGarmentId }: Props) {
             });
             const data = await res.json();
 
-            if (data.task_id) {
+            if (data.status === "completed") {
+                // Identical try-on already rendered: the server returns the existing result
+                setLoading(false);
+                setStatus("Complete!");
+                setResultUrl(`http://localhost:8000/${data.result_path}`);
+            } else if (data.task_id) {
                 pollStatus(data.task_id);
             }
         } catch (error) {
@@ -51,29 +58,45 @@ export default function MagicMirror({ selectedGarmentId }: Props) {
     };
 
     const pollStatus = (taskId: string) => {
-        const interval = setInterval(async () => {
-            try {
-                const res = await fetch(`http://localhost:8000/api/v1/tryon/status/${taskId}`);
-                const data = await res.json();
-
-                if (data.status === "SUCCESS") {
-                    clearInterval(interval);
-                    setLoading(false);
-                    setStatus("Complete!");
-                    // result_path is relative like "media/results/..."
-                    setResultUrl(`http://localhost:8000/${data.result.result_path.replace("\\", "/")}`);
-                } else if (data.status === "FAILURE") {
-                    clearInterval(interval);
-                    setLoading(false);
-                    setStatus("Failed: " + data.result);
-                } else {
-                    setStatus(`Processing... (${data.status})`);
+        // Server-Sent Events: one connection, progress pushed by the worker
+        const source = new EventSource(`http://localhost:8000/api/v1/tryon/stream/${taskId}`);
+
+        source.onmessage = (message) => {
+            const data = JSON.parse(message.data);
+
+            if (data.status === "completed") {
+                source.close();
+                setLoading(false);
+                setStatus("Complete!");
+                // result_path is relative like "media/results/..."
+                setResultUrl(`http://localhost:8000/${data.result.result_path.replace("\\", "/")}`);
+            } else if (data.status === "failed") {
+                source.close();
+                setLoading(false);
+                setStatus("Failed: " + (data.result?.error ?? "Unknown error"));
+            } else if (data.status === "timeout") {
+                source.close();
+                setLoading(false);
+                setStatus("No progress received. Please try again.");
+            } else if (data.stage === "diffusion" && data.total_steps) {
+                setStatus(`Generating... (${data.step}/${data.total_steps})`);
+                if (data.preview) {
+                    // Same file is overwritten each time; the step busts the browser cache
+                    setStepPreviewUrl(`http://localhost:8000/${data.preview}?step=${data.step}`);
                 }
-            } catch (err) {
-                clearInterval(interval);
+            } else if (data.stage) {
+                setStatus(`Processing... (${data.stage})`);
+            } else {
+                setStatus(`Processing... (${data.status})`);
+            }
+        };
+
+        source.onerror = () => {
+            // EventSource reconnects on its own; give up only once the stream is closed
+            if (source.readyState === EventSource.CLOSED) {
                 setLoading(false);
             }
-        }, 2000);
+        };
     };
 
     return (
@@ -81,6 +104,8 @@ export default function MagicMirror({ selectedGarmentId }: Props) {
             <div className="flex-1 relative bg-black/50 flex items-center justify-center p-4">
                 {resultUrl ? (
                     <img src={resultUrl} alt="Result" className="max-h-full max-w-full object-contain rounded-lg shadow-2xl" />
+                ) : stepPreviewUrl ? (
+                    <img src={stepPreviewUrl} alt="Generating" className="max-h-full max-w-full object-contain rounded-lg opacity-80 transition-all" />
                 ) : previewUrl ? (
                     <img src={previewUrl} alt="Preview" className="max-h-full max-w-full object-contain opacity-50 blur-sm scale-95 transition-all" />
                 ) : (
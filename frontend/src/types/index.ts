@@ -1,6 +1,8 @@
 export interface Garment {
     id: string;
     image: string;
+    // rendition ("thumb" | "medium") -> format ("webp" | "avif") -> path
+    derivatives?: Record<string, Record<string, string>>;
     metadata?: {
         category?: string;
         color?: string;
@@ -9,6 +11,11 @@ export interface Garment {
     };
 }
 
+export interface GarmentPage {
+    items: Garment[];
+    next_cursor: string | null;
+}
+
 export interface TryOnResult {
     task_id: string;
     status: string;